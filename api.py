@@ -1,19 +1,345 @@
-from typing import Optional
-from fastapi import FastAPI, HTTPException, Header, status
-from fastapi.staticfiles import StaticFiles
-from myrenault.client import MyRenaultClient
-import aiohttp
+import os
+import json
+import time
+from datetime import datetime, timezone
+from contextlib import asynccontextmanager
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from typing import Annotated, Optional
+from fastapi import (Depends, FastAPI, HTTPException, Header, Query,
+                     Request, Response, WebSocket, WebSocketDisconnect,
+                     status)
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from myrenault.client import MyRenaultClient, READ_KINDS, describe_error
+from myrenault.pool import SessionPool, credentials_key
+from myrenault.singleflight import SingleFlight
+from myrenault.cache import ResponseCache
+from myrenault.fingerprints import FingerprintStore, http_date, not_modified
+from myrenault.vin_index import VinIndex
+from myrenault.poller import TelemetryPoller
+from myrenault.history import HistoryStore, FIELDS as HISTORY_FIELDS
+from myrenault.telemetry import Reading, SampleStore
+from myrenault.analytics import ChargingAnalytics
+from myrenault.geofence import GeofenceEngine, Circle, Polygon
+from myrenault.governor import UpstreamGovernor, UpstreamBusyError
+from myrenault.breaker import CircuitBreaker
+from myrenault.jobs import JobQueue
+from myrenault.publisher import (
+    EventPublisher, MQTTDestination, WebhookDestination)
+from myrenault.charging import ChargeScheduler, ScheduleStore, parse_window
+from myrenault.tokens import TokenStore
+from myrenault.secretbox import SecretBox
+from myrenault.warmup import SessionWarmer
+from myrenault.state import open_state
+from myrenault.logs import LogPipeline, RequestIdMiddleware
+from myrenault.serialization import FastJSONResponse, dumps, serializer
+from myrenault.compression import CompressionMiddleware, available_encodings
+from myrenault.assets import StaticAssets
+from myrenault.lazy import lazy_import, load as load_deferred
+from myrenault import metrics
 import asyncio
 from renault_api.exceptions import RenaultException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
-app = FastAPI()
-
-# Mount static files to serve the frontend
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Imported on first use (see myrenault.lazy)
+aiohttp = lazy_import("aiohttp")
 
 # Configuration
 DEFAULT_TIMEOUT = 30  # seconds
+CONNECTOR_LIMIT = int(os.environ.get("RENAULT_CONNECTOR_LIMIT", "100"))
+SESSION_POOL_SIZE = int(os.environ.get("RENAULT_SESSION_POOL_SIZE", "128"))
+SESSION_IDLE_TTL = int(os.environ.get("RENAULT_SESSION_IDLE_TTL", "1800"))
+SESSION_MAX_AGE = int(os.environ.get("RENAULT_SESSION_MAX_AGE", "43200"))
+UPSTREAM_PER_ACCOUNT = int(os.environ.get("RENAULT_UPSTREAM_PER_ACCOUNT", "4"))
+UPSTREAM_GLOBAL_LIMIT = int(
+    os.environ.get("RENAULT_UPSTREAM_GLOBAL_LIMIT", "32"))
+UPSTREAM_RATE = float(os.environ.get("RENAULT_UPSTREAM_RATE", "2"))
+UPSTREAM_BURST = int(os.environ.get("RENAULT_UPSTREAM_BURST", "10"))
+UPSTREAM_MAX_WAIT = float(os.environ.get("RENAULT_UPSTREAM_MAX_WAIT", "10"))
+BREAKER_WINDOW = int(os.environ.get("RENAULT_BREAKER_WINDOW", "60"))
+BREAKER_MIN_CALLS = int(os.environ.get("RENAULT_BREAKER_MIN_CALLS", "10"))
+BREAKER_ERROR_RATE = float(
+    os.environ.get("RENAULT_BREAKER_ERROR_RATE", "0.5"))
+BREAKER_OPEN_SECONDS = int(
+    os.environ.get("RENAULT_BREAKER_OPEN_SECONDS", "30"))
+UPSTREAM_MIN_TIMEOUT = float(
+    os.environ.get("RENAULT_UPSTREAM_MIN_TIMEOUT", "5"))
+FLEET_CONCURRENCY = int(os.environ.get("RENAULT_FLEET_CONCURRENCY", "8"))
+FLEET_MAX_CONCURRENCY = 32
+STALE_MAX_AGE = int(os.environ.get("RENAULT_STALE_MAX_AGE", "86400"))
+JOB_WORKERS = int(os.environ.get("RENAULT_JOB_WORKERS", "4"))
+JOB_TTL = int(os.environ.get("RENAULT_JOB_TTL", "3600"))
+MAX_JOB_WAIT = 60  # seconds
+VIN_INDEX_PATH = os.environ.get("RENAULT_VIN_INDEX_PATH")
+SESSION_TOKEN_TTL = int(os.environ.get("RENAULT_SESSION_TOKEN_TTL", "3600"))
+STATE_URL = os.environ.get("RENAULT_STATE_URL")
+# Encrypts the passwords written to the shared state and schedule stores
+SECRET_KEY = os.environ.get("RENAULT_SECRET_KEY")
+WARMUP_INTERVAL = int(os.environ.get("RENAULT_WARMUP_INTERVAL", "30"))
+WARMUP_MARGIN = int(os.environ.get("RENAULT_WARMUP_MARGIN", "120"))
+WARMUP_CONCURRENCY = int(os.environ.get("RENAULT_WARMUP_CONCURRENCY", "4"))
+STREAM_MIN_INTERVAL = int(os.environ.get("RENAULT_STREAM_MIN_INTERVAL", "30"))
+STREAM_FAST_INTERVAL = int(
+    os.environ.get("RENAULT_STREAM_FAST_INTERVAL", "60"))
+STREAM_MAX_INTERVAL = int(os.environ.get("RENAULT_STREAM_MAX_INTERVAL", "900"))
+STREAM_KEEPALIVE = 15  # seconds
+HISTORY_PATH = os.environ.get("RENAULT_HISTORY_PATH")
+HISTORY_RETENTION_DAYS = int(
+    os.environ.get("RENAULT_HISTORY_RETENTION_DAYS", "0"))
+LOG_LEVEL = os.environ.get("RENAULT_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("RENAULT_LOG_FORMAT", "json")
+LOG_SAMPLE_BURST = int(os.environ.get("RENAULT_LOG_SAMPLE_BURST", "20"))
+RECENT_SAMPLES = int(os.environ.get("RENAULT_RECENT_SAMPLES", "256"))
+COMPRESSION = os.environ.get("RENAULT_COMPRESSION", "br,gzip")
+GEOFENCES_PATH = os.environ.get("RENAULT_GEOFENCES_PATH")
+WEBHOOK_URLS = os.environ.get("RENAULT_WEBHOOK_URLS", "")
+WEBHOOK_SECRET = os.environ.get("RENAULT_WEBHOOK_SECRET")
+MQTT_URL = os.environ.get("RENAULT_MQTT_URL")
+MQTT_PREFIX = os.environ.get("RENAULT_MQTT_PREFIX", "renault")
+MQTT_DISCOVERY = os.environ.get("RENAULT_MQTT_DISCOVERY", "homeassistant")
+PUBLISH_QUEUE_SIZE = int(os.environ.get("RENAULT_PUBLISH_QUEUE_SIZE", "1000"))
+PUBLISH_SPILL_DIR = os.environ.get("RENAULT_PUBLISH_SPILL_DIR")
+STATIC_DIR = os.environ.get("RENAULT_STATIC_DIR", "static")
+# Leave the heavy imports and the HTTP session to the first upstream call
+FAST_START = int(os.environ.get("RENAULT_FAST_START", "0"))
+SCHEDULES_PATH = os.environ.get("RENAULT_SCHEDULES_PATH")
+CHARGE_BATCH_SIZE = int(os.environ.get("RENAULT_CHARGE_BATCH_SIZE", "20"))
+CHARGE_BATCH_INTERVAL = float(
+    os.environ.get("RENAULT_CHARGE_BATCH_INTERVAL", "1"))
+CACHE_MAX_ENTRIES = int(os.environ.get("RENAULT_CACHE_MAX_ENTRIES", "4096"))
+CACHE_TTLS = {
+    kind: int(os.environ[f"RENAULT_CACHE_TTL_{kind.upper()}"])
+    for kind in ("battery", "cockpit", "location", "vehicles")
+    if f"RENAULT_CACHE_TTL_{kind.upper()}" in os.environ
+}
+
+# Process-wide logging, formatted and written by a background thread
+# ("off" leaves the logging configuration to the server, e.g. uvicorn)
+log_pipeline = (
+    LogPipeline(level=LOG_LEVEL, fmt=LOG_FORMAT, sample_burst=LOG_SAMPLE_BURST)
+    if LOG_FORMAT != "off" else None
+)
+
+# Logins, VIN mappings, readings and rate limits shared with the other
+# workers and replicas (disabled if no URL)
+state = open_state(STATE_URL) if STATE_URL else None
+
+# Passwords are only ever stored encrypted with the server's secret key
+secret_box = SecretBox(SECRET_KEY) if SECRET_KEY else None
+
+# Logged-in Renault clients shared by every request of this process
+session_pool = SessionPool(
+    max_size=SESSION_POOL_SIZE,
+    idle_ttl=SESSION_IDLE_TTL,
+    max_age=SESSION_MAX_AGE
+)
+
+# Bearer tokens issued by POST /api/v1/session
+tokens = TokenStore(ttl=SESSION_TOKEN_TTL, state=state, box=secret_box)
+
+# Identical upstream reads in flight at the same time share one call
+inflight = SingleFlight()
+
+# Recent readings per account, VIN and kind
+response_cache = ResponseCache(ttls=CACHE_TTLS, max_entries=CACHE_MAX_ENTRIES)
+
+# ETag and Last-Modified of the readings served, for conditional requests
+fingerprints = FingerprintStore(max_entries=CACHE_MAX_ENTRIES)
+
+# Concurrency and rate limits of calls to Renault, per account and overall
+governor = UpstreamGovernor(
+    per_account=UPSTREAM_PER_ACCOUNT,
+    global_limit=UPSTREAM_GLOBAL_LIMIT,
+    rate=UPSTREAM_RATE,
+    burst=UPSTREAM_BURST,
+    max_wait=UPSTREAM_MAX_WAIT,
+    state=state
+)
+
+# Fails fast (or serves stale readings) while Renault is failing, and
+# times out each operation according to its usual latency
+breaker = CircuitBreaker(
+    window=BREAKER_WINDOW,
+    min_calls=BREAKER_MIN_CALLS,
+    error_rate=BREAKER_ERROR_RATE,
+    open_seconds=BREAKER_OPEN_SECONDS,
+    min_timeout=UPSTREAM_MIN_TIMEOUT,
+    max_timeout=DEFAULT_TIMEOUT
+)
+
+# Which account holds each VIN, optionally persisted across restarts
+vin_index = VinIndex(path=VIN_INDEX_PATH)
+
+# Telemetry samples kept for the history endpoint (disabled if no path)
+history = (
+    HistoryStore(HISTORY_PATH, retention_days=HISTORY_RETENTION_DAYS)
+    if HISTORY_PATH else None
+)
+
+# Last samples of each vehicle kept in memory, served by the history
+# endpoint when there is no history database
+samples = SampleStore(capacity=RECENT_SAMPLES) if RECENT_SAMPLES else None
+
+# Charging sessions and energy use computed from the stored samples,
+# updated with the new ones on each request
+analytics = (
+    ChargingAnalytics(history if history is not None else samples)
+    if history is not None or samples is not None else None
+)
+
+# Geofences of each account, checked against every location reading, and
+# the enter/exit events and trips of the vehicles
+geofences = GeofenceEngine(path=GEOFENCES_PATH)
+
+# Frontend files, compressed once and served from memory
+assets = StaticAssets(STATIC_DIR, encodings=available_encodings(COMPRESSION))
+
+# Reading changes and finished actions pushed to webhooks and MQTT
+# (disabled if neither is configured)
+destinations = [
+    WebhookDestination(url.strip(), secret=WEBHOOK_SECRET)
+    for url in WEBHOOK_URLS.split(",") if url.strip()
+]
+if MQTT_URL:
+    destinations.append(MQTTDestination.from_url(
+        MQTT_URL, prefix=MQTT_PREFIX, discovery=MQTT_DISCOVERY))
+publisher = EventPublisher(
+    destinations,
+    queue_size=PUBLISH_QUEUE_SIZE,
+    spill_dir=PUBLISH_SPILL_DIR
+) if destinations else None
+
+# Long-lived aiohttp session, opened in the lifespan handler
+websession = None
+
+
+async def create_client(email, password):
+    return MyRenaultClient(
+        email=email,
+        password=password,
+        websession=await get_client_session(),
+        pool=session_pool,
+        inflight=inflight,
+        cache=response_cache,
+        vin_index=vin_index,
+        history=history,
+        samples=samples,
+        geofences=geofences,
+        publisher=publisher,
+        governor=governor,
+        breaker=breaker,
+        max_stale=STALE_MAX_AGE,
+        state=state)
+
+
+# Shared polling loops behind the streaming endpoints
+poller = TelemetryPoller(
+    create_client,
+    min_interval=STREAM_MIN_INTERVAL,
+    fast_interval=STREAM_FAST_INTERVAL,
+    max_interval=STREAM_MAX_INTERVAL
+)
+
+# Remote actions run in the background by a pool of workers
+jobs = JobQueue(create_client, workers=JOB_WORKERS, job_ttl=JOB_TTL,
+                publisher=publisher)
+
+# Charges vehicles by a deadline during off-peak windows, through the job
+# queue (schedules kept in memory only if no path)
+scheduler = ChargeScheduler(
+    create_client,
+    jobs,
+    store=ScheduleStore(SCHEDULES_PATH, secret_box) if SCHEDULES_PATH
+    else None,
+    batch_size=CHARGE_BATCH_SIZE,
+    batch_interval=CHARGE_BATCH_INTERVAL
+)
+
+# Logs in, refreshes tokens and resolves vehicles ahead of user requests
+warmer = SessionWarmer(
+    create_client,
+    interval=WARMUP_INTERVAL,
+    refresh_margin=WARMUP_MARGIN,
+    active_ttl=SESSION_IDLE_TTL,
+    concurrency=WARMUP_CONCURRENCY
+)
+
+# State of the shared services, read when /metrics is scraped
+for prefix, component, gauges in (
+    ("renault_session_pool", session_pool, ("size",)),
+    ("renault_singleflight", inflight, ("in_flight",)),
+    ("renault_response_cache", response_cache, ("size",)),
+    ("renault_fingerprints", fingerprints, ("size",)),
+    ("renault_vin_index", vin_index, ("size",)),
+    ("renault_breaker", breaker, ("open",)),
+    ("renault_governor", governor,
+     ("active", "queue_depth", "accounts", "wait_seconds_max")),
+    ("renault_history", history, ("queued",)),
+    ("renault_recent_samples", samples, ("series", "samples")),
+    ("renault_analytics", analytics, ("vehicles",)),
+    ("renault_geofences", geofences, ("fences", "vehicles")),
+    ("renault_static_assets", assets, ("assets",)),
+    ("renault_publisher", publisher, ("destinations", "queued")),
+    ("renault_poller", poller, ("watches", "subscribers")),
+    ("renault_jobs", jobs, ("jobs", "queued")),
+    ("renault_charge_scheduler", scheduler, ("schedules", "timers")),
+    ("renault_warmup", warmer, ("accounts",)),
+    ("renault_session_tokens", tokens, ("active",)),
+    ("renault_state", state, ("size",)),
+    ("renault_logging", log_pipeline, ("queue_depth",)),
+):
+    if component is not None:
+        metrics.REGISTRY.add_collector(
+            metrics.stats_collector(prefix, component.get_stats, gauges))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global websession
+    if log_pipeline is not None:
+        log_pipeline.start()
+    if websession is not None and not websession.closed:
+        await websession.close()
+        websession = None
+    if not FAST_START:
+        # Ready before the first request rather than during it
+        load_deferred()
+        websession = create_websession()
+    # The default account of single-user deployments is ready at startup
+    if os.environ.get("RENAULT_EMAIL") and os.environ.get("RENAULT_PASSWORD"):
+        warmer.add(os.environ["RENAULT_EMAIL"], os.environ["RENAULT_PASSWORD"])
+    warmer.start()
+    scheduler.start()
+    try:
+        yield
+    finally:
+        await warmer.close()
+        await poller.close()
+        await scheduler.close()
+        await jobs.close()
+        if publisher is not None:
+            await publisher.close()
+        if history is not None:
+            await asyncio.to_thread(history.close)
+        session_pool.clear()
+        if state is not None:
+            await state.close()
+        if websession is not None:
+            await websession.close()
+        websession = None
+        if log_pipeline is not None:
+            log_pipeline.stop()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+app.add_middleware(metrics.MetricsMiddleware)
+# Large bodies only: the vehicle list, snapshots, fleet status and history
+app.add_middleware(
+    CompressionMiddleware,
+    paths=("/api/v1/vehicles", "/api/v1/vehicles/snapshot",
+           "/api/v1/fleet/status", "/api/v1/vehicle/{vin}/history"),
+    encodings=available_encodings(COMPRESSION))
+app.add_middleware(RequestIdMiddleware)
 
 
 class BatteryStatusResponse(BaseModel):
@@ -45,15 +371,126 @@ class VehicleResponse(BaseModel):
     picture: Optional[str] = None
 
 
+class SnapshotResponse(BaseModel):
+    vin: str
+    battery: Optional[BatteryStatusResponse] = None
+    cockpit: Optional[CockpitResponse] = None
+    location: Optional[LocationResponse] = None
+    errors: dict[str, str] = {}
+    stale: list[str] = []
+
+
+class HistoryResponse(BaseModel):
+    vin: str
+    kind: str
+    start: int
+    end: int
+    step: int
+    buckets: list[dict]
+
+
+class SessionResponse(BaseModel):
+    token: str
+    token_type: str = "bearer"
+    expires_in: int
+    expires_at: datetime
+
+
+class SnapshotRequest(BaseModel):
+    vins: list[str] = Field(..., min_length=1, max_length=50)
+
+
+Latitude = Annotated[float, Field(ge=-90, le=90)]
+Longitude = Annotated[float, Field(ge=-180, le=180)]
+
+
+class CircleRequest(BaseModel):
+    latitude: Latitude
+    longitude: Longitude
+    radius: float = Field(..., gt=0, le=100000)  # meters
+
+
+class GeofenceRequest(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100)
+    circle: Optional[CircleRequest] = None
+    # [latitude, longitude] points
+    polygon: Optional[list[tuple[Latitude, Longitude]]] = Field(
+        None, min_length=3, max_length=1000)
+    vins: Optional[list[str]] = Field(None, max_length=100)
+
+
+class ChargeScheduleRequest(BaseModel):
+    target_soc: int = Field(..., ge=1, le=100)
+    deadline: datetime
+    windows: list[str] = Field(default_factory=list, max_length=8)
+    timezone: str = "UTC"
+    battery_capacity: float = Field(52.0, gt=0, le=300)
+    charge_power: float = Field(7.4, gt=0, le=350)
+
+
+# Encoders of the hot routes, built once from their response models. The
+# client already returns bodies of these shapes, so they are encoded
+# without FastAPI validating them against the response model again.
+encode_vehicles = serializer(list[VehicleResponse])
+encode_snapshot = serializer(SnapshotResponse)
+encode_snapshots = serializer(list[SnapshotResponse])
+encode_history = serializer(HistoryResponse)
+
+
+def json_response(body, headers=None):
+    return Response(content=body, media_type="application/json",
+                    headers=headers)
+
+
+async def static_response(request, name, version=None):
+    response = await assets.response(
+        name,
+        request.headers.get("accept-encoding", ""),
+        request.headers.get("if-none-match"),
+        version,
+        head=request.method == "HEAD")
+    if response is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="Not Found")
+    return response
+
+
 @app.get("/")
-async def read_root():
-    from starlette.responses import FileResponse
-    return FileResponse('static/index.html')
+async def read_root(request: Request):
+    return await static_response(request, "index.html")
 
 
-async def get_client_session():
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"],
+               include_in_schema=False)
+async def get_static(path: str, request: Request, v: Optional[str] = None):
+    """
+    Frontend files. With ?v= set to the version given by assets.url(),
+    responses are cached by clients for good.
+    """
+    return await static_response(request, path, v)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint (text exposition format 0.0.4)."""
+    return PlainTextResponse(
+        metrics.REGISTRY.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def create_websession():
     timeout = aiohttp.ClientTimeout(total=DEFAULT_TIMEOUT)
-    return aiohttp.ClientSession(timeout=timeout)
+    connector = aiohttp.TCPConnector(limit=CONNECTOR_LIMIT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+async def get_client_session():
+    # The session is normally opened by the lifespan handler; fall back to
+    # opening it lazily when the app runs without one (e.g. in tests).
+    global websession
+    if websession is None or websession.closed:
+        websession = create_websession()
+    return websession
 
 
 # Helper to reduce boilerplate
@@ -61,12 +498,18 @@ async def get_client_session():
 
 async def handle_request(client_action, email, password, *args):
     try:
-        async with await get_client_session() as session:
-            client = MyRenaultClient(
-                email=email,
-                password=password,
-                websession=session)
-            return await client_action(client, *args)
+        client = await create_client(email, password)
+        result = await client_action(client, *args)
+        warmer.touch(email, password)
+        return result
+    except HTTPException:
+        raise
+    except UpstreamBusyError as e:
+        headers = None
+        if e.retry_after:
+            headers = {"Retry-After": str(int(e.retry_after) + 1)}
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail=str(e), headers=headers)
     except ValueError as e:
         # Often raised when VIN not found
         raise HTTPException(
@@ -90,6 +533,10 @@ async def handle_request(client_action, email, password, *args):
             status_code=status.HTTP_502_BAD_GATEWAY,
             detail=f"Upstream error: {str(e)}"
         )
+    except aiohttp.ClientError as e:
+        # Connection refused or dropped by Renault
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY,
+                            detail=f"Upstream error: {describe_error(e)}")
     except asyncio.TimeoutError:
         raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT,
                             detail="Request to Renault API timed out")
@@ -99,127 +546,766 @@ async def handle_request(client_action, email, password, *args):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
-@app.get("/api/v1/vehicles", response_model=list[VehicleResponse])
-async def get_vehicles(
+def bearer_token(authorization):
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() == "bearer" and token.strip():
+        return token.strip()
+    return None
+
+
+async def resolve_credentials(authorization, email, password):
+    """
+    Returns the (email, password) of a request, from its bearer token if
+    it has one, otherwise from the x-renault-email/x-renault-password
+    headers. Raises 401 when neither identifies an account.
+    """
+    token = bearer_token(authorization)
+    if token is not None:
+        session = await tokens.load(token)
+        if session is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid or expired session token",
+                headers={"WWW-Authenticate": 'Bearer error="invalid_token"'})
+        return session.credentials
+    if email and password:
+        return email, password
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Missing Renault credentials or session token",
+        headers={"WWW-Authenticate": "Bearer"})
+
+
+async def get_credentials(
+        authorization: Optional[str] = Header(None),
+        x_renault_email: Optional[str] = Header(None),
+        x_renault_password: Optional[str] = Header(None)):
+    return await resolve_credentials(
+        authorization, x_renault_email, x_renault_password)
+
+
+def resolve_max_age(max_age, cache_control):
+    """
+    Returns the maximum acceptable age (seconds) of a cached reading, from
+    the `max_age` query parameter or else the request Cache-Control header.
+    """
+    if max_age is not None:
+        return max_age
+    if not cache_control:
+        return None
+    for directive in cache_control.lower().split(","):
+        directive = directive.strip()
+        if directive in ("no-cache", "no-store"):
+            return 0
+        if directive.startswith("max-age="):
+            try:
+                return max(0, int(directive[len("max-age="):]))
+            except ValueError:
+                continue
+    return None
+
+
+def reading_headers(kind, result, fingerprint):
+    headers = {"Age": str(int(result.age)), "ETag": fingerprint.etag}
+    if fingerprint.last_modified is not None:
+        headers["Last-Modified"] = http_date(fingerprint.last_modified)
+    if result.stale:
+        # Last known reading, served while Renault is unavailable
+        headers["X-Cache"] = "STALE"
+        headers["Warning"] = '110 - "Response is Stale"'
+        headers["Cache-Control"] = "private, max-age=0"
+        return headers
+    headers["X-Cache"] = "HIT" if result.from_cache else "MISS"
+    remaining = max(0, int(response_cache.ttl(kind) - result.age))
+    headers["Cache-Control"] = f"private, max-age={remaining}"
+    return headers
+
+
+async def handle_read(kind, vin, email, password, response, max_age,
+                      cache_control, if_none_match=None,
+                      if_modified_since=None):
+    max_age = resolve_max_age(max_age, cache_control)
+    key = (credentials_key(email, password), vin.strip().upper(), kind)
+    conditional = bool(if_none_match or if_modified_since)
+
+    result = None
+    if conditional:
+        # Revalidating a reading that is still fresh needs neither a client
+        # nor Renault, only the cache and its fingerprint.
+        result = response_cache.get(key, max_age)
+        if result is not None:
+            warmer.touch(email, password)
+    if result is None:
+        result = await handle_request(
+            lambda c, v, m: c.read(kind, v, m), email, password, vin, max_age)
+
+    fingerprint = fingerprints.get(key, result.value)
+    headers = reading_headers(kind, result, fingerprint)
+    if conditional and not_modified(
+            fingerprint, if_none_match, if_modified_since):
+        fingerprints.stats["not_modified"] += 1
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED,
+                        headers=headers)
+    if isinstance(result.value, Reading):
+        # Built by the client from typed fields: no need to validate it
+        # against the response model again
+        return json_response(result.value.body(), headers)
+    response.headers.update(headers)
+    return result.value
+
+
+@app.post("/api/v1/session", response_model=SessionResponse,
+          status_code=status.HTTP_201_CREATED)
+async def create_session(
         x_renault_email: str = Header(...),
         x_renault_password: str = Header(...)):
-    return await handle_request(
+    """
+    Logs in once and returns a bearer token to send as
+    `Authorization: Bearer <token>` instead of the credential headers.
+    """
+    await handle_request(
+        lambda c: c.get_session(), x_renault_email, x_renault_password)
+    token, session = tokens.issue(x_renault_email, x_renault_password)
+    await tokens.save(token, session)
+    return {
+        "token": token,
+        "expires_in": tokens.ttl,
+        "expires_at": datetime.fromtimestamp(session.expires_at).astimezone()
+    }
+
+
+@app.delete("/api/v1/session", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_session(authorization: Optional[str] = Header(None)):
+    """Revokes the bearer token of the request."""
+    token = bearer_token(authorization)
+    if token is None or not await tokens.discard(token):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired session token",
+            headers={"WWW-Authenticate": 'Bearer error="invalid_token"'})
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@app.get("/api/v1/vehicles", response_model=list[VehicleResponse])
+async def get_vehicles(
+        credentials: tuple = Depends(get_credentials)):
+    return json_response(encode_vehicles(await handle_request(
         lambda c: c.get_vehicles(),
-        x_renault_email,
-        x_renault_password
-    )
+        *credentials
+    )))
 
 
 @app.get("/api/v1/vehicle/{vin}/battery", response_model=BatteryStatusResponse)
 async def get_battery(
         vin: str,
-        x_renault_email: str = Header(...),
-        x_renault_password: str = Header(...)):
-    return await handle_request(
-        lambda c, v: c.battery_status(v),
-        x_renault_email,
-        x_renault_password,
-        vin
+        response: Response,
+        max_age: Optional[int] = Query(None, ge=0),
+        cache_control: Optional[str] = Header(None),
+        if_none_match: Optional[str] = Header(None),
+        if_modified_since: Optional[str] = Header(None),
+        credentials: tuple = Depends(get_credentials)):
+    return await handle_read(
+        "battery",
+        vin,
+        *credentials,
+        response,
+        max_age,
+        cache_control,
+        if_none_match,
+        if_modified_since
     )
 
 
 @app.get("/api/v1/vehicle/{vin}/cockpit", response_model=CockpitResponse)
 async def get_cockpit(
         vin: str,
-        x_renault_email: str = Header(...),
-        x_renault_password: str = Header(...)):
-    return await handle_request(
-        lambda c, v: c.cockpit(v),
-        x_renault_email,
-        x_renault_password,
-        vin
+        response: Response,
+        max_age: Optional[int] = Query(None, ge=0),
+        cache_control: Optional[str] = Header(None),
+        if_none_match: Optional[str] = Header(None),
+        if_modified_since: Optional[str] = Header(None),
+        credentials: tuple = Depends(get_credentials)):
+    return await handle_read(
+        "cockpit",
+        vin,
+        *credentials,
+        response,
+        max_age,
+        cache_control,
+        if_none_match,
+        if_modified_since
     )
 
 
 @app.get("/api/v1/vehicle/{vin}/location", response_model=LocationResponse)
 async def get_location(
         vin: str,
-        x_renault_email: str = Header(...),
-        x_renault_password: str = Header(...)):
-    return await handle_request(
-        lambda c, v: c.location(v),
-        x_renault_email,
-        x_renault_password,
+        response: Response,
+        max_age: Optional[int] = Query(None, ge=0),
+        cache_control: Optional[str] = Header(None),
+        if_none_match: Optional[str] = Header(None),
+        if_modified_since: Optional[str] = Header(None),
+        credentials: tuple = Depends(get_credentials)):
+    return await handle_read(
+        "location",
+        vin,
+        *credentials,
+        response,
+        max_age,
+        cache_control,
+        if_none_match,
+        if_modified_since
+    )
+
+
+@app.get("/api/v1/vehicle/{vin}/snapshot", response_model=SnapshotResponse)
+async def get_snapshot(
+        vin: str,
+        max_age: Optional[int] = Query(None, ge=0),
+        cache_control: Optional[str] = Header(None),
+        credentials: tuple = Depends(get_credentials)):
+    return json_response(encode_snapshot(await handle_request(
+        lambda c, v, m: c.snapshot(v, max_age=m),
+        *credentials,
+        vin,
+        resolve_max_age(max_age, cache_control)
+    )))
+
+
+@app.post("/api/v1/vehicles/snapshot", response_model=list[SnapshotResponse])
+async def get_snapshots(
+        body: SnapshotRequest,
+        max_age: Optional[int] = Query(None, ge=0),
+        cache_control: Optional[str] = Header(None),
+        credentials: tuple = Depends(get_credentials)):
+    return json_response(encode_snapshots(await handle_request(
+        lambda c, vins, m: c.snapshots(vins, max_age=m),
+        *credentials,
+        body.vins,
+        resolve_max_age(max_age, cache_control)
+    )))
+
+
+def matches_fleet_filters(vehicle, battery_below, plugged):
+    battery = vehicle.get("battery") or {}
+    if battery_below is not None:
+        level = battery.get("batteryLevel")
+        if level is None or level >= battery_below:
+            return False
+    if plugged is not None:
+        plug_status = battery.get("plugStatus")
+        if plug_status is None or bool(plug_status) != plugged:
+            return False
+    return True
+
+
+@app.get("/api/v1/fleet/status")
+async def get_fleet_status(
+        kinds: str = "battery,location",
+        concurrency: int = Query(
+            FLEET_CONCURRENCY, ge=1, le=FLEET_MAX_CONCURRENCY),
+        battery_below: Optional[float] = Query(None, ge=0, le=100),
+        plugged: Optional[bool] = None,
+        max_age: Optional[int] = Query(None, ge=0),
+        cache_control: Optional[str] = Header(None),
+        credentials: tuple = Depends(get_credentials)):
+    """
+    Status of every vehicle of every account, streamed as NDJSON (one
+    snapshot per line, with the vehicle details) in completion order.
+    `battery_below` and `plugged` only keep the matching vehicles.
+    """
+    kinds = parse_kinds(kinds)
+    if (battery_below is not None or plugged is not None) \
+            and "battery" not in kinds:
+        kinds.append("battery")
+    max_age = resolve_max_age(max_age, cache_control)
+
+    # Errors up to the vehicle list still get a regular HTTP status
+    vehicles = await handle_request(
+        lambda c: c.get_vehicles(),
+        *credentials
+    )
+    client = await create_client(*credentials)
+
+    async def lines():
+        async for vehicle in client.fleet_status(
+                vehicles, kinds, concurrency, max_age):
+            if matches_fleet_filters(vehicle, battery_below, plugged):
+                yield dumps(vehicle) + b"\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def utc_timestamp(value):
+    # Times without an offset are UTC, whatever the server's time zone
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+@app.get("/api/v1/vehicle/{vin}/history", response_model=HistoryResponse)
+async def get_history(
+        vin: str,
+        kind: str = "battery",
+        from_: Optional[datetime] = Query(None, alias="from"),
+        to: Optional[datetime] = None,
+        step: int = Query(3600, ge=1),
+        credentials: tuple = Depends(get_credentials)):
+    """
+    Recorded samples of one kind, aggregated per bucket of `step` seconds
+    (min/max/avg of each field). Defaults to the last 24 hours. The step is
+    widened when the range would produce too many buckets. Without a
+    history database, only the recent samples kept in memory are served.
+    """
+    if history is None and samples is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="History is disabled")
+    if kind not in HISTORY_FIELDS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"kind must be one of {tuple(HISTORY_FIELDS)}")
+
+    end = utc_timestamp(to) if to else int(time.time())
+    start = utc_timestamp(from_) if from_ else end - 86400
+    if start >= end:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="'from' must be before 'to'")
+
+    vin = await handle_request(
+        lambda c, v: c.check_vehicle(v),
+        *credentials,
+        vin
+    )
+    if history is not None:
+        step, buckets = await asyncio.to_thread(
+            history.query, kind, vin, start, end, step)
+    else:
+        step, buckets = samples.query(kind, vin, start, end, step)
+    return json_response(encode_history(
+        {"vin": vin, "kind": kind, "start": start, "end": end,
+         "step": step, "buckets": buckets}))
+
+
+async def run_analytics(method, *args):
+    if history is not None:
+        # Reads the database
+        return await asyncio.to_thread(method, *args)
+    return method(*args)
+
+
+@app.get("/api/v1/vehicle/{vin}/charging-sessions")
+async def get_charging_sessions(
+        vin: str,
+        battery_capacity: float = Query(52.0, gt=0),
+        limit: int = Query(50, ge=1, le=500),
+        credentials: tuple = Depends(get_credentials)):
+    """
+    Charging sessions detected in the recorded battery samples, oldest
+    first, the last one possibly still in progress. Energy comes from the
+    charging power when reported, else from the level gained and
+    `battery_capacity` (kWh).
+    """
+    if analytics is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="History is disabled")
+    vin = await handle_request(
+        lambda c, v: c.check_vehicle(v),
+        *credentials,
+        vin
+    )
+    sessions = await run_analytics(
+        analytics.sessions, vin, battery_capacity, limit)
+    return {"vin": vin, "battery_capacity": battery_capacity,
+            "sessions": sessions}
+
+
+@app.get("/api/v1/vehicle/{vin}/efficiency")
+async def get_efficiency(
+        vin: str,
+        days: int = Query(30, ge=1, le=366),
+        battery_capacity: float = Query(52.0, gt=0),
+        credentials: tuple = Depends(get_credentials)):
+    """
+    Distance driven, battery energy used and charged per day over the last
+    `days` days, and the resulting consumption in kWh/100 km.
+    """
+    if analytics is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="History is disabled")
+    vin = await handle_request(
+        lambda c, v: c.check_vehicle(v),
+        *credentials,
+        vin
+    )
+    return await run_analytics(
+        analytics.efficiency, vin, battery_capacity, days)
+
+
+async def geofence_owner(credentials: tuple = Depends(get_credentials)):
+    """
+    Email of the account, once its credentials are checked: geofences are
+    stored by email, which alone must not give access to them.
+    """
+    await handle_request(lambda c: c.get_session(), *credentials)
+    return credentials[0]
+
+
+@app.post("/api/v1/geofences", status_code=status.HTTP_201_CREATED)
+async def add_geofence(
+        request: GeofenceRequest,
+        email: str = Depends(geofence_owner)):
+    """
+    Registers a circle (radius in meters) or polygon of [latitude,
+    longitude] points, for every vehicle of the account or only `vins`.
+    """
+    if (request.circle is None) == (request.polygon is None):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Give either a circle or a polygon")
+    if request.circle is not None:
+        shape = Circle(request.circle.latitude, request.circle.longitude,
+                       request.circle.radius)
+    else:
+        shape = Polygon(request.polygon)
+    try:
+        fence = geofences.add(email, request.name, shape, request.vins)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail=str(e))
+    return fence.to_dict()
+
+
+@app.get("/api/v1/geofences")
+async def list_geofences(email: str = Depends(geofence_owner)):
+    return [fence.to_dict() for fence in geofences.fences(email)]
+
+
+@app.delete("/api/v1/geofences/{fence_id}",
+            status_code=status.HTTP_204_NO_CONTENT)
+async def delete_geofence(
+        fence_id: str,
+        email: str = Depends(geofence_owner)):
+    if geofences.remove(email, fence_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="Geofence not found")
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@app.get("/api/v1/vehicle/{vin}/geofences")
+async def get_vehicle_geofences(
+        vin: str,
+        credentials: tuple = Depends(get_credentials)):
+    """
+    Geofences the vehicle is in and its latest enter/exit events. The
+    location is read first (from cache when recent), so that the answer
+    reflects the current position.
+    """
+    vin = vin.strip().upper()
+    await handle_request(
+        lambda c, v: c.read("location", v),
+        *credentials,
+        vin
+    )
+    return geofences.status(credentials[0], vin)
+
+
+@app.get("/api/v1/vehicle/{vin}/trips")
+async def get_trips(
+        vin: str,
+        credentials: tuple = Depends(get_credentials)):
+    """
+    Trips detected from the location readings of the vehicle, oldest
+    first. Positions are only known when they are read (by the API or a
+    stream), so trips are as precise as the readings are frequent.
+    """
+    vin = await handle_request(
+        lambda c, v: c.check_vehicle(v),
+        *credentials,
+        vin
+    )
+    return {"vin": vin, "trips": geofences.trips(credentials[0], vin)}
+
+
+def parse_kinds(kinds):
+    parsed = [k.strip() for k in kinds.split(",") if k.strip()]
+    unknown = [k for k in parsed if k not in READ_KINDS]
+    if not parsed or unknown:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"kinds must be a comma-separated subset of {READ_KINDS}"
+        )
+    return parsed
+
+
+def format_sse(event):
+    return f"event: {event['kind']}\ndata: {json.dumps(event)}\n\n"
+
+
+@app.get("/api/v1/vehicle/{vin}/stream")
+async def stream(
+        vin: str,
+        kinds: str = "battery,location",
+        interval: int = Query(STREAM_MIN_INTERVAL, ge=1),
+        credentials: tuple = Depends(get_credentials)):
+    """
+    Server-Sent Events stream of telemetry changes. The first event of each
+    kind carries the full reading, later ones only the changed fields.
+    """
+    kinds = parse_kinds(kinds)
+    # Fail with a regular HTTP error on bad credentials or an unknown VIN
+    await handle_request(
+        lambda c, v: c.get_vehicle(v),
+        *credentials,
         vin
     )
+    sub = poller.subscribe(
+        *credentials, vin, kinds, interval)
+
+    async def events():
+        try:
+            while True:
+                event = await sub.get(timeout=STREAM_KEEPALIVE)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                else:
+                    yield format_sse(event)
+        finally:
+            poller.unsubscribe(sub)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.websocket("/api/v1/vehicle/{vin}/ws")
+async def stream_websocket(
+        websocket: WebSocket,
+        vin: str,
+        kinds: str = "battery,location",
+        interval: int = STREAM_MIN_INTERVAL):
+    """
+    WebSocket variant of the telemetry stream, sending the same events as
+    JSON messages. Credentials (or the bearer token) are read from the
+    handshake headers.
+    """
+    try:
+        kinds = parse_kinds(kinds)
+        email, password = await resolve_credentials(
+            websocket.headers.get("authorization"),
+            websocket.headers.get("x-renault-email"),
+            websocket.headers.get("x-renault-password"))
+        await handle_request(
+            lambda c, v: c.get_vehicle(v), email, password, vin)
+    except HTTPException as e:
+        # Application close codes mirror the HTTP status (4000 + status)
+        await websocket.accept()
+        await websocket.close(code=4000 + e.status_code,
+                              reason=str(e.detail)[:120])
+        return
+
+    await websocket.accept()
+    sub = poller.subscribe(email, password, vin, kinds, interval)
+    try:
+        while True:
+            event = await sub.get(timeout=STREAM_KEEPALIVE)
+            await websocket.send_json(event or {"kind": "ping"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        poller.unsubscribe(sub)
+
+
+def job_response(job):
+    # 202 while the action is pending, 200 once it has finished
+    return FastJSONResponse(
+        status_code=(status.HTTP_200_OK if job.finished
+                     else status.HTTP_202_ACCEPTED),
+        content=jsonable_encoder(job.to_dict()),
+        headers={"Location": f"/api/v1/jobs/{job.id}"}
+    )
+
+
+async def submit_action(action, vin, email, password, wait, *args):
+    job = jobs.submit(email, password, vin, action, args)
+    if wait:
+        await job.wait_finished(wait)
+    return job_response(job)
+
+
+def get_job_or_404(job_id, email, password):
+    job = jobs.get(job_id)
+    # Jobs are only visible to the account that submitted them
+    if job is None or job.account_key != credentials_key(email, password):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="Job not found")
+    return job
 
 
 @app.post("/api/v1/vehicle/{vin}/hvac-start")
 async def hvac_start(
         vin: str,
         temp: float = 21.0,
-        x_renault_email: str = Header(...),
-        x_renault_password: str = Header(...)):
-    return await handle_request(
-        lambda c, v, t: c.hvac_start(v, t),
-        x_renault_email,
-        x_renault_password,
-        vin,
-        temp
-    )
+        wait: float = Query(0, ge=0, le=MAX_JOB_WAIT),
+        credentials: tuple = Depends(get_credentials)):
+    return await submit_action(
+        "hvac_start", vin, *credentials, wait, temp)
 
 
 @app.post("/api/v1/vehicle/{vin}/hvac-stop")
 async def hvac_stop(
         vin: str,
-        x_renault_email: str = Header(...),
-        x_renault_password: str = Header(...)):
-    return await handle_request(
-        lambda c, v: c.hvac_stop(v),
-        x_renault_email,
-        x_renault_password,
-        vin
-    )
+        wait: float = Query(0, ge=0, le=MAX_JOB_WAIT),
+        credentials: tuple = Depends(get_credentials)):
+    return await submit_action(
+        "hvac_stop", vin, *credentials, wait)
 
 
 @app.post("/api/v1/vehicle/{vin}/charge-start")
 async def charge_start(
         vin: str,
-        x_renault_email: str = Header(...),
-        x_renault_password: str = Header(...)):
-    return await handle_request(
-        lambda c, v: c.charge_start(v),
-        x_renault_email,
-        x_renault_password,
-        vin
-    )
+        wait: float = Query(0, ge=0, le=MAX_JOB_WAIT),
+        credentials: tuple = Depends(get_credentials)):
+    return await submit_action(
+        "charge_start", vin, *credentials, wait)
 
 
 @app.post("/api/v1/vehicle/{vin}/charge-stop")
 async def charge_stop(
         vin: str,
-        x_renault_email: str = Header(...),
-        x_renault_password: str = Header(...)):
-    return await handle_request(
-        lambda c, v: c.charge_stop(v),
-        x_renault_email,
-        x_renault_password,
-        vin
-    )
+        wait: float = Query(0, ge=0, le=MAX_JOB_WAIT),
+        credentials: tuple = Depends(get_credentials)):
+    return await submit_action(
+        "charge_stop", vin, *credentials, wait)
 
 
 @app.post("/api/v1/vehicle/{vin}/lights")
-async def lights(vin: str, x_renault_email: str = Header(...),
-                 x_renault_password: str = Header(...)):
-    return await handle_request(
-        lambda c, v: c.blink_lights(v),
-        x_renault_email,
-        x_renault_password,
-        vin
-    )
+async def lights(vin: str,
+                 wait: float = Query(0, ge=0, le=MAX_JOB_WAIT),
+                 credentials: tuple = Depends(get_credentials)):
+    return await submit_action(
+        "lights", vin, *credentials, wait)
 
 
 @app.post("/api/v1/vehicle/{vin}/honk")
-async def honk(vin: str, x_renault_email: str = Header(...),
-               x_renault_password: str = Header(...)):
-    return await handle_request(
-        lambda c, v: c.honk(v),
-        x_renault_email,
-        x_renault_password,
+async def honk(vin: str,
+               wait: float = Query(0, ge=0, le=MAX_JOB_WAIT),
+               credentials: tuple = Depends(get_credentials)):
+    return await submit_action(
+        "honk", vin, *credentials, wait)
+
+
+def parse_schedule(request):
+    """Checks a ChargeScheduleRequest, returning its deadline (epoch)."""
+    try:
+        tz = ZoneInfo(request.timezone)
+        for window in request.windows:
+            parse_window(window)
+    except (ValueError, ZoneInfoNotFoundError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(e) if isinstance(e, ValueError)
+            else f"Unknown timezone {request.timezone!r}")
+    deadline = request.deadline
+    if deadline.tzinfo is None:
+        deadline = deadline.replace(tzinfo=tz)
+    deadline = deadline.timestamp()
+    if deadline <= time.time():
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="deadline must be in the future")
+    return deadline
+
+
+@app.post("/api/v1/vehicle/{vin}/charge-schedule",
+          status_code=status.HTTP_201_CREATED)
+async def set_charge_schedule(
+        vin: str,
+        request: ChargeScheduleRequest,
+        credentials: tuple = Depends(get_credentials)):
+    """
+    Charges the vehicle to `target_soc` percent by `deadline`, during the
+    daily off-peak `windows` ("HH:MM-HH:MM" in `timezone`) when they are
+    long enough. Replaces the previous schedule of the vehicle.
+    """
+    deadline = parse_schedule(request)
+    await handle_request(
+        lambda c, v: c.get_vehicle(v),
+        *credentials,
         vin
     )
+    schedule = await scheduler.add(
+        *credentials, vin, request.target_soc, deadline, request.windows,
+        timezone=request.timezone, capacity=request.battery_capacity,
+        power=request.charge_power)
+    return schedule.to_dict()
+
+
+def get_schedule_or_404(vin, email, password):
+    schedule = scheduler.get(email, password, vin)
+    if schedule is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="No charge schedule for this vehicle")
+    return schedule
+
+
+@app.get("/api/v1/vehicle/{vin}/charge-schedule")
+async def get_charge_schedule(
+        vin: str,
+        credentials: tuple = Depends(get_credentials)):
+    """The charge schedule of the vehicle, with its current plan."""
+    return get_schedule_or_404(vin, *credentials).to_dict()
+
+
+@app.delete("/api/v1/vehicle/{vin}/charge-schedule",
+            status_code=status.HTTP_204_NO_CONTENT)
+async def delete_charge_schedule(
+        vin: str,
+        credentials: tuple = Depends(get_credentials)):
+    """Cancels the charge schedule; a charge in progress is not stopped."""
+    get_schedule_or_404(vin, *credentials)
+    await scheduler.remove(*credentials, vin)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@app.get("/api/v1/jobs/{job_id}")
+async def get_job(
+        job_id: str,
+        wait: float = Query(0, ge=0, le=MAX_JOB_WAIT),
+        credentials: tuple = Depends(get_credentials)):
+    """
+    Status of a remote action. With `wait`, blocks up to that many seconds
+    for the action to finish.
+    """
+    job = get_job_or_404(job_id, *credentials)
+    if wait:
+        await job.wait_finished(wait)
+    return job_response(job)
+
+
+@app.get("/api/v1/jobs/{job_id}/stream")
+async def stream_job(
+        job_id: str,
+        credentials: tuple = Depends(get_credentials)):
+    """Server-Sent Events stream of a job's status until it finishes."""
+    job = get_job_or_404(job_id, *credentials)
+
+    async def events():
+        while True:
+            data = json.dumps(jsonable_encoder(job.to_dict()))
+            yield f"event: job\ndata: {data}\n\n"
+            if job.finished:
+                return
+            await job.wait(STREAM_KEEPALIVE)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,127 @@
+"""
+Cold start of the API: time from launching the server process, as the
+Dockerfile does (uvicorn api:app), to its first 200 response.
+
+    python -m benchmarks.coldstart
+    python -m benchmarks.coldstart --runs 10 --fast-start
+    python -m benchmarks.coldstart --target battery --fast-start
+
+Each run starts a new process, then polls the target until it answers 200.
+The `index` target is the frontend page; `battery` is a battery reading
+through the local fake Renault server, so that the first response also
+includes the login and the imports deferred by RENAULT_FAST_START. Results
+are printed as JSON, in milliseconds.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import statistics
+
+import httpx
+
+from benchmarks.fake_renault import FakeRenault
+from benchmarks.harness import PASSWORD, _email, _headers
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+POLL_INTERVAL = 0.005  # seconds
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def first_response(path, headers, env, timeout=30):
+    """Seconds from launching a server to its first 200 on `path`."""
+    port = free_port()
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "uvicorn", "api:app", "--port", str(port),
+        "--log-level", "warning", cwd=ROOT, env=env,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+    try:
+        async with httpx.AsyncClient(
+                base_url=f"http://127.0.0.1:{port}") as http:
+            while time.perf_counter() - started < timeout:
+                if process.returncode is not None:
+                    error = await process.stderr.read()
+                    raise RuntimeError(
+                        f"Server exited: {error.decode()[-2000:]}")
+                try:
+                    response = await http.get(path, headers=headers)
+                except httpx.TransportError:
+                    await asyncio.sleep(POLL_INTERVAL)
+                    continue
+                if response.status_code == 200:
+                    return time.perf_counter() - started
+                raise RuntimeError(
+                    f"{path} answered {response.status_code}: "
+                    f"{response.text[:200]}")
+        raise TimeoutError(f"No response within {timeout} s")
+    finally:
+        if process.returncode is None:
+            process.terminate()
+        await process.wait()
+
+
+async def run(runs=5, target="index", fast_start=False):
+    fake = await FakeRenault(latency=0, seed=0).start()
+    env = {
+        **os.environ,
+        **fake.locale_env(),
+        # Nothing written to disk, nothing loaded from a previous run
+        "RENAULT_HISTORY_PATH": "",
+        "RENAULT_SCHEDULES_PATH": "",
+        "RENAULT_LOG_LEVEL": "WARNING",
+        "RENAULT_FAST_START": "1" if fast_start else "0",
+    }
+    if target == "battery":
+        vin = fake.account_vins(_email(0), PASSWORD)[0]
+        path, headers = f"/api/v1/vehicle/{vin}/battery", _headers(0)
+    else:
+        path, headers = "/", {}
+    try:
+        samples = [await first_response(path, headers, env)
+                   for _ in range(runs)]
+    finally:
+        await fake.close()
+
+    samples_ms = [round(s * 1000, 1) for s in samples]
+    return {
+        "target": target,
+        "fast_start": fast_start,
+        "runs": runs,
+        "first_200_ms": {
+            "min": min(samples_ms),
+            "median": round(statistics.median(samples_ms), 1),
+            "max": max(samples_ms),
+        },
+        "samples_ms": samples_ms,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time from server start to the first 200 response.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--target", choices=("index", "battery"),
+                        default="index")
+    parser.add_argument("--fast-start", action="store_true",
+                        help="run with RENAULT_FAST_START=1")
+    return parser.parse_args(argv)
+
+
+def cli(argv=None):
+    args = parse_args(argv)
+    results = asyncio.run(run(args.runs, args.target, args.fast_start))
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -0,0 +1,259 @@
+import time
+import random
+import asyncio
+import hashlib
+import logging
+from collections import Counter
+
+import jwt
+from aiohttp import web
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+GIGYA_PREFIX = "/gigya"
+KAMEREON_PREFIX = "/kamereon"
+ACCOUNT_ROOT = KAMEREON_PREFIX + "/commerce/v1/accounts/{account_id}"
+CAR_ADAPTER = ACCOUNT_ROOT + "/kamereon/kca/car-adapter/v{version}/cars/{vin}"
+KCM = ACCOUNT_ROOT + "/kamereon/kcm/v1/vehicles/{vin}"
+
+# Any account logs in, except with this password
+INVALID_PASSWORD = "wrong"
+
+
+def _digest(*parts):
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+class FakeRenault:
+    """
+    Local stand-in for the Gigya and Kamereon servers used by renault-api.
+
+    Every email/password pair is a valid account (except password "wrong")
+    owning `vehicles` vehicles with deterministic VINs. Each call waits
+    `latency` seconds (+/- `jitter`), then fails with an upstream error
+    with probability `error_rate`, or, for Kamereon, is throttled (HTTP 429
+    with Retry-After) with probability `throttle_rate`.
+
+    `calls` counts the calls served per endpoint, including failed ones,
+    which is what the benchmarks report as upstream calls.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.0, error_rate=0.0,
+                 throttle_rate=0.0, retry_after=1, vehicles=1, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.vehicles = vehicles
+        self.calls = Counter()
+        self._random = random.Random(seed)
+        self._secret = "fake-renault-signing-key-for-benchmarks"
+        self._runner = None
+        self.url = None
+
+    def locale_env(self):
+        """Environment variables pointing MyRenaultClient at this server."""
+        return {
+            "RENAULT_GIGYA_URL": self.url + GIGYA_PREFIX,
+            "RENAULT_GIGYA_API_KEY": "fake-gigya-key",
+            "RENAULT_KAMEREON_URL": self.url + KAMEREON_PREFIX,
+            "RENAULT_KAMEREON_API_KEY": "fake-kamereon-key",
+        }
+
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    async def start(self, host="127.0.0.1", port=0):
+        app = web.Application(middlewares=[self._simulate])
+        app.add_routes([
+            web.post(GIGYA_PREFIX + "/accounts.login", self.login),
+            web.post(GIGYA_PREFIX + "/accounts.getAccountInfo",
+                     self.account_info),
+            web.post(GIGYA_PREFIX + "/accounts.getJWT", self.get_jwt),
+            web.get(KAMEREON_PREFIX + "/commerce/v1/persons/{person_id}",
+                    self.person),
+            web.get(ACCOUNT_ROOT + "/vehicles", self.vehicle_links),
+            web.get(ACCOUNT_ROOT + "/vehicles/{vin}/details", self.details),
+            web.get(CAR_ADAPTER + "/battery-status", self.battery),
+            web.get(CAR_ADAPTER + "/cockpit", self.cockpit),
+            web.get(CAR_ADAPTER + "/location", self.location),
+            web.post(CAR_ADAPTER + "/actions/{action}", self.action),
+            web.post(KCM + "/charge/{action}", self.action),
+        ])
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://{host}:{port}"
+        return self
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @web.middleware
+    async def _simulate(self, request, handler):
+        name = request.match_info.route.resource.canonical
+        for prefix in (GIGYA_PREFIX, KAMEREON_PREFIX):
+            if name.startswith(prefix):
+                name = name[len(prefix):]
+        self.calls[name] += 1
+
+        delay = self.latency + self._random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        # Gigya is not throttled: its limits are not what the API hits
+        gigya = request.path.startswith(GIGYA_PREFIX)
+        draw = self._random.random()
+        if draw < self.throttle_rate and not gigya:
+            return web.Response(
+                status=429, text="Too Many Requests",
+                headers={"Retry-After": str(self.retry_after)})
+        if draw < self.throttle_rate + self.error_rate:
+            if gigya:
+                return web.json_response({
+                    "statusCode": 500, "errorCode": 500001,
+                    "errorDetails": "General Server Error"})
+            return web.json_response({"errors": [{
+                "errorCode": "err.tech.500",
+                "errorMessage": "Simulated upstream failure"}]}, status=500)
+        return await handler(request)
+
+    # Gigya
+
+    async def login(self, request):
+        form = await request.post()
+        email, password = form.get("loginID", ""), form.get("password", "")
+        if password == INVALID_PASSWORD:
+            return web.json_response({
+                "statusCode": 403, "errorCode": 403042,
+                "errorDetails": "invalid loginID or password"})
+        token = "login-" + _digest(email.strip().lower(), password)
+        return web.json_response({
+            "statusCode": 200, "errorCode": 0,
+            "sessionInfo": {"cookieValue": token}})
+
+    async def account_info(self, request):
+        form = await request.post()
+        return web.json_response({
+            "statusCode": 200, "errorCode": 0,
+            "data": {"personId": self._person_id(form["login_token"])}})
+
+    async def get_jwt(self, request):
+        form = await request.post()
+        expiration = int(form.get("expiration", 900))
+        token = jwt.encode(
+            {"sub": self._person_id(form["login_token"]),
+             "exp": int(time.time()) + expiration},
+            self._secret, algorithm="HS256")
+        return web.json_response({
+            "statusCode": 200, "errorCode": 0, "id_token": token})
+
+    # Kamereon
+
+    async def person(self, request):
+        person_id = request.match_info["person_id"]
+        return web.json_response({
+            "personId": person_id,
+            "accounts": [{
+                "accountId": "acc-" + person_id,
+                "accountType": "MYRENAULT",
+                "accountStatus": "ACTIVE"}]})
+
+    async def vehicle_links(self, request):
+        account_id = request.match_info["account_id"]
+        return web.json_response({
+            "accountId": account_id,
+            "country": "FR",
+            "vehicleLinks": [
+                {"vin": vin, "vehicleDetails": self._details(vin)}
+                for vin in self._account_vins(account_id)]})
+
+    async def details(self, request):
+        vin = request.match_info["vin"]
+        if vin not in self._account_vins(request.match_info["account_id"]):
+            return self._not_found()
+        return web.json_response(self._details(vin))
+
+    async def battery(self, request):
+        if not self._owned(request):
+            return self._not_found()
+        level = self._random.randint(20, 100)
+        return self._car_data(request, {
+            "timestamp": self._timestamp(),
+            "batteryLevel": level,
+            "batteryAutonomy": level * 3,
+            "batteryTemperature": 20,
+            "plugStatus": 1,
+            "chargingStatus": 1.0,
+            "chargingInstantaneousPower": 7.4})
+
+    async def cockpit(self, request):
+        if not self._owned(request):
+            return self._not_found()
+        return self._car_data(request, {"totalMileage": 12345.6})
+
+    async def location(self, request):
+        if not self._owned(request):
+            return self._not_found()
+        return self._car_data(request, {
+            "gpsLatitude": 48.8566,
+            "gpsLongitude": 2.3522,
+            "lastUpdateTime": self._timestamp()})
+
+    async def action(self, request):
+        if not self._owned(request):
+            return self._not_found()
+        body = await request.json()
+        return self._car_data(request, body["data"]["attributes"],
+                              kind=body["data"]["type"])
+
+    def _person_id(self, login_token):
+        return "person-" + login_token[-16:]
+
+    def _account_vins(self, account_id):
+        # Accounts are derived from login tokens, which do not carry the
+        # email; VINs are therefore derived from the account id instead.
+        digest = _digest(account_id).upper()
+        return [f"VF1FAKE{digest[:6]}{i:04d}" for i in range(self.vehicles)]
+
+    def account_vins(self, email, password):
+        """VINs owned by the account of these credentials."""
+        token = "login-" + _digest(email.strip().lower(), password)
+        return self._account_vins("acc-" + self._person_id(token))
+
+    def _owned(self, request):
+        return request.match_info["vin"] in self._account_vins(
+            request.match_info["account_id"])
+
+    def _details(self, vin):
+        return {
+            "vin": vin,
+            "registrationNumber": "FA-" + vin[-4:] + "-KE",
+            "brand": {"label": "RENAULT"},
+            "model": {"code": "X102VE", "label": "ZOE"},
+            "energy": {"code": "ELEC"},
+            "assets": [{
+                "assetType": "PICTURE",
+                "renditions": [{
+                    "resolutionType": "ONE_MYRENAULT_LARGE",
+                    "url": "https://example.com/zoe-large.png"}]}]}
+
+    def _car_data(self, request, attributes, kind="Car"):
+        return web.json_response({"data": {
+            "type": kind,
+            "id": request.match_info["vin"],
+            "attributes": attributes}})
+
+    def _not_found(self):
+        return web.json_response({"errors": [{
+            "errorCode": "err.func.wired.notFound",
+            "errorMessage": "Vehicle not found"}]}, status=404)
+
+    def _timestamp(self):
+        return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
@@ -0,0 +1,290 @@
+"""
+Load test of the API against the local fake Renault server.
+
+    python -m benchmarks.harness battery --requests 2000 --concurrency 50
+    python -m benchmarks.harness battery --save battery
+    python -m benchmarks.harness battery --compare battery
+    python -m benchmarks.harness battery --log-level DEBUG 2>/dev/null
+
+Results are printed as JSON. --save stores them as a baseline under
+benchmarks/baselines/, --compare reports the change against a stored
+baseline and exits with status 1 when a metric regressed by more than
+--tolerance percent. --log-level runs the API with its logging pipeline at
+that level, to measure the cost of logging against a run at the default
+WARNING level.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import tracemalloc
+from collections import Counter
+
+import httpx
+
+from benchmarks.fake_renault import FakeRenault
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+PASSWORD = "password"
+
+# Metrics compared against baselines, and whether higher is better
+COMPARED = {
+    "rps": True,
+    "latency_ms.p50": False,
+    "latency_ms.p95": False,
+    "latency_ms.p99": False,
+    "upstream_per_request": False,
+}
+
+
+def _email(n):
+    return f"bench{n}@example.com"
+
+
+def _headers(n):
+    return {"x-renault-email": _email(n), "x-renault-password": PASSWORD}
+
+
+# Scenario name -> function(fake, i, accounts) returning the i-th request
+# as (method, path, headers, json body)
+def _battery(fake, i, accounts, max_age=""):
+    n = i % accounts
+    vins = fake.account_vins(_email(n), PASSWORD)
+    vin = vins[i // accounts % len(vins)]
+    return ("GET", f"/api/v1/vehicle/{vin}/battery{max_age}", _headers(n),
+            None)
+
+
+SCENARIOS = {
+    # Same accounts over and over: mostly served by the pool and cache
+    "battery": _battery,
+    # Every read goes upstream (max_age=0)
+    "battery-fresh": lambda fake, i, accounts: _battery(
+        fake, i, accounts, "?max_age=0"),
+    "snapshot": lambda fake, i, accounts: (
+        "GET", "/api/v1/vehicle/"
+        f"{fake.account_vins(_email(i % accounts), PASSWORD)[0]}/snapshot",
+        _headers(i % accounts), None),
+    "vehicles": lambda fake, i, accounts: (
+        "GET", "/api/v1/vehicles", _headers(i % accounts), None),
+    # Every vehicle of the account in one request
+    "fleet": lambda fake, i, accounts: (
+        "POST", "/api/v1/vehicles/snapshot", _headers(i % accounts),
+        {"vins": fake.account_vins(_email(i % accounts), PASSWORD)}),
+    # Same, streamed as NDJSON by the fleet endpoint
+    "fleet-status": lambda fake, i, accounts: (
+        "GET", "/api/v1/fleet/status", _headers(i % accounts), None),
+    # A new account each time: login and vehicle resolution on every call
+    "login": lambda fake, i, accounts: _battery(fake, i, i + 1),
+}
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of sorted `values`."""
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, int(round(q / 100 * len(values))) - 1))
+    return values[index]
+
+
+async def run_benchmark(app, fake, scenario, requests=1000, concurrency=20,
+                        accounts=10, warmup=0):
+    """
+    Sends `requests` requests of `scenario` to `app` from `concurrency`
+    concurrent clients and returns the measurements as a dict.
+    """
+    build = SCENARIOS[scenario]
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+    statuses = Counter()
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://api",
+                                 timeout=None) as http:
+        async def send(i, measure):
+            method, path, headers, body = build(fake, i, accounts)
+            started = time.perf_counter()
+            response = await http.request(
+                method, path, headers=headers, json=body)
+            if measure:
+                latencies.append(time.perf_counter() - started)
+                statuses[response.status_code] += 1
+
+        async def worker(queue, measure):
+            while queue:
+                await send(queue.pop(), measure)
+
+        for count, measure in ((warmup, False), (requests, True)):
+            if measure:
+                fake.calls.clear()
+                started = time.perf_counter()
+            queue = list(range(count))[::-1]
+            await asyncio.gather(
+                *(worker(queue, measure) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    upstream = fake.total_calls()
+    return {
+        "scenario": scenario,
+        "requests": requests,
+        "concurrency": concurrency,
+        "accounts": accounts,
+        "duration_s": round(elapsed, 3),
+        "rps": round(requests / elapsed, 1) if elapsed else None,
+        "latency_ms": {
+            f"p{q}": round(percentile(latencies, q) * 1000, 2)
+            for q in (50, 95, 99)
+        } | {"max": round(latencies[-1] * 1000, 2) if latencies else None},
+        "status": {str(k): v for k, v in sorted(statuses.items())},
+        "errors": sum(v for k, v in statuses.items() if k >= 400),
+        "upstream_calls": upstream,
+        "upstream_per_request": round(upstream / requests, 3)
+        if requests else None,
+        "upstream_by_endpoint": dict(fake.calls.most_common()),
+    }
+
+
+def _lookup(results, path):
+    for part in path.split("."):
+        results = (results or {}).get(part)
+    return results
+
+
+def compare(baseline, current, tolerance):
+    """
+    Returns (rows, regressed) where rows are (metric, baseline, current,
+    change in percent) tuples.
+    """
+    rows = []
+    regressed = False
+    for metric, higher_is_better in COMPARED.items():
+        before, after = _lookup(baseline, metric), _lookup(current, metric)
+        if before is None or after is None:
+            continue
+        change = (after - before) / before * 100 if before else 0.0
+        worse = -change if higher_is_better else change
+        if worse > tolerance:
+            regressed = True
+        rows.append((metric, before, after, round(change, 1)))
+    return rows, regressed
+
+
+def baseline_path(name):
+    if os.sep in name or name.endswith(".json"):
+        return name
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+async def main(args):
+    fake = await FakeRenault(
+        latency=args.latency / 1000,
+        jitter=args.jitter / 1000,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        vehicles=args.vehicles,
+        seed=args.seed,
+    ).start()
+    os.environ.update(fake.locale_env())
+    # Keep the run in memory unless told otherwise
+    os.environ.setdefault("RENAULT_HISTORY_PATH", "")
+
+    import api
+
+    if args.trace_memory:
+        tracemalloc.start()
+    try:
+        async with api.app.router.lifespan_context(api.app):
+            results = await run_benchmark(
+                api.app, fake, args.scenario, args.requests,
+                args.concurrency, args.accounts, args.warmup)
+    finally:
+        await fake.close()
+
+    results["upstream"] = {
+        "latency_ms": args.latency,
+        "jitter_ms": args.jitter,
+        "error_rate": args.error_rate,
+        "throttle_rate": args.throttle_rate,
+        "vehicles": args.vehicles,
+    }
+    results["memory"] = {
+        # ru_maxrss is in kilobytes on Linux
+        "rss_max_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+    if api.log_pipeline is not None:
+        results["logging"] = api.log_pipeline.get_stats()
+    if args.trace_memory:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results["memory"]["python_peak_mb"] = round(peak / 2**20, 1)
+        results["memory"]["python_current_mb"] = round(current / 2**20, 1)
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the API against a local fake Renault server.")
+    parser.add_argument("scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--accounts", type=int, default=10,
+                        help="distinct Renault accounts used by the clients")
+    parser.add_argument("--vehicles", type=int, default=1,
+                        help="vehicles per account")
+    parser.add_argument("--warmup", type=int, default=0,
+                        help="requests sent before measuring")
+    parser.add_argument("--latency", type=float, default=50,
+                        help="upstream latency in milliseconds")
+    parser.add_argument("--jitter", type=float, default=0,
+                        help="upstream latency jitter in milliseconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0,
+                        help="share of upstream calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="also report Python allocations (slower)")
+    parser.add_argument("--log-level", default="WARNING",
+                        help="level of the API logs, written to stderr")
+    parser.add_argument("--save", metavar="BASELINE")
+    parser.add_argument("--compare", metavar="BASELINE")
+    parser.add_argument("--tolerance", type=float, default=10.0,
+                        help="allowed regression in percent")
+    return parser.parse_args(argv)
+
+
+def cli(argv=None):
+    args = parse_args(argv)
+    os.environ["RENAULT_LOG_LEVEL"] = args.log_level
+    results = asyncio.run(main(args))
+    print(json.dumps(results, indent=2))
+
+    if args.save:
+        path = baseline_path(args.save)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {path}", file=sys.stderr)
+
+    if args.compare:
+        with open(baseline_path(args.compare)) as f:
+            baseline = json.load(f)
+        rows, regressed = compare(baseline, results, args.tolerance)
+        print(f"{'metric':<22}{'baseline':>12}{'current':>12}{'change':>10}",
+              file=sys.stderr)
+        for metric, before, after, change in rows:
+            print(f"{metric:<22}{before:>12}{after:>12}{change:>+9}%",
+                  file=sys.stderr)
+        if regressed:
+            print(f"Regression above {args.tolerance}%", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -0,0 +1,119 @@
+"""
+Micro-benchmark of the JSON encoding of API responses: FastAPI's
+response_model path (validation, serialization, json.dumps) against the
+prebuilt encoders of myrenault.serialization.
+
+    python -m benchmarks.serialization
+    python -m benchmarks.serialization --iterations 5000 --vehicles 200
+
+Results are printed as JSON, in microseconds of CPU per response. The
+FastAPI path is reproduced with the pydantic TypeAdapter of the response
+model and Starlette's JSONResponse.render(), as serialize_response() does
+for every request.
+"""
+import sys
+import json
+import gzip
+import time
+import argparse
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from myrenault import serialization
+from myrenault.telemetry import BatteryReading, CockpitReading, LocationReading
+
+
+def _battery(i):
+    return BatteryReading(
+        batteryLevel=20 + i % 80, batteryAutonomy=300 - i % 250,
+        chargingStatus=1.0 if i % 3 else 0.0, plugStatus=i % 2,
+        batteryTemperature=18, chargingInstantaneousPower=7.4 * (i % 2),
+        timestamp=f"2024-05-01T08:{i % 60:02d}:00Z")
+
+
+def payloads(vehicles):
+    """Route name -> (response model annotation, body)."""
+    import api
+
+    vins = [f"VF1AG000{i:09d}" for i in range(vehicles)]
+    snapshots = [
+        {"vin": vin, "battery": _battery(i),
+         "cockpit": CockpitReading(totalMileage=12000.5 + i),
+         "location": LocationReading(
+             latitude=48.85 + i / 1000, longitude=2.35 - i / 1000,
+             timestamp="2024-05-01T08:00:00Z"),
+         "errors": {}, "stale": []}
+        for i, vin in enumerate(vins)
+    ]
+    buckets = [
+        {"time": 1714550400 + h * 3600, "count": 12, **{
+            field: {"min": 40.0 + h, "max": 52.0 + h, "avg": 46.1 + h}
+            for field in ("batteryLevel", "batteryAutonomy",
+                          "chargingStatus", "plugStatus",
+                          "batteryTemperature",
+                          "chargingInstantaneousPower")}}
+        for h in range(24)
+    ]
+    return {
+        "battery": (api.BatteryStatusResponse, _battery(1)),
+        "vehicles": (list[api.VehicleResponse], [
+            {"vin": vin, "brand": "RENAULT", "model": "ZOE",
+             "registrationNumber": f"AB-{i:03d}-CD", "energy": "ELEC",
+             "picture": f"https://3dv.renault.com/{vin}.png"}
+            for i, vin in enumerate(vins)]),
+        "snapshots": (list[api.SnapshotResponse], snapshots),
+        "history": (api.HistoryResponse, {
+            "vin": vins[0], "kind": "battery", "start": 1714550400,
+            "end": 1714636800, "step": 3600, "buckets": buckets}),
+    }
+
+
+def _per_call_us(func, value, iterations):
+    started = time.process_time()
+    for _ in range(iterations):
+        func(value)
+    return (time.process_time() - started) / iterations * 10**6
+
+
+def run(iterations=2000, vehicles=50):
+    results = {"orjson": serialization.orjson is not None, "routes": {}}
+    render = JSONResponse(None).render
+    for route, (annotation, body) in payloads(vehicles).items():
+        adapter = TypeAdapter(annotation)
+
+        def fastapi_path(value):
+            return render(adapter.dump_python(
+                adapter.validate_python(value), mode="json"))
+
+        fast_path = serialization.serializer(annotation)
+        expected = fastapi_path(body)
+        encoded = fast_path(body)
+        if json.loads(encoded) != json.loads(expected):
+            raise AssertionError(f"{route}: bodies differ")
+
+        before = _per_call_us(fastapi_path, body, iterations)
+        after = _per_call_us(fast_path, body, iterations)
+        results["routes"][route] = {
+            "bytes": len(encoded),
+            "gzip_bytes": len(gzip.compress(encoded, 5)),
+            "fastapi_us": round(before, 2),
+            "fast_us": round(after, 2),
+            "saved_pct": round((1 - after / before) * 100, 1),
+        }
+    return results
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the JSON encoding of API responses.")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--vehicles", type=int, default=50,
+                        help="vehicles in the list and snapshot bodies")
+    args = parser.parse_args(argv)
+    print(json.dumps(run(args.iterations, args.vehicles), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -0,0 +1,333 @@
+import math
+import time
+import logging
+import datetime
+import threading
+from collections import OrderedDict, deque
+
+from myrenault.history import FIELDS
+from myrenault.poller import CHARGING_STATUSES
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+# Two charging readings further apart than this belong to two sessions
+SESSION_GAP = 6 * 3600  # seconds
+DAY = 86400
+
+LEVEL = FIELDS["battery"].index("batteryLevel")
+STATUS = FIELDS["battery"].index("chargingStatus")
+POWER = FIELDS["battery"].index("chargingInstantaneousPower")
+
+
+def to_arrays(rows):
+    """(ts, values) rows to a timestamp array and a 2-D float array."""
+    # Imported on first use, not when the app starts (see lazy.DEFERRED)
+    import numpy as np
+    ts = np.fromiter((row[0] for row in rows), dtype=np.int64,
+                     count=len(rows))
+    # None becomes NaN
+    values = np.array([row[1] for row in rows], dtype=float)
+    return ts, values.reshape(len(rows), -1)
+
+
+def segment_sessions(ts, level, status, power, gap=SESSION_GAP):
+    """
+    Splits battery readings into charging sessions: runs of consecutive
+    charging readings, broken when two of them are more than `gap`
+    seconds apart or the level drops between them.
+
+    Returns a dict of arrays, one item per session: `first` and `last`
+    (indices of its first and last reading), `energy` (kWh, integrated
+    from the charging power; NaN when a power reading is missing) and
+    `max_power` (kW, NaN if unknown).
+    """
+    import numpy as np
+    charging = np.isin(status, CHARGING_STATUSES)
+    dt = np.diff(ts)
+    # Reading i and i + 1 belong to the same session
+    linked = (charging[:-1] & charging[1:] & (dt <= gap)
+              & ~(np.diff(level) < 0))
+    first = np.flatnonzero(charging & ~np.concatenate(([False], linked)))
+    last = np.flatnonzero(charging & ~np.concatenate((linked, [False])))
+
+    # Trapezoidal integration of the power over the links of each session,
+    # as differences of cumulative sums
+    step = np.where(linked, (power[:-1] + power[1:]) / 2 * dt / 3600, 0.0)
+    missing = np.isnan(step)
+    energy = np.concatenate(([0.0], np.cumsum(np.where(missing, 0.0, step))))
+    gaps = np.concatenate(([0], np.cumsum(missing)))
+    session_energy = energy[last] - energy[first]
+    incomplete = (gaps[last] != gaps[first]) | (last == first)
+    session_energy[incomplete] = np.nan
+
+    max_power = np.full(len(first), np.nan)
+    if len(first):
+        # Readings between two sessions are not charging: masked out
+        masked = np.where(charging & ~np.isnan(power), power, -np.inf)
+        max_power = np.maximum.reduceat(masked, first)
+        max_power[np.isinf(max_power)] = np.nan
+    return {"first": first, "last": last, "energy": session_energy,
+            "max_power": max_power}
+
+
+def driving_usage(ts, level, status):
+    """
+    Battery percentage used between consecutive readings while not
+    charging, as (timestamps of the later readings, percentages).
+    """
+    import numpy as np
+    charging = np.isin(status, CHARGING_STATUSES)
+    drop = -np.diff(level)
+    used = ~charging[:-1] & ~charging[1:] & (drop > 0)
+    return ts[1:][used], drop[used]
+
+
+def _none(value, digits=2):
+    return None if value is None or math.isnan(value) else round(
+        float(value), digits)
+
+
+def _day(ts):
+    return datetime.datetime.fromtimestamp(
+        ts * DAY, datetime.timezone.utc).date().isoformat()
+
+
+class _Vehicle:
+    """Analytics of one vehicle, updated with the readings since last time."""
+
+    __slots__ = ("battery_ts", "carry", "sessions", "ongoing", "cockpit_ts",
+                 "mileage", "days", "max_days")
+
+    def __init__(self, max_sessions, max_days):
+        self.battery_ts = None  # newest battery reading processed
+        self.carry = []  # readings processed again on the next update
+        self.sessions = deque(maxlen=max_sessions)  # closed sessions
+        self.ongoing = None
+        self.cockpit_ts = None
+        self.mileage = None  # latest totalMileage
+        # UTC day number -> [km, battery % used, kWh charged, % charged
+        # by sessions without power readings]
+        self.days = OrderedDict()
+        self.max_days = max_days
+
+    def day(self, number):
+        totals = self.days.get(number)
+        if totals is None:
+            totals = self.days[number] = [0.0, 0.0, 0.0, 0.0]
+            if len(self.days) > self.max_days:
+                # Out-of-order days are rare: trimming the oldest inserted
+                self.days.popitem(last=False)
+        return totals
+
+
+class ChargingAnalytics:
+    """
+    Charging sessions and energy use of each vehicle, computed from the
+    stored battery and cockpit readings (`source`: a HistoryStore or a
+    SampleStore, anything with samples(kind, vin, start, end)).
+
+    Each update only reads and processes the readings newer than those
+    already seen, with NumPy passes over the new rows: closed sessions and
+    daily totals are kept, and only the readings of a session still in
+    progress are processed again next time. Readings stored late with an
+    older timestamp than the ones processed are not taken into account.
+
+    Energy charged is integrated from chargingInstantaneousPower when
+    every reading of a session has it, and otherwise estimated from the
+    battery level gained and the battery capacity given at query time.
+    Energy used for driving is the battery level lost while not charging.
+    """
+
+    def __init__(self, source, max_vehicles=20000, max_sessions=500,
+                 max_days=400, gap=SESSION_GAP):
+        self.source = source
+        self.max_vehicles = max_vehicles
+        self.max_sessions = max_sessions
+        self.max_days = max_days
+        self.gap = gap
+        self._vehicles = OrderedDict()  # VIN -> _Vehicle
+        # Updates run in worker threads with a history database
+        self._lock = threading.Lock()
+        self.stats = {
+            "updates": 0,
+            "readings": 0,
+            "sessions": 0
+        }
+
+    def __len__(self):
+        return len(self._vehicles)
+
+    def get_stats(self):
+        return {"vehicles": len(self._vehicles), **self.stats}
+
+    def clear(self):
+        with self._lock:
+            self._vehicles.clear()
+
+    def sessions(self, vin, capacity, limit=50):
+        """The last `limit` charging sessions of `vin`, newest last."""
+        with self._lock:
+            vehicle = self._update(vin)
+            sessions = list(vehicle.sessions)
+            if vehicle.ongoing is not None:
+                sessions.append(vehicle.ongoing)
+        return [self._session(s, capacity) for s in sessions[-limit:]]
+
+    def efficiency(self, vin, capacity, days=30, now=None):
+        """Distance, energy used and charged over the last `days` days."""
+        with self._lock:
+            vehicle = self._update(vin)
+            today = int((time.time() if now is None else now) // DAY)
+            window = [(number, list(totals))
+                      for number, totals in vehicle.days.items()
+                      if number > today - days]
+        window.sort()
+
+        daily = []
+        for number, (km, used, charged, charged_pct) in window:
+            daily.append({
+                "date": _day(number),
+                "distance_km": round(km, 1),
+                "energy_used_kwh": round(used / 100 * capacity, 2),
+                "energy_charged_kwh": round(
+                    charged + charged_pct / 100 * capacity, 2),
+            })
+        distance = sum(d["distance_km"] for d in daily)
+        used = sum(d["energy_used_kwh"] for d in daily)
+        return {
+            "vin": vin,
+            "days": days,
+            "battery_capacity": capacity,
+            "distance_km": round(distance, 1),
+            "energy_used_kwh": round(used, 2),
+            "energy_charged_kwh": round(
+                sum(d["energy_charged_kwh"] for d in daily), 2),
+            "consumption_kwh_per_100km": (
+                round(used / distance * 100, 1) if distance > 0 else None),
+            "daily": daily,
+        }
+
+    def _session(self, session, capacity):
+        energy = session["energy"]
+        source = "power"
+        if energy is None:
+            source = "level"
+            if None not in (session["start_level"], session["end_level"]):
+                gained = session["end_level"] - session["start_level"]
+                energy = round(max(0.0, gained) / 100 * capacity, 2)
+        duration = session["end"] - session["start"]
+        return {
+            "start": session["start"],
+            "end": session["end"],
+            "duration": duration,
+            "start_level": session["start_level"],
+            "end_level": session["end_level"],
+            "energy_kwh": energy,
+            "energy_source": source,
+            "average_power_kw": (round(energy / duration * 3600, 2)
+                                 if duration and energy is not None
+                                 else None),
+            "max_power_kw": session["max_power"],
+            "readings": session["readings"],
+            "ongoing": session.get("ongoing", False),
+        }
+
+    def _vehicle(self, vin):
+        vehicle = self._vehicles.get(vin)
+        if vehicle is None:
+            vehicle = self._vehicles[vin] = _Vehicle(
+                self.max_sessions, self.max_days)
+            while len(self._vehicles) > self.max_vehicles:
+                self._vehicles.popitem(last=False)
+        self._vehicles.move_to_end(vin)
+        return vehicle
+
+    def _update(self, vin):
+        vehicle = self._vehicle(vin)
+        self.stats["updates"] += 1
+        self._update_battery(vin, vehicle)
+        self._update_cockpit(vin, vehicle)
+        return vehicle
+
+    def _update_battery(self, vin, vehicle):
+        import numpy as np
+        start = (vehicle.battery_ts + 1 if vehicle.battery_ts is not None
+                 else None)
+        new = self.source.samples("battery", vin, start)
+        if not new:
+            return
+        self.stats["readings"] += len(new)
+        rows = vehicle.carry + new
+        ts, values = to_arrays(rows)
+        level = values[:, LEVEL]
+        status = values[:, STATUS]
+        found = segment_sessions(ts, level, status, values[:, POWER],
+                                 self.gap)
+
+        # Battery used while driving, per day (carried readings are either
+        # the last one or a session in progress: never counted twice)
+        used_ts, used = driving_usage(ts, level, status)
+        days, index = np.unique(used_ts // DAY, return_inverse=True)
+        for number, total in zip(days.tolist(),
+                                 np.bincount(index, used).tolist()):
+            vehicle.day(number)[1] += total
+
+        vehicle.ongoing = None
+        last_row = len(rows) - 1
+        for i in range(len(found["first"])):
+            first, last = int(found["first"][i]), int(found["last"][i])
+            energy = found["energy"][i]
+            session = {
+                "start": int(ts[first]),
+                "end": int(ts[last]),
+                "start_level": _none(level[first], 1),
+                "end_level": _none(level[last], 1),
+                "energy": _none(energy),
+                "max_power": _none(found["max_power"][i]),
+                "readings": last - first + 1,
+            }
+            if last == last_row:
+                # May go on with the next readings
+                session["ongoing"] = True
+                vehicle.ongoing = session
+                continue
+            vehicle.sessions.append(session)
+            self.stats["sessions"] += 1
+            totals = vehicle.day(session["start"] // DAY)
+            if session["energy"] is not None:
+                totals[2] += session["energy"]
+            elif None not in (session["start_level"], session["end_level"]):
+                totals[3] += max(
+                    0.0, session["end_level"] - session["start_level"])
+
+        carry_from = (int(found["first"][-1]) if vehicle.ongoing is not None
+                      else last_row)
+        vehicle.carry = rows[carry_from:]
+        vehicle.battery_ts = int(ts[-1])
+
+    def _update_cockpit(self, vin, vehicle):
+        import numpy as np
+        start = (vehicle.cockpit_ts + 1 if vehicle.cockpit_ts is not None
+                 else None)
+        new = self.source.samples("cockpit", vin, start)
+        if not new:
+            return
+        self.stats["readings"] += len(new)
+        ts, values = to_arrays(new)
+        mileage = values[:, 0]
+        known = ~np.isnan(mileage)
+        ts, mileage = ts[known], mileage[known]
+        vehicle.cockpit_ts = int(new[-1][0])
+        if not len(mileage):
+            return
+        previous = vehicle.mileage if vehicle.mileage is not None \
+            else mileage[0]
+        # Odometer glitches (lower readings) count as no distance
+        distance = np.clip(np.diff(mileage, prepend=previous), 0, None)
+        days, index = np.unique(ts // DAY, return_inverse=True)
+        for number, total in zip(days.tolist(),
+                                 np.bincount(index, distance).tolist()):
+            vehicle.day(number)[0] += total
+        vehicle.mileage = float(mileage[-1])
+
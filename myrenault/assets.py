@@ -0,0 +1,161 @@
+import os
+import zlib
+import asyncio
+import hashlib
+import logging
+import mimetypes
+
+from fastapi.responses import Response
+
+from myrenault.compression import brotli, negotiate
+from myrenault.fingerprints import Fingerprint, not_modified
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+# Versioned URLs (?v=<version>) always serve the same content
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Other URLs are revalidated with the ETag on each use
+REVALIDATE = "no-cache"
+
+
+class _Asset:
+    __slots__ = ("media_type", "version", "bodies")
+
+    def __init__(self, media_type, version, bodies):
+        self.media_type = media_type
+        self.version = version
+        # Content-Encoding (None for identity) -> (body, ETag), or None
+        # when that encoding is not smaller than the file
+        self.bodies = bodies
+
+
+def _encode(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+class StaticAssets:
+    """
+    Files of `directory`, read once when created and served from memory.
+
+    A file is compressed with one of the `encodings` this process supports
+    the first time a client asks for it in that encoding, in a worker
+    thread and at the highest level since it is done once, and kept;
+    startup only reads and hashes the files. An encoding is only used when smaller than the file. Every
+    encoding has its own strong ETag, derived from a hash of the file (its
+    version).
+
+    url() gives the versioned URL of a file: served with immutable caching
+    headers, since a new version of the file gets a new URL. Unversioned
+    URLs (the index page) are revalidated by clients, which get a 304 as
+    long as the file is unchanged.
+    """
+
+    def __init__(self, directory, encodings=("br", "gzip")):
+        self.directory = directory
+        self.encodings = tuple(encodings)
+        self._assets = {}  # Path relative to directory -> _Asset
+        self._compressing = {}  # (version, encoding) -> compression task
+        self.stats = {
+            "served": 0,
+            "not_modified": 0,
+            "bytes_sent": 0
+        }
+        self.load()
+
+    def __len__(self):
+        return len(self._assets)
+
+    def get_stats(self):
+        return {"assets": len(self._assets), **self.stats}
+
+    def load(self):
+        assets = {}
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                path = os.path.join(root, filename)
+                with open(path, "rb") as f:
+                    data = f.read()
+                name = os.path.relpath(path, self.directory).replace(
+                    os.sep, "/")
+                assets[name] = self._build(name, data)
+        self._assets = assets
+        logger.info("Loaded %d static assets from %s", len(assets),
+                    self.directory)
+
+    def _build(self, name, data):
+        version = hashlib.blake2b(data, digest_size=16).hexdigest()
+        media_type = mimetypes.guess_type(name)[0] or \
+            "application/octet-stream"
+        if media_type.startswith("text/"):
+            media_type += "; charset=utf-8"
+        return _Asset(media_type, version, {None: (data, f'"{version}"')})
+
+    async def _body(self, asset, encoding):
+        """(body, ETag) of `asset` in `encoding`, or None if not smaller."""
+        if encoding not in asset.bodies:
+            data = asset.bodies[None][0]
+            # Compressed in a thread, so the event loop keeps serving; the
+            # requests arriving meanwhile wait for the same compression
+            key = (asset.version, encoding)
+            task = self._compressing.get(key)
+            if task is None:
+                task = self._compressing[key] = asyncio.ensure_future(
+                    asyncio.to_thread(_encode, data, encoding))
+            try:
+                encoded = await task
+            finally:
+                self._compressing.pop(key, None)
+            asset.bodies[encoding] = (
+                (encoded, f'"{asset.version}-{encoding}"')
+                if len(encoded) < len(data) else None)
+        return asset.bodies[encoding]
+
+    async def _negotiate(self, asset, accept_encoding):
+        """The encoding to send `asset` in, compressed on first use."""
+        while True:
+            # Encodings found no smaller than the file are left out
+            encoding = negotiate(accept_encoding, [
+                e for e in self.encodings
+                if asset.bodies.get(e, True) is not None])
+            if encoding is None or \
+                    await self._body(asset, encoding) is not None:
+                return encoding
+
+    def url(self, name):
+        asset = self._assets.get(name)
+        if asset is None:
+            return None
+        return f"/static/{name}?v={asset.version}"
+
+    async def response(self, name, accept_encoding="", if_none_match=None,
+                       version=None, head=False):
+        """The response serving `name`, or None if there is no such file."""
+        asset = self._assets.get(name)
+        if asset is None:
+            return None
+        encoding = await self._negotiate(asset, accept_encoding) \
+            if accept_encoding else None
+        body, etag = asset.bodies[encoding]
+        headers = {
+            "ETag": etag,
+            "Cache-Control": (IMMUTABLE if version == asset.version
+                              else REVALIDATE),
+            "Vary": "Accept-Encoding",
+        }
+        if not_modified(Fingerprint(etag, None), if_none_match):
+            self.stats["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        self.stats["served"] += 1
+        if head:
+            headers["Content-Length"] = str(len(body))
+            body = b""
+        self.stats["bytes_sent"] += len(body)
+        return Response(content=body, media_type=asset.media_type,
+                        headers=headers)
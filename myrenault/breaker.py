@@ -0,0 +1,199 @@
+import time
+import asyncio
+import logging
+from collections import deque
+
+from myrenault.governor import UpstreamBusyError
+from myrenault.lazy import lazy_import
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+aiohttp = lazy_import("aiohttp")
+kamereon = lazy_import("renault_api.kamereon")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitOpenError(UpstreamBusyError):
+    """Raised without calling upstream while an operation's circuit is open."""
+
+
+def is_upstream_failure(error):
+    """
+    Whether an error says the upstream is unhealthy, as opposed to a bad
+    request (unknown VIN, wrong password) or throttling, which the
+    governor deals with.
+    """
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status >= 500
+    return isinstance(error, (
+        asyncio.TimeoutError,
+        aiohttp.ClientError,
+        kamereon.exceptions.InvalidUpstreamException,
+        kamereon.exceptions.FailedForwardException,
+    ))
+
+
+class _Circuit:
+    def __init__(self):
+        self.state = CLOSED
+        self.outcomes = deque()  # (monotonic time, failed) in the window
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        # Smoothed latency and deviation, as for TCP retransmission timers
+        self.latency = None
+        self.deviation = 0.0
+
+    def observe(self, duration):
+        if self.latency is None:
+            self.latency = duration
+            self.deviation = duration / 2
+        else:
+            self.deviation += (abs(duration - self.latency)
+                               - self.deviation) / 4
+            self.latency += (duration - self.latency) / 8
+
+    def trim(self, now, window):
+        while self.outcomes and now - self.outcomes[0][0] > window:
+            _, failed = self.outcomes.popleft()
+            self.failures -= failed
+
+
+class CircuitBreaker:
+    """
+    Per-operation circuit breaker for upstream calls.
+
+    A circuit opens when, over the last `window` seconds, at least
+    `min_calls` calls were made and `error_rate` of them failed (see
+    is_upstream_failure). While open, calls fail immediately with
+    CircuitOpenError. After `open_seconds` a single probe call is let
+    through (half-open): its success closes the circuit, its failure opens
+    it again.
+
+    Each operation also gets its own timeout, derived from its observed
+    latency (smoothed latency + 4 deviations, as TCP does for
+    retransmissions) and bounded by `min_timeout` and `max_timeout`.
+    """
+
+    def __init__(self, window=60, min_calls=10, error_rate=0.5,
+                 open_seconds=30, min_timeout=5.0, max_timeout=30.0):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self._circuits = {}  # operation -> _Circuit
+        self.stats = {
+            "opened": 0,
+            "short_circuited": 0,
+            "timeouts": 0
+        }
+
+    def get_stats(self):
+        return {
+            "open": sum(c.state != CLOSED for c in self._circuits.values()),
+            **self.stats,
+            "operations": {
+                operation: {
+                    "state": circuit.state,
+                    "calls": len(circuit.outcomes),
+                    "failures": circuit.failures,
+                    "timeout": round(self.timeout(operation), 3)
+                }
+                for operation, circuit in self._circuits.items()
+            }
+        }
+
+    def state(self, operation):
+        circuit = self._circuits.get(operation)
+        return circuit.state if circuit else CLOSED
+
+    def clear(self):
+        self._circuits.clear()
+
+    def timeout(self, operation):
+        circuit = self._circuits.get(operation)
+        if circuit is None or circuit.latency is None:
+            return self.max_timeout
+        timeout = circuit.latency + 4 * circuit.deviation
+        return min(self.max_timeout, max(self.min_timeout, timeout))
+
+    async def call(self, operation, func, *args):
+        """Runs `func(*args)` under the circuit and timeout of `operation`."""
+        circuit = self._before(operation)
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(
+                func(*args), self.timeout(operation))
+        except asyncio.CancelledError:
+            circuit.probing = False
+            raise
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                self.stats["timeouts"] += 1
+            self._record(operation, circuit, is_upstream_failure(e))
+            raise
+        circuit.observe(time.monotonic() - started)
+        self._record(operation, circuit, False)
+        return result
+
+    def check(self, operation):
+        """Fails fast with CircuitOpenError if a call would be rejected."""
+        circuit = self._circuits.get(operation)
+        if circuit is not None and circuit.state != CLOSED:
+            if circuit.probing or not self._probe_due(circuit):
+                self._reject(operation, circuit)
+
+    def _before(self, operation):
+        circuit = self._circuits.setdefault(operation, _Circuit())
+        if circuit.state == CLOSED:
+            return circuit
+        if circuit.probing or not self._probe_due(circuit):
+            self._reject(operation, circuit)
+        circuit.state = HALF_OPEN
+        circuit.probing = True
+        return circuit
+
+    def _probe_due(self, circuit):
+        return time.monotonic() - circuit.opened_at >= self.open_seconds
+
+    def _reject(self, operation, circuit):
+        self.stats["short_circuited"] += 1
+        retry_after = max(
+            1, self.open_seconds - (time.monotonic() - circuit.opened_at))
+        raise CircuitOpenError(
+            f"Renault API unavailable ({operation}), retry later",
+            retry_after)
+
+    def _record(self, operation, circuit, failed):
+        now = time.monotonic()
+        if circuit.state == HALF_OPEN:
+            circuit.probing = False
+            if failed:
+                self._open(operation, circuit, now)
+            else:
+                logger.info("Circuit of %s closed again", operation)
+                circuit.state = CLOSED
+                circuit.outcomes.clear()
+                circuit.failures = 0
+            return
+
+        circuit.outcomes.append((now, failed))
+        circuit.failures += failed
+        circuit.trim(now, self.window)
+        calls = len(circuit.outcomes)
+        if (circuit.state == CLOSED and calls >= self.min_calls
+                and circuit.failures >= self.error_rate * calls):
+            self._open(operation, circuit, now)
+
+    def _open(self, operation, circuit, now):
+        logger.warning("Circuit of %s opened for %ss after upstream failures",
+                       operation, self.open_seconds)
+        circuit.state = OPEN
+        circuit.opened_at = now
+        self.stats["opened"] += 1
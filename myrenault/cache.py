@@ -0,0 +1,102 @@
+import time
+import logging
+from collections import OrderedDict, namedtuple
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+# Seconds a reading stays fresh. The car only pushes new telemetry every
+# few minutes, so re-reading it more often mostly returns the same payload.
+DEFAULT_TTLS = {
+    "battery": 120,
+    "cockpit": 600,
+    "location": 120,
+    "vehicles": 3600
+}
+
+# `stale` marks a reading older than requested, served because upstream is
+# unavailable
+CacheResult = namedtuple(
+    "CacheResult", ["value", "from_cache", "age", "stale"], defaults=(False,))
+
+
+class ResponseCache:
+    """
+    In-memory cache of upstream readings keyed by (account, VIN, kind).
+
+    Each kind has its own TTL; the number of entries is bounded and the
+    least recently used ones are evicted first. Expired entries are kept
+    until evicted, as the last known value to fall back on (get_stale).
+    """
+
+    def __init__(self, ttls=None, max_entries=4096):
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "stale": 0,
+            "evictions": 0
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_stats(self):
+        return {"size": len(self._entries), **self.stats}
+
+    def ttl(self, kind):
+        return self.ttls.get(kind, 0)
+
+    def get(self, key, max_age=None):
+        """
+        Returns a CacheResult for `key` if it is younger than both the TTL
+        of its kind and `max_age` (in seconds), otherwise None.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+
+        stored_at, value = entry
+        age = time.monotonic() - stored_at
+        if age > self.ttl(key[-1]) or (max_age is not None and age > max_age):
+            self.stats["misses"] += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return CacheResult(value, True, age)
+
+    def get_stale(self, key, max_stale):
+        """
+        Returns the last value stored for `key`, whatever its TTL, if it is
+        at most `max_stale` seconds old, otherwise None.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        age = time.monotonic() - stored_at
+        if age > max_stale:
+            return None
+        self.stats["stale"] += 1
+        return CacheResult(value, True, age, True)
+
+    def set(self, key, value, age=0.0):
+        """Stores `value`, read `age` seconds ago (e.g. by another worker)."""
+        if self.ttl(key[-1]) <= 0:
+            return
+        self._entries[key] = (time.monotonic() - age, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def invalidate(self, account_key, vin, kinds):
+        for kind in kinds:
+            self._entries.pop((account_key, vin, kind), None)
+
+    def clear(self):
+        self._entries.clear()
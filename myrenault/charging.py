@@ -0,0 +1,512 @@
+import os
+import json
+import time
+import uuid
+import heapq
+import random
+import asyncio
+import sqlite3
+import logging
+import datetime
+import threading
+from zoneinfo import ZoneInfo
+
+from myrenault.poller import CHARGING_STATUSES
+from myrenault.pool import credentials_key
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+# Schedule statuses
+WAITING = "waiting"  # for the next off-peak window
+CHARGING = "charging"
+COMPLETED = "completed"  # target reached
+MISSED = "missed"  # deadline passed below the target
+FINISHED = (COMPLETED, MISSED)
+
+# Charging slows down near full: plan this much more time than the
+# energy needed at full power
+CHARGE_MARGIN = 1.15
+# Seconds between two battery checks while charging, so that the plan
+# follows the actual charging speed
+RECHECK_INTERVAL = 1800
+# Seconds before a failed check of a schedule is retried
+RETRY_DELAY = 300
+
+
+def parse_window(window):
+    """Parses a daily "HH:MM-HH:MM" window into minutes since midnight."""
+    try:
+        start, end = window.split("-")
+        minutes = []
+        for part in (start, end):
+            hours, mins = part.strip().split(":")
+            value = int(hours) * 60 + int(mins)
+            # 24:00 (end of the day) is the only time with hour 24
+            if not (0 <= int(mins) < 60 and 0 <= value <= 24 * 60):
+                raise ValueError
+            minutes.append(value)
+    except ValueError:
+        raise ValueError(f"Invalid window {window!r}, expected HH:MM-HH:MM")
+    if minutes[0] == minutes[1]:
+        raise ValueError(f"Empty window {window!r}")
+    return tuple(minutes)
+
+
+def window_intervals(windows, timezone, start, end):
+    """
+    Occurrences of the daily `windows` (as parsed by parse_window, in
+    `timezone`) between the epoch times `start` and `end`, as sorted and
+    merged (start, end) pairs. A window ending before it starts runs past
+    midnight.
+    """
+    tz = ZoneInfo(timezone)
+    day = datetime.datetime.fromtimestamp(start, tz).date()
+    last_day = datetime.datetime.fromtimestamp(end, tz).date()
+    day -= datetime.timedelta(days=1)  # Window started the day before
+    intervals = []
+    while day <= last_day:
+        midnight = datetime.datetime.combine(day, datetime.time(), tz)
+        for open_at, close_at in windows:
+            if close_at <= open_at:
+                close_at += 24 * 60
+            opened = (midnight + datetime.timedelta(minutes=open_at))
+            closed = (midnight + datetime.timedelta(minutes=close_at))
+            lower = max(start, opened.timestamp())
+            upper = min(end, closed.timestamp())
+            if lower < upper:
+                intervals.append((lower, upper))
+        day += datetime.timedelta(days=1)
+    return merge(intervals)
+
+
+def merge(intervals):
+    merged = []
+    for lower, upper in sorted(intervals):
+        if merged and lower <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], upper))
+        else:
+            merged.append((lower, upper))
+    return merged
+
+
+def charge_duration(level, target, capacity, power):
+    """Seconds of charging from `level` to `target` percent."""
+    if level is None or level >= target or power <= 0:
+        return 0.0
+    energy = (target - level) / 100 * capacity  # kWh
+    return energy / power * 3600 * CHARGE_MARGIN
+
+
+def plan_charge(now, deadline, duration, windows, timezone):
+    """
+    Periods to charge for `duration` seconds before `deadline`: the first
+    off-peak windows, then, if they are too short, as soon as possible
+    outside of them. Returns merged (start, end) pairs.
+    """
+    if duration <= 0 or now >= deadline:
+        return []
+    plan = []
+    remaining = duration
+    offpeak = window_intervals(windows, timezone, now, deadline)
+    for lower, upper in offpeak:
+        if remaining <= 0:
+            break
+        upper = min(upper, lower + remaining)
+        plan.append((lower, upper))
+        remaining -= upper - lower
+
+    # Not enough off-peak time: fill the gaps between windows
+    cursor = now
+    for lower, upper in offpeak + [(deadline, deadline)]:
+        if remaining <= 0:
+            break
+        gap = min(lower, cursor + remaining) - cursor
+        if gap > 0:
+            plan.append((cursor, cursor + gap))
+            remaining -= gap
+        cursor = upper
+    return merge(plan)
+
+
+class ChargeSchedule:
+    def __init__(self, email, password, vin, target, deadline, windows,
+                 timezone="UTC", capacity=52.0, power=7.4, id=None,
+                 status=WAITING, created_at=None):
+        self.id = id or uuid.uuid4().hex
+        self.account_key = credentials_key(email, password)
+        self.vin = vin.strip().upper()
+        self.target = target  # percent
+        self.deadline = deadline  # epoch seconds
+        self.windows = list(windows)  # "HH:MM-HH:MM", in `timezone`
+        self.timezone = timezone
+        self.capacity = capacity  # kWh
+        self.power = power  # kW, updated with the observed charging power
+        self.status = status
+        self.created_at = created_at or time.time()
+        self.level = None  # last batteryLevel seen
+        self.checked_at = None
+        self.plan = []
+        self.next_check = None
+        self.last_command = None
+        self.error = None
+        # Kept to send the commands; also persisted (see ScheduleStore)
+        self._credentials = (email, password)
+        self._parsed = [parse_window(w) for w in self.windows]
+        self._timer = 0  # version of the latest timer of the schedule
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "vin": self.vin,
+            "target_soc": self.target,
+            "deadline": self.deadline,
+            "windows": self.windows,
+            "timezone": self.timezone,
+            "battery_capacity": self.capacity,
+            "charge_power": self.power,
+            "status": self.status,
+            "battery_level": self.level,
+            "plan": [{"start": lower, "end": upper}
+                     for lower, upper in self.plan],
+            "next_check": self.next_check,
+            "checked_at": self.checked_at,
+            "last_command": self.last_command,
+            "error": self.error,
+            "created_at": self.created_at,
+        }
+
+
+class ScheduleStore:
+    """
+    Charge schedules persisted in SQLite, so that they survive restarts.
+    The commands need the credentials of each schedule: passwords are
+    stored encrypted by `box` (a SecretBox), and the file is only readable
+    by its owner. Calls are synchronous and meant to run in a worker thread.
+    """
+
+    COLUMNS = ("id", "email", "secret", "vin", "target", "deadline",
+               "windows", "timezone", "capacity", "power", "status",
+               "created_at")
+
+    def __init__(self, path, box):
+        if box is None:
+            raise ValueError(
+                "Persisting charge schedules needs a SecretBox to encrypt "
+                "passwords (set RENAULT_SECRET_KEY)")
+        self.path = path
+        self.box = box
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def load(self):
+        rows = self._connection().execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM schedules").fetchall()
+        schedules = []
+        for row in rows:
+            values = dict(zip(self.COLUMNS, row))
+            try:
+                values["password"] = self.box.open(values.pop("secret"))
+            except ValueError:
+                logger.warning("Ignoring charge schedule %s: its password "
+                               "cannot be decrypted with the current "
+                               "secret key.", values["id"])
+                continue
+            values["windows"] = json.loads(values["windows"])
+            schedules.append(ChargeSchedule(**values))
+        return schedules
+
+    def save(self, schedule):
+        email, password = schedule._credentials
+        row = (schedule.id, email, self.box.seal(password), schedule.vin,
+               schedule.target, schedule.deadline,
+               json.dumps(schedule.windows), schedule.timezone,
+               schedule.capacity, schedule.power, schedule.status,
+               schedule.created_at)
+        placeholders = ", ".join("?" * len(self.COLUMNS))
+        with self._lock, self._connection() as conn:
+            # Columns named: migrated files have them in another order
+            conn.execute(
+                f"INSERT OR REPLACE INTO schedules ({', '.join(self.COLUMNS)})"
+                f" VALUES ({placeholders})", row)
+
+    def delete(self, schedule_id):
+        with self._lock, self._connection() as conn:
+            conn.execute("DELETE FROM schedules WHERE id = ?", (schedule_id,))
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            # Created private; SQLite gives its journal the same mode
+            os.close(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600))
+            os.chmod(self.path, 0o600)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS schedules ("
+                "id TEXT PRIMARY KEY, email TEXT, secret TEXT, vin TEXT, "
+                "target REAL, deadline REAL, windows TEXT, timezone TEXT, "
+                "capacity REAL, power REAL, status TEXT, created_at REAL)")
+            conn.commit()
+            self._encrypt_passwords(conn)
+            self._conn = conn
+        return self._conn
+
+    def _encrypt_passwords(self, conn):
+        # Files written by older versions hold plain passwords
+        columns = [row[1] for row in conn.execute(
+            "PRAGMA table_info(schedules)")]
+        if "password" not in columns:
+            return
+        with conn:
+            conn.execute("ALTER TABLE schedules ADD COLUMN secret TEXT")
+            rows = conn.execute(
+                "SELECT id, password FROM schedules").fetchall()
+            for id_, password in rows:
+                conn.execute("UPDATE schedules SET secret = ? WHERE id = ?",
+                             (self.box.seal(password), id_))
+            conn.execute("ALTER TABLE schedules DROP COLUMN password")
+        # Also wipe the plain passwords from the free pages of the file
+        conn.execute("VACUUM")
+        logger.info("Encrypted the passwords of %d charge schedules",
+                    len(rows))
+
+
+class ChargeScheduler:
+    """
+    Charges vehicles to a target state of charge by a deadline, during
+    off-peak windows when they are long enough.
+
+    Each schedule is checked when its plan says charging should start or
+    stop (and every RECHECK_INTERVAL while charging): the battery is read,
+    the plan is worked out again from the current level and charging
+    power, and charge_start or charge_stop is submitted to the job queue
+    when the vehicle is not in the planned state. Vehicles charging on
+    their own outside of the plan (e.g. when plugged in) are stopped.
+
+    Checks are timers in a heap, consumed by a single task sleeping until
+    the earliest one, so idle schedules cost no CPU. Checks due at the same
+    time run in batches of `batch_size`, `batch_interval` seconds apart,
+    so that thousands of vehicles sharing an off-peak window do not hit
+    Renault at once.
+    """
+
+    def __init__(self, client_factory, jobs, store=None, batch_size=20,
+                 batch_interval=1.0):
+        self.client_factory = client_factory
+        self.jobs = jobs
+        self.store = store
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self._schedules = {}  # (account key, VIN) -> ChargeSchedule
+        self._timers = []  # heap of (due, version, account key, VIN)
+        self._wakeup = None
+        self._task = None
+        self._loaded = store is None
+        self.stats = {
+            "checks": 0,
+            "commands": 0,
+            "batches": 0,
+            "failures": 0,
+            "completed": 0,
+            "missed": 0
+        }
+
+    def __len__(self):
+        return len(self._schedules)
+
+    def get_stats(self):
+        return {"schedules": len(self._schedules),
+                "timers": len(self._timers), **self.stats}
+
+    def get(self, email, password, vin):
+        return self._schedules.get(
+            (credentials_key(email, password), vin.strip().upper()))
+
+    async def add(self, email, password, vin, target, deadline, windows,
+                  timezone="UTC", capacity=52.0, power=7.4):
+        """
+        Registers the schedule of a vehicle, replacing any previous one,
+        and checks it right away.
+        """
+        await self._load()
+        schedule = ChargeSchedule(email, password, vin, target, deadline,
+                                  windows, timezone, capacity, power)
+        previous = self._schedules.get((schedule.account_key, schedule.vin))
+        if previous is not None:
+            previous._timer += 1
+            if self.store is not None:
+                await asyncio.to_thread(self.store.delete, previous.id)
+        self._schedules[(schedule.account_key, schedule.vin)] = schedule
+        await self._save(schedule)
+        await self._check(schedule)
+        return schedule
+
+    async def remove(self, email, password, vin):
+        await self._load()
+        schedule = self._schedules.pop(
+            (credentials_key(email, password), vin.strip().upper()), None)
+        if schedule is None:
+            return None
+        schedule._timer += 1  # Its pending timers are ignored
+        if self.store is not None:
+            await asyncio.to_thread(self.store.delete, schedule.id)
+        return schedule
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.store is not None:
+            await asyncio.to_thread(self.store.close)
+
+    def clear(self):
+        self._schedules.clear()
+        self._timers.clear()
+
+    async def run_due(self, now=None):
+        """Checks, in batches, every schedule whose timer is due."""
+        now = time.time() if now is None else now
+        due = []
+        while self._timers and self._timers[0][0] <= now:
+            _, version, account_key, vin = heapq.heappop(self._timers)
+            schedule = self._schedules.get((account_key, vin))
+            if schedule is not None and schedule._timer == version:
+                due.append(schedule)
+
+        for i in range(0, len(due), self.batch_size):
+            if i:
+                await asyncio.sleep(self.batch_interval)
+            self.stats["batches"] += 1
+            await asyncio.gather(
+                *(self._check(s, now) for s in due[i:i + self.batch_size]))
+
+    async def _run(self):
+        await self._load()
+        while True:
+            try:
+                await self.run_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Charge scheduling round crashed")
+            delay = (self._timers[0][0] - time.time() if self._timers
+                     else RECHECK_INTERVAL)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(0.0, delay))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        for schedule in await asyncio.to_thread(self.store.load):
+            if schedule.finished:
+                continue
+            self._schedules[(schedule.account_key, schedule.vin)] = schedule
+            # Spread the checks of a restart over the first minute
+            self._set_timer(schedule, time.time() + random.uniform(0, 60))
+
+    async def _save(self, schedule):
+        if self.store is not None:
+            await asyncio.to_thread(self.store.save, schedule)
+
+    def _set_timer(self, schedule, due):
+        schedule._timer += 1
+        schedule.next_check = due
+        heapq.heappush(self._timers, (due, schedule._timer,
+                                      schedule.account_key, schedule.vin))
+        if self._wakeup is not None and self._timers[0][0] == due:
+            self._wakeup.set()
+
+    async def _check(self, schedule, now=None):
+        self.stats["checks"] += 1
+        email, password = schedule._credentials
+        now = time.time() if now is None else now
+        try:
+            client = await self.client_factory(email, password)
+            # A reading from the last minute is recent enough
+            battery = await client.read("battery", schedule.vin, 60)
+        except Exception as e:
+            self.stats["failures"] += 1
+            schedule.error = str(e) or type(e).__name__
+            logger.warning("Charge schedule check of %s failed: %s",
+                           schedule.vin, schedule.error)
+            if now >= schedule.deadline:
+                await self._finish(schedule, MISSED, False)
+            else:
+                self._set_timer(
+                    schedule, min(now + RETRY_DELAY, schedule.deadline))
+            return
+        battery = battery.value
+        schedule.error = None
+        schedule.checked_at = now
+        schedule.level = battery.get("batteryLevel")
+        charging = battery.get("chargingStatus") in CHARGING_STATUSES
+        power = battery.get("chargingInstantaneousPower")
+        if charging and power:
+            schedule.power = power
+
+        level = schedule.level
+        if level is not None and level >= schedule.target:
+            await self._finish(schedule, COMPLETED, charging)
+            return
+        if now >= schedule.deadline:
+            await self._finish(schedule, MISSED, False)
+            return
+
+        duration = charge_duration(
+            level, schedule.target, schedule.capacity, schedule.power)
+        schedule.plan = plan_charge(now, schedule.deadline, duration,
+                                    schedule._parsed, schedule.timezone)
+        wanted = any(lower <= now < upper for lower, upper in schedule.plan)
+        if wanted and not charging:
+            if battery.get("plugStatus"):
+                self._command(schedule, "charge_start")
+            else:
+                schedule.error = "Vehicle is not plugged in"
+        elif charging and not wanted:
+            self._command(schedule, "charge_stop")
+        schedule.status = CHARGING if wanted and not schedule.error \
+            else WAITING
+
+        # Next check: the next start or stop of the plan, the deadline, or
+        # a recheck of the charging speed
+        boundaries = [t for interval in schedule.plan for t in interval
+                      if t > now]
+        due = min(boundaries + [schedule.deadline])
+        if wanted:
+            due = min(due, now + RECHECK_INTERVAL)
+        self._set_timer(schedule, due)
+
+    async def _finish(self, schedule, status, charging):
+        if charging:
+            self._command(schedule, "charge_stop")
+        schedule.status = status
+        schedule.plan = []
+        schedule.next_check = None
+        schedule._timer += 1
+        self.stats[status] += 1
+        await self._save(schedule)
+
+    def _command(self, schedule, action):
+        email, password = schedule._credentials
+        job = self.jobs.submit(email, password, schedule.vin, action)
+        schedule.last_command = {"action": action, "job": job.id,
+                                 "at": time.time()}
+        self.stats["commands"] += 1
@@ -1,31 +1,131 @@
 import os
-import aiohttp
+import time
+import asyncio
 import logging
 import datetime
-import importlib.metadata
 from functools import wraps
-from renault_api.renault_client import RenaultClient
+from renault_api.exceptions import NotAuthenticatedException
+from myrenault.lazy import lazy_import
+from myrenault.pool import (
+    credentials_key, get_token_expiry, supports_token_refresh, GIGYA_JWT_KEY)
+from myrenault.vin_index import owner_key
+from myrenault.cache import CacheResult
+from myrenault.telemetry import (
+    BatteryReading, CockpitReading, LocationReading, to_reading)
+from myrenault.breaker import CircuitOpenError
+from myrenault import metrics
 
 # Configure logger for this module
 logger = logging.getLogger(__name__)
 
+# Imported on first use (see myrenault.lazy)
+aiohttp = lazy_import("aiohttp")
+kamereon = lazy_import("renault_api.kamereon")
+# Set by the first login, unless replaced (e.g. by a mock in tests)
+RenaultClient = None
+
+# Cached readings made stale by each remote action
+ACTION_INVALIDATES = {
+    "hvac_start": ("battery",),
+    "hvac_stop": ("battery",),
+    "charge_start": ("battery",),
+    "charge_stop": ("battery",),
+}
+
+# Backoff applied to an account throttled by Renault without Retry-After
+DEFAULT_RETRY_AFTER = 60  # seconds
+
+# Readings available through MyRenaultClient.read()
+READ_KINDS = ("battery", "cockpit", "location")
+
+# Environment variables overriding the upstream endpoints of the locale,
+# e.g. to run against the local fake server of the benchmarks
+LOCALE_OVERRIDES = {
+    "gigya-root-url": "RENAULT_GIGYA_URL",
+    "gigya-api-key": "RENAULT_GIGYA_API_KEY",
+    "kamereon-root-url": "RENAULT_KAMEREON_URL",
+    "kamereon-api-key": "RENAULT_KAMEREON_API_KEY",
+}
+
+
+def locale_details():
+    details = {key: os.environ[var] for key, var in LOCALE_OVERRIDES.items()
+               if os.environ.get(var)}
+    return details or None
+
 
 def monitor_request(func):
+    """
+    Counts calls of a client method, both in the instance stats and in the
+    process-wide metrics. Metric children are resolved once, here, so a
+    call only costs a few increments.
+    """
+    name = func.__name__
+    succeeded = metrics.CLIENT_CALLS.labels(name, "success")
+    failed = metrics.CLIENT_CALLS.labels(name, "failure")
+
     @wraps(func)
     async def wrapper(self, *args, **kwargs):
         self.stats["requests_total"] += 1
         try:
             result = await func(self, *args, **kwargs)
-            self.stats["requests_success"] += 1
-            return result
-        except Exception:
+        except Exception as e:
             self.stats["requests_failed"] += 1
+            failed.inc()
+            metrics.CLIENT_ERRORS.labels(name, type(e).__name__).inc()
             raise
+        self.stats["requests_success"] += 1
+        succeeded.inc()
+        return result
+    return wrapper
+
+
+def retry_after(headers):
+    """Seconds to wait according to a Retry-After header (seconds form)."""
+    try:
+        return max(1, int((headers or {}).get("Retry-After")))
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+
+def renault_client_class():
+    """renault_api's RenaultClient, imported by the first call."""
+    global RenaultClient
+    if RenaultClient is None:
+        from renault_api.renault_client import RenaultClient
+    return RenaultClient
+
+
+def describe_error(error):
+    return str(error) or type(error).__name__
+
+
+def reauthenticate(func):
+    """
+    Retries a call once with a fresh login when the pooled session turned
+    out to be expired upstream.
+    """
+    @wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        try:
+            return await func(self, *args, **kwargs)
+        except NotAuthenticatedException:
+            if self.pool is None:
+                raise
+            logger.info("Renault session expired, retrying with a new login.")
+            self.reset_session()
+            if self.state is not None:
+                # Other workers must not restore the expired login either
+                await self.state.delete("logins", self.account_key)
+            return await func(self, *args, **kwargs)
     return wrapper
 
 
 class MyRenaultClient:
-    def __init__(self, email=None, password=None, websession=None):
+    def __init__(self, email=None, password=None, websession=None,
+                 pool=None, inflight=None, cache=None, vin_index=None,
+                 history=None, governor=None, breaker=None, max_stale=0,
+                 state=None, samples=None, geofences=None, publisher=None):
         self.email = email or os.environ.get("RENAULT_EMAIL")
         self.password = password or os.environ.get("RENAULT_PASSWORD")
 
@@ -36,6 +136,19 @@ class MyRenaultClient:
             )
 
         self.websession = websession
+        self.pool = pool
+        self.inflight = inflight
+        self.cache = cache
+        self.vin_index = vin_index
+        self.history = history
+        self.samples = samples  # recent samples kept in memory, optional
+        self.geofences = geofences  # fed with location readings, optional
+        self.publisher = publisher  # pushes reading changes, optional
+        self.governor = governor
+        self.breaker = breaker
+        self.max_stale = max_stale  # seconds, 0 disables stale readings
+        self.state = state  # shared with the other workers, optional
+        self.account_key = credentials_key(self.email, self.password)
         self.client = None
         self.vehicle_cache = {}  # VIN -> vehicle object
 
@@ -47,85 +160,355 @@ class MyRenaultClient:
         }
 
     def get_stats(self):
-        return {
+        stats = {
             "uptime": datetime.datetime.now() - self.started_at,
             "cache_size": len(self.vehicle_cache),
             **self.stats
         }
+        if self.inflight is not None:
+            stats["inflight"] = self.inflight.get_stats()
+        if self.cache is not None:
+            stats["response_cache"] = self.cache.get_stats()
+        if self.vin_index is not None:
+            stats["vin_index"] = self.vin_index.get_stats()
+        if self.history is not None:
+            stats["history"] = self.history.get_stats()
+        if self.governor is not None:
+            stats["governor"] = self.governor.get_stats()
+        if self.breaker is not None:
+            stats["breaker"] = self.breaker.get_stats()
+        if self.state is not None:
+            stats["state"] = self.state.get_stats()
+        return stats
 
     async def get_session(self):
         if self.websession is None or self.websession.closed:
             self.websession = aiohttp.ClientSession()
 
         if self.client is None:
-            self.client = RenaultClient(
-                websession=self.websession, locale="fr_FR")
-            await self.client.session.login(self.email, self.password)
+            if self.pool is None:
+                self.client = await self._login()
+            else:
+                # Reuse a logged-in client shared across requests; the
+                # vehicle cache lives as long as that login does.
+                entry = await self.pool.acquire(
+                    self.account_key, self.websession, self._login)
+                self.client = entry.client
+                self.vehicle_cache = entry.vehicles
 
         return self.client
 
-    async def get_vehicles(self):
+    @reauthenticate
+    async def warm_up(self, refresh_margin=120):
+        """
+        Prepares the account so that its next request takes no detour: a
+        logged-in session that is not about to reach the pool's max_age, a
+        Kamereon JWT valid for at least `refresh_margin` more seconds and
+        every vehicle resolved. Returns the expiry (epoch seconds) of the
+        JWT.
+        """
+        client = await self.get_session()
+        if self.pool is not None:
+            age = self.pool.login_age(self.account_key)
+            if age is not None and age > self.pool.max_age - refresh_margin:
+                client = await self._log_in_again()
+
+        expiry = get_token_expiry(client)
+        # Without the session internals, only the max_age renewal above
+        # refreshes the JWT: refresh_token() would log in on every round
+        if supports_token_refresh(client) and (
+                expiry is None or expiry - time.time() < refresh_margin):
+            await self.refresh_token()
+            expiry = get_token_expiry(client)
+
+        vins = self.vin_index.vins(self.email) if self.vin_index else {}
+        if not vins:
+            vins = [v["vin"] for v in await self.get_vehicles() if v["vin"]]
+        for vin in vins:
+            vehicle = await self.get_vehicle(vin)
+            # renault-api needs the vehicle details (model, supported
+            # endpoints) before its first reading; load them now
+            if getattr(vehicle, "_vehicle_details", None) is None:
+                await self._upstream("get_details", vehicle.get_details)
+        return expiry
+
+    async def refresh_token(self):
+        """
+        Mints a new Kamereon JWT ahead of the expiry of the current one. It
+        takes renault-api internals; when a renault-api version no longer
+        has them, logs in again instead.
+        """
+        client = await self.get_session()
+        if not supports_token_refresh(client):
+            logger.warning("renault-api session has no JWT refresh, "
+                           "logging in again")
+            await self._log_in_again()
+            return
+        session = client.session
+        # Requests already holding the old JWT finish with it; renault-api
+        # mints the new one once, under the session's Gigya lock.
+        session._credentials.clear_keys([GIGYA_JWT_KEY])
+        await self._upstream("get_jwt", session._get_jwt)
+
+    async def _log_in_again(self):
+        """A new login, replacing the current client (and pooled one)."""
+        if self.pool is None:
+            self.client = await self._login()
+            return self.client
+        entry = await self.pool.renew(
+            self.account_key, self.websession, self._login)
+        self.client = entry.client
+        self.vehicle_cache = entry.vehicles
+        return self.client
+
+    async def _login(self):
+        client = renault_client_class()(
+            websession=self.websession, locale="fr_FR",
+            locale_details=locale_details())
+        if self.state is None:
+            await self._upstream(
+                "login", client.session.login, self.email, self.password)
+            return client
+
+        # One worker logs in for all: the others restore its Gigya login
+        # token, from which renault-api mints its own JWTs.
+        async with self.state.lock(f"login:{self.account_key}"):
+            login = await self.state.get("logins", self.account_key)
+            if login is not None:
+                client.session.set_login_token(login["login_token"])
+                return client
+            await self._upstream(
+                "login", client.session.login, self.email, self.password)
+            await self.state.set(
+                "logins", self.account_key,
+                {"login_token": client.session.login_token},
+                ttl=self.pool.max_age if self.pool is not None else None)
+        return client
+
+    async def _upstream(self, operation, call, *args):
+        """
+        Runs one upstream call, named `operation`, through the circuit
+        breaker and the governor when there are, and records its latency
+        and errors. Throttling responses make the governor hold back every
+        call of this account.
+        """
+        if self.breaker is not None:
+            # Fail fast rather than queue for a slot that would be wasted
+            self.breaker.check(operation)
+        if self.governor is None:
+            return await self._timed(operation, call, *args)
+
+        async with self.governor.slot(self.account_key):
+            try:
+                return await self._timed(operation, call, *args)
+            except kamereon.exceptions.QuotaLimitException:
+                self.governor.backoff(self.account_key, DEFAULT_RETRY_AFTER)
+                raise
+            except aiohttp.ClientResponseError as e:
+                if e.status == 429:
+                    self.governor.backoff(
+                        self.account_key, retry_after(e.headers))
+                raise
+
+    async def _timed(self, operation, call, *args):
+        in_flight = metrics.UPSTREAM_IN_FLIGHT.labels(operation)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            if self.breaker is None:
+                return await call(*args)
+            return await self.breaker.call(operation, call, *args)
+        except Exception as e:
+            metrics.UPSTREAM_ERRORS.labels(
+                operation, type(e).__name__).inc()
+            raise
+        finally:
+            in_flight.dec()
+            metrics.UPSTREAM_LATENCY.labels(operation).observe(
+                time.perf_counter() - started)
+
+    def reset_session(self):
+        if self.pool is not None:
+            self.pool.invalidate(self.account_key)
+        self.client = None
+        self.vehicle_cache = {}
+
+    async def _coalesce(self, kind, vin, max_age, fetch, *args):
+        """
+        Runs an upstream read, sharing it with any identical read (same
+        account, VIN and kind) already in flight, in this worker or, with a
+        shared state backend, in another one. Returns a CacheResult.
+        """
+        if self.inflight is None:
+            return await self._fetch_shared(kind, vin, max_age, fetch, *args)
+        key = (self.account_key, vin, kind)
+        return await self.inflight.do(
+            key, self._fetch_shared, kind, vin, max_age, fetch, *args)
+
+    async def _fetch_shared(self, kind, vin, max_age, fetch, *args):
+        """
+        Returns a reading fetched recently enough by another worker, or
+        else fetches it while holding a cross-worker lock, so that workers
+        missing the same reading at once make a single upstream call.
+        """
+        if self.state is None:
+            return CacheResult(await fetch(*args), False, 0.0)
+
+        name = f"{self.account_key}:{vin}:{kind}"
+        ttl = self.cache.ttl(kind) if self.cache is not None else 0
+        if max_age is not None:
+            ttl = min(ttl, max_age)
+        shared = await self._shared_reading(kind, name, ttl)
+        if shared is not None:
+            return shared
+
+        requested = time.time()
+        async with self.state.lock(f"read:{name}"):
+            # The reading may have been fetched while we were waiting
+            shared = await self._shared_reading(
+                kind, name, ttl, since=requested)
+            if shared is not None:
+                return shared
+            data = await fetch(*args)
+            # Kept past its TTL as the stale fallback of every worker
+            keep = max(self.cache.ttl(kind) if self.cache is not None else 0,
+                       self.max_stale)
+            if keep > 0:
+                await self.state.set(
+                    "readings", name, [time.time(), data], ttl=keep)
+        return CacheResult(data, False, 0.0)
+
+    async def _shared_reading(self, kind, name, max_age, since=None):
+        """
+        Returns the shared reading `name` as a CacheResult if it is at most
+        `max_age` seconds old or was stored after `since`, otherwise None.
+        """
+        entry = await self.state.get("readings", name)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        age = max(0.0, time.time() - stored_at)
+        if age <= max_age or (since is not None and stored_at >= since):
+            return CacheResult(to_reading(kind, value), True, age)
+        return None
+
+    @reauthenticate
+    async def get_vehicles(self, max_age=None):
         """
         Retrieve all vehicles available across all accounts.
         Returns a list of dictionaries with vehicle details.
         """
+        key = (self.account_key, None, "vehicles")
+        if self.cache is not None:
+            cached = self.cache.get(key, max_age)
+            if cached is not None:
+                return cached.value
+
+        result = await self._coalesce(
+            "vehicles", None, max_age, self._fetch_vehicles)
+
+        if self.cache is not None:
+            self.cache.set(key, result.value, result.age)
+        return result.value
+
+    async def check_vehicle(self, vin):
+        """
+        Raises ValueError unless Renault lists `vin` in one of the user's
+        accounts. Unlike get_vehicle, this never trusts an unverified VIN,
+        so it guards data served locally rather than by Renault.
+        """
+        vin = vin.strip().upper()
+        vehicles = await self.get_vehicles()
+        if not any((v["vin"] or "").strip().upper() == vin for v in vehicles):
+            raise ValueError(
+                f"Vehicle with VIN {vin} not found in any account.")
+        return vin
+
+    async def _fetch_vehicles(self):
         client = await self.get_session()
+        accounts = await self._get_accounts(client)
+
+        vehicle_list = []
+        for account, vehicles in await self._list_account_vehicles(accounts):
+            for v in vehicles:
+                details = v.vehicleDetails
+
+                vehicle_data = {
+                    "vin": v.vin,
+                    "brand": details.get_brand_label() if details else None,
+                    "model": details.get_model_label() if details else None,
+                    "registrationNumber": details.registrationNumber if details else None,
+                    "energy": details.get_energy_code() if details else None,
+                    "picture": details.get_picture() if details else None
+                }
+                vehicle_list.append(vehicle_data)
+
+        return vehicle_list
+
+    async def _get_accounts(self, client):
+        # client.get_api_accounts() returns a list of RenaultAccount
         try:
-            accounts = await client.get_api_accounts()
+            accounts = await self._upstream(
+                "get_api_accounts", client.get_api_accounts)
         except Exception as e:
-            logger.error(f"Failed to retrieve API accounts: {e}")
+            logger.error("Failed to retrieve API accounts: %s", e)
             raise
 
-        logger.info(f"Found {len(accounts)} Renault accounts.")
+        logger.debug("Found %d Renault accounts", len(accounts))
+        return accounts
 
-        vehicle_list = []
-        for account in accounts:
-            try:
-                vehicles_response = await account.get_vehicles()
-                vehicles = vehicles_response.vehicleLinks or []
-
-                for v in vehicles:
-                    details = v.vehicleDetails
-
-                    vehicle_data = {
-                        "vin": v.vin,
-                        "brand": details.get_brand_label() if details else None,
-                        "model": details.get_model_label() if details else None,
-                        "registrationNumber": details.registrationNumber if details else None,
-                        "energy": details.get_energy_code() if details else None,
-                        "picture": details.get_picture() if details else None
-                    }
-                    vehicle_list.append(vehicle_data)
-
-            except Exception as e:
-                logger.error(
-                    f"Error checking account {account.account_id}: {e}"
-                )
+    async def _list_account_vehicles(self, accounts):
+        """
+        Lists the vehicles of every account concurrently and records which
+        account holds each VIN. Returns (account, vehicleLinks) pairs for
+        the accounts that could be listed.
+        """
+        responses = await asyncio.gather(
+            *(self._upstream("get_vehicles", account.get_vehicles)
+              for account in accounts),
+            return_exceptions=True
+        )
+
+        listed = []
+        mapping = {}
+        for account, response in zip(accounts, responses):
+            if isinstance(response, Exception):
+                logger.error("Error checking account %s: %s",
+                             account.account_id, response)
                 continue
+            vehicles = response.vehicleLinks or []
+            for v in vehicles:
+                if v.vin:
+                    mapping[v.vin.strip().upper()] = account.account_id
+            listed.append((account, vehicles))
 
-        return vehicle_list
+        await self._remember_accounts(mapping)
+        return listed
 
     async def get_vehicle(self, vin):
         # Clean VIN input
         vin = vin.strip().upper()
 
-        if vin in self.vehicle_cache:
-            if not self.websession or self.websession.closed:
-                self.vehicle_cache = {}
-            else:
-                return self.vehicle_cache[vin]
-
         client = await self.get_session()
 
-        # We need to find the account that has the vehicle.
-        # client.get_api_accounts() returns a list of RenaultAccount
-        try:
-            accounts = await client.get_api_accounts()
-        except Exception as e:
-            logger.error(f"Failed to retrieve API accounts: {e}")
-            raise
+        if vin in self.vehicle_cache:
+            return self.vehicle_cache[vin]
+
+        # A known VIN resolves without any upstream call: account and
+        # vehicle proxies are built locally from their ids.
+        account_id = None
+        if self.vin_index is not None:
+            account_id = self.vin_index.get(self.email, vin)
+        if account_id is None and self.state is not None:
+            account_id = await self.state.get("vins", self._vin_key(vin))
+            if account_id is not None and self.vin_index is not None:
+                self.vin_index.update(self.email, {vin: account_id})
+        if account_id is not None:
+            account = await client.get_api_account(account_id)
+            return await self._remember_vehicle(account, vin)
 
-        logger.info(f"Found {len(accounts)} Renault accounts.")
+        # We need to find the account that has the vehicle.
+        accounts = await self._get_accounts(client)
 
         # Performance optimization:
         # If the user has only one account (common case), we skip listing all
@@ -135,110 +518,298 @@ class MyRenaultClient:
         # will fail.
         if len(accounts) == 1:
             account = accounts[0]
-            logger.info(
-                f"Single account detected ({account.account_id}). "
-                "Optimistically returning vehicle."
-            )
-            api_vehicle = await account.get_api_vehicle(vin)
-            self.vehicle_cache[vin] = api_vehicle
-            return api_vehicle
-
+            logger.debug(
+                "Single account detected (%s), optimistically returning "
+                "vehicle %s", account.account_id, vin)
+            await self._remember_accounts({vin: account.account_id})
+            return await self._remember_vehicle(account, vin)
+
+        # Sweep all accounts at once; this also fills the VIN index for the
+        # user's other vehicles.
         found_vins = []
-
-        for account in accounts:
-            try:
-                # We need to list vehicles for this account to see if VIN matches.
-                # account.get_vehicles() returns list of KamereonVehicleData
-                vehicles_response = await account.get_vehicles()
-                vehicles = vehicles_response.vehicleLinks or []
-
-                for v in vehicles:
-                    # Clean VIN from API just in case
-                    v_vin = v.vin.strip().upper() if v.vin else ""
-                    found_vins.append(v_vin)
-
-                    if v_vin == vin:
-                        logger.info(
-                            f"Vehicle found in account {account.account_id}"
-                        )
-                        api_vehicle = await account.get_api_vehicle(vin)
-                        self.vehicle_cache[vin] = api_vehicle
-                        return api_vehicle
-            except Exception as e:
-                logger.error(
-                    f"Error checking account {account.account_id}: {e}"
-                )
-                continue
-
-        logger.error(
-            f"Vehicle with VIN {vin} not found. Available VINs: {found_vins}")
+        for account, vehicles in await self._list_account_vehicles(accounts):
+            for v in vehicles:
+                # Clean VIN from API just in case
+                v_vin = v.vin.strip().upper() if v.vin else ""
+                found_vins.append(v_vin)
+
+                if v_vin == vin:
+                    logger.debug("Vehicle %s found in account %s", vin,
+                                 account.account_id)
+                    return await self._remember_vehicle(account, vin)
+
+        logger.error("Vehicle with VIN %s not found. Available VINs: %s",
+                     vin, found_vins)
         raise ValueError(
             f"Vehicle with VIN {vin} not found in any account. "
             f"Found: {found_vins}"
         )
 
-    @monitor_request
-    async def battery_status(self, vin):
+    def _vin_key(self, vin):
+        return f"{owner_key(self.email)}:{vin}"
+
+    async def _remember_accounts(self, mapping):
+        """Records which account holds each VIN of a {VIN: account id}."""
+        if self.vin_index is not None:
+            self.vin_index.update(self.email, mapping)
+        if self.state is not None:
+            for vin, account_id in mapping.items():
+                await self.state.set("vins", self._vin_key(vin), account_id)
+
+    async def _remember_vehicle(self, account, vin):
+        api_vehicle = await account.get_api_vehicle(vin)
+        self.vehicle_cache[vin] = api_vehicle
+        return api_vehicle
+
+    def forget_vehicle(self, vin):
+        """
+        Drops what is known about a VIN that Renault no longer recognises,
+        so that the next lookup searches the accounts again.
+        """
+        vin = vin.strip().upper()
+        self.vehicle_cache.pop(vin, None)
+        if self.vin_index is not None:
+            self.vin_index.discard(self.email, vin)
+
+    async def _vehicle_call(self, vin, operation, call):
+        """
+        Runs `call(vehicle)` against the resolved vehicle. `operation` names
+        the upstream call.
+        """
         vehicle = await self.get_vehicle(vin)
-        status = await vehicle.get_battery_status()
-
-        data = {
-            "batteryLevel": status.batteryLevel,
-            "batteryAutonomy": status.batteryAutonomy,
-            "chargingStatus": status.chargingStatus,
-            "plugStatus": status.plugStatus,
-            "batteryTemperature": status.batteryTemperature,
-            "chargingInstantaneousPower": status.chargingInstantaneousPower,
-            "timestamp": status.timestamp
-        }
-        logger.info(f"Battery status collected: {data}")
-        return data
+        try:
+            return await self._upstream(operation, call, vehicle)
+        except kamereon.exceptions.ResourceNotFoundException:
+            logger.error("%s failed: vehicle %s not found", operation, vin)
+            self.forget_vehicle(vin)
+            if self.state is not None:
+                await self.state.delete(
+                    "vins", self._vin_key(vin.strip().upper()))
+            raise
 
     @monitor_request
-    async def cockpit(self, vin):
-        vehicle = await self.get_vehicle(vin)
-        cockpit = await vehicle.get_cockpit()
-        data = {
-            "totalMileage": cockpit.totalMileage,
-        }
-        logger.info(f"Cockpit data collected: {data}")
+    @reauthenticate
+    async def read(self, kind, vin, max_age=None):
+        """
+        Returns a CacheResult with the latest `kind` reading ("battery",
+        "cockpit" or "location") for `vin`. A cached reading is returned if
+        it is younger than both the cache TTL and `max_age` seconds.
+        """
+        vin = vin.strip().upper()
+        key = (self.account_key, vin, kind)
+
+        if self.cache is not None:
+            cached = self.cache.get(key, max_age)
+            if cached is not None:
+                return cached
+
+        if kind not in READ_KINDS:
+            raise KeyError(f"Unknown reading kind: {kind}")
+        fetch = getattr(self, f"_fetch_{kind}")
+        try:
+            result = await self._coalesce(kind, vin, max_age, fetch, vin)
+        except CircuitOpenError:
+            # Upstream is known to be down: the last reading beats an error
+            stale = await self._stale_reading(kind, vin)
+            if stale is None:
+                raise
+            logger.info("Serving a stale %s reading for %s", kind, vin)
+            return stale
+
+        if self.cache is not None:
+            self.cache.set(key, result.value, result.age)
+        if self.history is not None and not result.from_cache:
+            self.history.record(kind, vin, result.value)
+        if self.samples is not None and not result.from_cache:
+            self.samples.record(kind, vin, result.value)
+        if (self.geofences is not None and kind == "location"
+                and not result.from_cache):
+            self.geofences.record(self.email, vin, result.value)
+        if self.publisher is not None and not result.from_cache:
+            self.publisher.publish_reading(vin, kind, result.value)
+        return result
+
+    async def _stale_reading(self, kind, vin):
+        if not self.max_stale:
+            return None
+        stale = None
+        if self.cache is not None:
+            stale = self.cache.get_stale(
+                (self.account_key, vin, kind), self.max_stale)
+        if stale is None and self.state is not None:
+            shared = await self._shared_reading(
+                kind, f"{self.account_key}:{vin}:{kind}", self.max_stale)
+            if shared is not None:
+                stale = shared._replace(stale=True)
+        return stale
+
+    async def invalidate(self, vin, kinds):
+        vin = vin.strip().upper()
+        if self.cache is not None:
+            self.cache.invalidate(self.account_key, vin, kinds)
+        if self.state is not None:
+            for kind in kinds:
+                await self.state.delete(
+                    "readings", f"{self.account_key}:{vin}:{kind}")
+
+    async def snapshot(self, vin, kinds=READ_KINDS, max_age=None):
+        """
+        Reads several kinds for one vehicle concurrently. Failures are
+        reported per kind in "errors" instead of failing the whole snapshot.
+        """
+        vin = vin.strip().upper()
+        # Resolve the vehicle once so that the concurrent reads share it
+        await self.get_vehicle(vin)
+
+        results = await asyncio.gather(
+            *(self.read(kind, vin, max_age) for kind in kinds),
+            return_exceptions=True
+        )
+
+        snapshot = {"vin": vin, "errors": {}, "stale": []}
+        for kind, result in zip(kinds, results):
+            if isinstance(result, Exception):
+                logger.error("Snapshot %s failed for %s: %s", kind, vin, result)
+                snapshot[kind] = None
+                snapshot["errors"][kind] = describe_error(result)
+            else:
+                snapshot[kind] = result.value
+                if result.stale:
+                    snapshot["stale"].append(kind)
+        return snapshot
+
+    async def snapshots(self, vins, kinds=READ_KINDS, max_age=None):
+        """
+        Snapshots several vehicles concurrently with a single login. A
+        vehicle that cannot be resolved is reported under errors["vehicle"].
+        """
+        await self.get_session()
+        vins = list(dict.fromkeys(v.strip().upper() for v in vins))
+
+        results = await asyncio.gather(
+            *(self.snapshot(vin, kinds, max_age) for vin in vins),
+            return_exceptions=True
+        )
+
+        snapshots = []
+        for vin, result in zip(vins, results):
+            if isinstance(result, Exception):
+                logger.error("Snapshot failed for %s: %s", vin, result)
+                result = {
+                    "vin": vin,
+                    "errors": {"vehicle": describe_error(result)}
+                }
+            snapshots.append(result)
+        return snapshots
+
+    async def fleet_status(self, vehicles, kinds=READ_KINDS, concurrency=8,
+                           max_age=None):
+        """
+        Snapshots every vehicle of `vehicles` (as returned by get_vehicles),
+        at most `concurrency` at a time, and yields each one merged with
+        its vehicle details as soon as it is ready.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def status(vehicle):
+            async with semaphore:
+                try:
+                    snapshot = await self.snapshot(
+                        vehicle["vin"], kinds, max_age)
+                except Exception as e:
+                    logger.error("Fleet status failed for %s: %s",
+                                 vehicle["vin"], e)
+                    snapshot = {"errors": {"vehicle": describe_error(e)}}
+            return {**vehicle, **snapshot}
+
+        tasks = [asyncio.ensure_future(status(v)) for v in vehicles]
+        try:
+            for done in asyncio.as_completed(tasks):
+                yield await done
+        finally:
+            # The consumer may stop early (e.g. client disconnected)
+            for task in tasks:
+                task.cancel()
+
+    async def battery_status(self, vin, max_age=None):
+        return (await self.read("battery", vin, max_age)).value
+
+    async def _fetch_battery(self, vin):
+        status = await self._vehicle_call(
+            vin, "get_battery_status", lambda v: v.get_battery_status())
+
+        data = BatteryReading(
+            batteryLevel=status.batteryLevel,
+            batteryAutonomy=status.batteryAutonomy,
+            chargingStatus=status.chargingStatus,
+            plugStatus=status.plugStatus,
+            batteryTemperature=status.batteryTemperature,
+            chargingInstantaneousPower=status.chargingInstantaneousPower,
+            timestamp=status.timestamp
+        )
+        logger.debug("Battery status collected for %s", vin,
+                     extra={"reading": data})
+        return data
+
+    async def cockpit(self, vin, max_age=None):
+        return (await self.read("cockpit", vin, max_age)).value
+
+    async def _fetch_cockpit(self, vin):
+        cockpit = await self._vehicle_call(
+            vin, "get_cockpit", lambda v: v.get_cockpit())
+        data = CockpitReading(totalMileage=cockpit.totalMileage)
+        logger.debug("Cockpit data collected for %s", vin,
+                     extra={"reading": data})
         return data
 
     @monitor_request
+    @reauthenticate
     async def hvac_start(self, vin, t):
-        vehicle = await self.get_vehicle(vin)
-        return await vehicle.set_ac_start(t)
+        result = await self._vehicle_call(
+            vin, "set_ac_start", lambda v: v.set_ac_start(t))
+        await self.invalidate(vin, ACTION_INVALIDATES["hvac_start"])
+        return result
 
     @monitor_request
+    @reauthenticate
     async def hvac_stop(self, vin):
-        vehicle = await self.get_vehicle(vin)
-        return await vehicle.set_ac_stop()
-
-    @monitor_request
-    async def location(self, vin):
-        vehicle = await self.get_vehicle(vin)
-        loc = await vehicle.get_location()
-        data = {
-            "latitude": loc.gpsLatitude,
-            "longitude": loc.gpsLongitude,
-            "timestamp": loc.lastUpdateTime
-        }
-        logger.info(f"Location collected: {data}")
+        result = await self._vehicle_call(
+            vin, "set_ac_stop", lambda v: v.set_ac_stop())
+        await self.invalidate(vin, ACTION_INVALIDATES["hvac_stop"])
+        return result
+
+    async def location(self, vin, max_age=None):
+        return (await self.read("location", vin, max_age)).value
+
+    async def _fetch_location(self, vin):
+        loc = await self._vehicle_call(
+            vin, "get_location", lambda v: v.get_location())
+        data = LocationReading(
+            latitude=loc.gpsLatitude,
+            longitude=loc.gpsLongitude,
+            timestamp=loc.lastUpdateTime
+        )
+        # GPS coordinates are redacted by the log formatter
+        logger.debug("Location collected for %s", vin,
+                     extra={"reading": data})
         return data
 
     @monitor_request
+    @reauthenticate
     async def charge_start(self, vin):
-        vehicle = await self.get_vehicle(vin)
-        return await vehicle.set_charge_start()
+        result = await self._vehicle_call(
+            vin, "set_charge_start", lambda v: v.set_charge_start())
+        await self.invalidate(vin, ACTION_INVALIDATES["charge_start"])
+        return result
 
     @monitor_request
+    @reauthenticate
     async def charge_stop(self, vin):
-        vehicle = await self.get_vehicle(vin)
         # Fix for 'invalid-body-format' on some vehicles (Zoe Phase 2)
         # The library default sends action='stop', but 'cancel' appears to be
         # required or safer for the 'ChargingStart' type.
         # We perform a manual request here to override the body.
-        try:
+        async def send_cancel(vehicle):
             # Retrieve the endpoint URL using the standard mechanism
             endpoint = await vehicle.get_full_endpoint("actions/charge-stop")
 
@@ -254,28 +825,29 @@ class MyRenaultClient:
             }
 
             # Use the underlying session to send the request
-            response = await vehicle.session.http_request(
+            return await vehicle.session.http_request(
                 "POST", endpoint, json_payload
             )
-            return response
-        except Exception:
-            # If the manual fix fails, fallback to library method (or just
-            # re-raise if library method is same as failed)
-            # But here we just assume the fix is better.
-            raise
+
+        response = await self._vehicle_call(vin, "charge_stop", send_cancel)
+        await self.invalidate(vin, ACTION_INVALIDATES["charge_stop"])
+        return response
 
     @monitor_request
+    @reauthenticate
     async def blink_lights(self, vin):
-        vehicle = await self.get_vehicle(vin)
-        return await vehicle.start_lights()
+        return await self._vehicle_call(
+            vin, "start_lights", lambda v: v.start_lights())
 
     @monitor_request
+    @reauthenticate
     async def honk(self, vin):
-        vehicle = await self.get_vehicle(vin)
-        return await vehicle.start_horn()
+        return await self._vehicle_call(
+            vin, "start_horn", lambda v: v.start_horn())
 
     async def check_api_version(self):
         try:
+            import importlib.metadata
             current_version = importlib.metadata.version('renault-api')
 
             async with aiohttp.ClientSession() as session:
@@ -289,5 +861,5 @@ class MyRenaultClient:
                         latest_version = "Unknown"
             return current_version, latest_version
         except Exception as e:
-            logger.error(f"Failed to check version: {e}")
+            logger.error("Failed to check version: %s", e)
             return "Unknown", "Unknown"
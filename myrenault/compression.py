@@ -0,0 +1,149 @@
+import zlib
+import logging
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip only
+    brotli = None
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+# Complete bodies smaller than this are sent as they are
+MIN_SIZE = 1024  # bytes
+GZIP_LEVEL = 5
+# Brotli quality favoring speed; higher levels cost far more CPU
+BROTLI_QUALITY = 4
+
+
+def available_encodings(configured):
+    """Encodings of `configured` (e.g. "br,gzip") this process supports."""
+    encodings = []
+    for encoding in configured.split(","):
+        encoding = encoding.strip().lower()
+        if encoding == "gzip" or (encoding == "br" and brotli is not None):
+            encodings.append(encoding)
+    return tuple(encodings)
+
+
+def negotiate(accept_encoding, encodings):
+    """
+    The first of `encodings` (in order of preference) accepted by the
+    Accept-Encoding header, or None.
+    """
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in encodings:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding):
+        if encoding == "br":
+            self._br = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._gzip = None
+        else:
+            self._br = None
+            self._gzip = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data, flush=False):
+        """Compresses `data`, flushed if the client must see it now."""
+        if self._br is not None:
+            out = self._br.process(data)
+            return out + self._br.flush() if flush else out
+        out = self._gzip.compress(data)
+        return out + self._gzip.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finish(self):
+        if self._br is not None:
+            return self._br.finish()
+        return self._gzip.flush()
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing the successful responses of the routes in
+    `paths` (route templates, e.g. /api/v1/vehicles) with the first of
+    `encodings` the client accepts.
+
+    Complete bodies are compressed when larger than `min_size`. Streamed
+    bodies (NDJSON) are compressed chunk by chunk and flushed after each,
+    so that every line still reaches the client as soon as it is ready.
+    """
+
+    def __init__(self, app, paths, encodings=("br", "gzip"),
+                 min_size=MIN_SIZE):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.encodings = tuple(encodings)
+        self.min_size = min_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.encodings:
+            return await self.app(scope, receive, send)
+        accept = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        encoding = negotiate(accept, self.encodings) if accept else None
+
+        start = None
+        compressor = None
+
+        async def send_wrapper(message):
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                route = getattr(scope.get("route"), "path", None)
+                if route not in self.paths:
+                    return await send(message)
+                headers = list(message.get("headers", [])) + [
+                    (b"vary", b"Accept-Encoding")]
+                already = any(k == b"content-encoding" for k, _ in headers)
+                if encoding is None or already or message["status"] != 200:
+                    return await send({**message, "headers": headers})
+                # Sent with the first body chunk, once its size is known
+                start = {**message, "headers": headers}
+                return
+
+            if start is None:
+                return await send(message)
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if compressor is None:
+                if not more and len(body) < self.min_size:
+                    await send(start)
+                    start = None
+                    return await send(message)
+                compressor = _Compressor(encoding)
+                headers = [(k, v) for k, v in start["headers"]
+                           if k != b"content-length"]
+                headers.append((b"content-encoding", encoding.encode()))
+                if not more:
+                    compressed = compressor.compress(body) + \
+                        compressor.finish()
+                    headers.append(
+                        (b"content-length", str(len(compressed)).encode()))
+                await send({**start, "headers": headers})
+                if not more:
+                    return await send({"type": "http.response.body",
+                                       "body": compressed})
+
+            out = compressor.compress(body, flush=more)
+            if not more:
+                out += compressor.finish()
+            await send({"type": "http.response.body", "body": out,
+                        "more_body": more})
+
+        await self.app(scope, receive, send_wrapper)
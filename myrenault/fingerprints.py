@@ -0,0 +1,110 @@
+import json
+import hashlib
+import logging
+from collections import OrderedDict, namedtuple
+from collections.abc import Mapping
+from email.utils import formatdate, parsedate_to_datetime
+
+from myrenault.history import parse_timestamp
+from myrenault.telemetry import Reading
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+# `last_modified` is in epoch seconds, None when the reading has no
+# upstream timestamp (cockpit)
+Fingerprint = namedtuple("Fingerprint", ["etag", "last_modified"])
+
+
+def compute_fingerprint(value):
+    """
+    Strong validators of a reading: an ETag hashing its content, so that
+    it changes whenever the body does, and the upstream timestamp as
+    Last-Modified.
+    """
+    if isinstance(value, Reading):
+        # Already encoded once, with its fields in a fixed order
+        body = value.body()
+    else:
+        body = json.dumps(value, sort_keys=True, separators=(",", ":"),
+                          default=str).encode("utf-8")
+    digest = hashlib.blake2b(body, digest_size=16)
+    last_modified = None
+    if isinstance(value, Mapping):
+        last_modified = parse_timestamp(value.get("timestamp"))
+    return Fingerprint(f'"{digest.hexdigest()}"', last_modified)
+
+
+def http_date(timestamp):
+    return formatdate(timestamp, usegmt=True)
+
+
+def _etags(header):
+    for tag in header.split(","):
+        tag = tag.strip()
+        # If-None-Match uses the weak comparison
+        yield tag[2:] if tag.startswith("W/") else tag
+
+
+def not_modified(fingerprint, if_none_match=None, if_modified_since=None):
+    """
+    Whether a conditional request can be answered with 304 Not Modified.
+    If-Modified-Since is only considered without If-None-Match, as
+    required by RFC 9110.
+    """
+    if if_none_match:
+        return any(tag == "*" or tag == fingerprint.etag
+                   for tag in _etags(if_none_match))
+    if if_modified_since and fingerprint.last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return fingerprint.last_modified <= since
+    return False
+
+
+class FingerprintStore:
+    """
+    Fingerprints of the latest reading of each (account, VIN, kind).
+
+    A fingerprint is computed once per reading and reused for as long as
+    the same reading is served (the response cache hands out the very same
+    object), so that answering a conditional request costs neither a call
+    to Renault nor serializing and hashing the body again. The number of
+    entries is bounded, least recently used first out.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (reading, Fingerprint)
+        self.stats = {
+            "computed": 0,
+            "reused": 0,
+            "not_modified": 0
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_stats(self):
+        return {"size": len(self._entries), **self.stats}
+
+    def get(self, key, value):
+        """Returns the Fingerprint of `value`, the reading stored at `key`."""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] is value:
+            self._entries.move_to_end(key)
+            self.stats["reused"] += 1
+            return entry[1]
+
+        fingerprint = compute_fingerprint(value)
+        self.stats["computed"] += 1
+        self._entries[key] = (value, fingerprint)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return fingerprint
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,469 @@
+import os
+import json
+import math
+import time
+import uuid
+import logging
+from collections import OrderedDict, deque
+
+from myrenault.history import parse_timestamp
+from myrenault.vin_index import owner_key
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS = 6371008.8  # meters
+METERS_PER_DEGREE = EARTH_RADIUS * math.pi / 180
+
+# Grid cells of the fence index, in degrees (about 1.1 km of latitude)
+CELL_SIZE = 0.01
+# Fences covering more cells than this (e.g. a whole region) are not put
+# in the grid but checked against every sample of their owner
+MAX_CELLS = 4096
+
+# Circle fences around a position from which their distances are computed
+# together with numpy: for fewer, its fixed cost per call outweighs the gain
+VECTOR_MIN = 16
+
+# Displacement (meters) below which a new position is taken for GPS noise
+MOVE_THRESHOLD = 100
+# Seconds without displacement after which a trip has ended
+STOP_GAP = 600
+
+
+def distance(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters (haversine)."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = (math.sin(dphi / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2)
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def distances(latitude, longitude, lats, lons):
+    """
+    Great-circle distances in meters from a point to arrays of points, as
+    distance() computes one (numpy).
+    """
+    import numpy as np
+    phi1 = math.radians(latitude)
+    phi2 = np.radians(lats)
+    dphi = phi2 - phi1
+    dlambda = np.radians(np.asarray(lons) - longitude)
+    a = (np.sin(dphi / 2) ** 2
+         + math.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2)
+    return 2 * EARTH_RADIUS * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def circles_containing(fences, latitude, longitude):
+    """The ids of `fences` (all of them circles) containing the position."""
+    lats, lons, radii = zip(*((f.shape.latitude, f.shape.longitude,
+                               f.shape.radius) for f in fences))
+    hits = distances(latitude, longitude, lats, lons) <= radii
+    return {fence.id for fence, hit in zip(fences, hits.tolist()) if hit}
+
+
+class Circle:
+    __slots__ = ("latitude", "longitude", "radius", "bbox")
+
+    def __init__(self, latitude, longitude, radius):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.radius = radius  # meters
+        dlat = radius / METERS_PER_DEGREE
+        dlon = min(180.0, dlat / max(math.cos(math.radians(latitude)), 1e-6))
+        self.bbox = (latitude - dlat, longitude - dlon,
+                     latitude + dlat, longitude + dlon)
+
+    def contains(self, latitude, longitude):
+        # Bounding box first: most candidates of a grid cell are rejected
+        # without trigonometry
+        south, west, north, east = self.bbox
+        if not (south <= latitude <= north and west <= longitude <= east):
+            return False
+        return distance(self.latitude, self.longitude,
+                        latitude, longitude) <= self.radius
+
+    def to_dict(self):
+        return {"circle": {"latitude": self.latitude,
+                           "longitude": self.longitude,
+                           "radius": self.radius}}
+
+
+class Polygon:
+    __slots__ = ("points", "bbox")
+
+    def __init__(self, points):
+        self.points = [(float(lat), float(lon)) for lat, lon in points]
+        if len(self.points) < 3:
+            raise ValueError("A polygon needs at least 3 points")
+        lats = [lat for lat, _ in self.points]
+        lons = [lon for _, lon in self.points]
+        self.bbox = (min(lats), min(lons), max(lats), max(lons))
+
+    def contains(self, latitude, longitude):
+        south, west, north, east = self.bbox
+        if not (south <= latitude <= north and west <= longitude <= east):
+            return False
+        # Ray casting, with longitude as x and latitude as y
+        inside = False
+        points = self.points
+        lat_j, lon_j = points[-1]
+        for lat_i, lon_i in points:
+            if (lat_i > latitude) != (lat_j > latitude):
+                crossing = (lon_j - lon_i) * (latitude - lat_i) / (
+                    lat_j - lat_i) + lon_i
+                if longitude < crossing:
+                    inside = not inside
+            lat_j, lon_j = lat_i, lon_i
+        return inside
+
+    def to_dict(self):
+        return {"polygon": [list(point) for point in self.points]}
+
+
+def make_shape(data):
+    """Builds a Circle or Polygon from its to_dict() form."""
+    if data.get("circle"):
+        circle = data["circle"]
+        return Circle(circle["latitude"], circle["longitude"],
+                      circle["radius"])
+    if data.get("polygon"):
+        return Polygon(data["polygon"])
+    raise ValueError("A geofence needs a circle or a polygon")
+
+
+class Geofence:
+    __slots__ = ("id", "owner", "name", "shape", "vins", "created_at")
+
+    def __init__(self, owner, name, shape, vins=None, id=None,
+                 created_at=None):
+        self.id = id or uuid.uuid4().hex
+        self.owner = owner  # owner_key() of the account's email
+        self.name = name
+        self.shape = shape
+        # Vehicles the fence applies to; every vehicle of the owner if None
+        self.vins = frozenset(v.strip().upper() for v in vins) \
+            if vins else None
+        self.created_at = created_at or time.time()
+
+    def applies_to(self, vin):
+        return self.vins is None or vin in self.vins
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            **self.shape.to_dict(),
+            "vins": sorted(self.vins) if self.vins is not None else None,
+            "created_at": self.created_at,
+        }
+
+
+class GridIndex:
+    """
+    Fences by the grid cells (of `cell_size` degrees) their bounding box
+    overlaps, so that a position is only tested against the fences of its
+    cell instead of all of them.
+    """
+
+    def __init__(self, cell_size=CELL_SIZE, max_cells=MAX_CELLS):
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+        self._cells = {}  # (row, column) -> {fence id}
+        self._large = set()  # fences checked for every position
+
+    def _cell(self, latitude, longitude):
+        return (math.floor(latitude / self.cell_size),
+                math.floor(longitude / self.cell_size))
+
+    def _cells_of(self, fence):
+        south, west, north, east = fence.shape.bbox
+        row0, col0 = self._cell(south, west)
+        row1, col1 = self._cell(north, east)
+        if (row1 - row0 + 1) * (col1 - col0 + 1) > self.max_cells:
+            return None
+        return [(row, col) for row in range(row0, row1 + 1)
+                for col in range(col0, col1 + 1)]
+
+    def add(self, fence):
+        cells = self._cells_of(fence)
+        if cells is None:
+            self._large.add(fence.id)
+            return
+        for cell in cells:
+            self._cells.setdefault(cell, set()).add(fence.id)
+
+    def remove(self, fence):
+        self._large.discard(fence.id)
+        for cell in self._cells_of(fence) or ():
+            ids = self._cells.get(cell)
+            if ids is not None:
+                ids.discard(fence.id)
+                if not ids:
+                    del self._cells[cell]
+
+    def candidates(self, latitude, longitude):
+        ids = self._cells.get(self._cell(latitude, longitude))
+        if not self._large:
+            return ids or ()
+        return self._large | ids if ids else self._large
+
+    def clear(self):
+        self._cells.clear()
+        self._large.clear()
+
+
+class _Track:
+    """What the engine remembers of one vehicle."""
+
+    __slots__ = ("last_ts", "inside", "anchor", "trip", "events", "trips")
+
+    def __init__(self, max_events, max_trips):
+        self.last_ts = None
+        self.inside = set()  # fence ids
+        self.anchor = None  # last (ts, latitude, longitude) seen still
+        self.trip = None  # trip in progress
+        self.events = deque(maxlen=max_events)
+        self.trips = deque(maxlen=max_trips)
+
+
+class GeofenceEngine:
+    """
+    Checks the location readings of vehicles against the geofences of
+    their owner, recording enter/exit events, and splits their movements
+    into trips.
+
+    Fences belong to an account (by a hash of its email, as in VinIndex)
+    and are indexed in a GridIndex: a position is tested against the few
+    fences of its grid cell, so the cost of a reading does not grow with
+    the number of fences. Fences are optionally persisted to a JSON file
+    (`path`); events and trips are kept in memory for the last
+    `max_vehicles` vehicles seen.
+
+    A vehicle moves when its position is more than `move_threshold` meters
+    away from the last position it moved to; a trip ends once it has not
+    moved for `stop_gap` seconds. Trips are only as precise as the
+    location readings: positions are sampled when the API or a stream
+    reads them, not continuously.
+    """
+
+    def __init__(self, path=None, max_fences=100, max_vehicles=20000,
+                 max_events=100, max_trips=50, move_threshold=MOVE_THRESHOLD,
+                 stop_gap=STOP_GAP, cell_size=CELL_SIZE):
+        self.path = path
+        self.max_fences = max_fences  # per owner
+        self.max_vehicles = max_vehicles
+        self.max_events = max_events
+        self.max_trips = max_trips
+        self.move_threshold = move_threshold
+        self.stop_gap = stop_gap
+        self.index = GridIndex(cell_size)
+        self._fences = {}  # id -> Geofence
+        self._owners = {}  # owner key -> {fence id}
+        self._tracks = OrderedDict()  # (owner key, VIN) -> _Track
+        self.stats = {
+            "samples": 0,
+            "checks": 0,
+            "events": 0,
+            "trips": 0
+        }
+        if path:
+            self._load()
+
+    def __len__(self):
+        return len(self._fences)
+
+    def get_stats(self):
+        return {"fences": len(self._fences), "vehicles": len(self._tracks),
+                **self.stats}
+
+    def add(self, email, name, shape, vins=None):
+        owner = owner_key(email)
+        if len(self._owners.get(owner, ())) >= self.max_fences:
+            raise ValueError(
+                f"At most {self.max_fences} geofences per account")
+        fence = Geofence(owner, name, shape, vins)
+        self._add(fence)
+        self._save()
+        return fence
+
+    def remove(self, email, fence_id):
+        fence = self._fences.get(fence_id)
+        if fence is None or fence.owner != owner_key(email):
+            return None
+        del self._fences[fence_id]
+        self._owners[fence.owner].discard(fence_id)
+        self.index.remove(fence)
+        for (owner, _), track in self._tracks.items():
+            if owner == fence.owner:
+                track.inside.discard(fence_id)
+        self._save()
+        return fence
+
+    def fences(self, email):
+        ids = self._owners.get(owner_key(email), ())
+        return sorted((self._fences[i] for i in ids),
+                      key=lambda f: f.created_at)
+
+    def record(self, email, vin, data):
+        """Feeds a location reading of `vin` (a vehicle of `email`)."""
+        latitude = data.get("latitude") if data else None
+        longitude = data.get("longitude") if data else None
+        if latitude is None or longitude is None:
+            return
+        ts = parse_timestamp(data.get("timestamp")) or int(time.time())
+        owner = owner_key(email)
+        track = self._track(owner, vin)
+        if track.last_ts is not None and ts <= track.last_ts:
+            return  # Same (or an older) fix than the last one
+        track.last_ts = ts
+        self.stats["samples"] += 1
+        self._check_fences(owner, vin, track, ts, latitude, longitude)
+        self._follow(track, ts, latitude, longitude)
+
+    def status(self, email, vin):
+        """Fences `vin` is in, and its latest enter/exit events."""
+        track = self._tracks.get((owner_key(email), vin))
+        if track is None:
+            return {"vin": vin, "position_time": None, "inside": [],
+                    "events": []}
+        inside = [self._fences[i] for i in track.inside if i in self._fences]
+        return {
+            "vin": vin,
+            "position_time": track.last_ts,
+            "inside": [f.to_dict() for f in
+                       sorted(inside, key=lambda f: f.created_at)],
+            "events": list(track.events),
+        }
+
+    def trips(self, email, vin, now=None):
+        """Trips of `vin`, oldest first; the last one may be ongoing."""
+        track = self._tracks.get((owner_key(email), vin))
+        if track is None:
+            return []
+        trips = list(track.trips)
+        if track.trip is not None:
+            now = time.time() if now is None else now
+            trip = track.trip
+            trips.append({**trip, "distance": round(trip["distance"], 1),
+                          "ongoing": now - trip["end"] < self.stop_gap})
+        return trips
+
+    def clear(self):
+        self._fences.clear()
+        self._owners.clear()
+        self._tracks.clear()
+        self.index.clear()
+        self._save()
+
+    def _add(self, fence):
+        self._fences[fence.id] = fence
+        self._owners.setdefault(fence.owner, set()).add(fence.id)
+        self.index.add(fence)
+
+    def _track(self, owner, vin):
+        key = (owner, vin)
+        track = self._tracks.get(key)
+        if track is None:
+            track = self._tracks[key] = _Track(
+                self.max_events, self.max_trips)
+            while len(self._tracks) > self.max_vehicles:
+                self._tracks.popitem(last=False)
+        self._tracks.move_to_end(key)
+        return track
+
+    def _check_fences(self, owner, vin, track, ts, latitude, longitude):
+        fences = [self._fences[i]
+                  for i in self.index.candidates(latitude, longitude)]
+        fences = [f for f in fences
+                  if f.owner == owner and f.applies_to(vin)]
+        self.stats["checks"] += len(fences)
+        inside = set()
+        circles = [f for f in fences if isinstance(f.shape, Circle)]
+        if len(circles) >= VECTOR_MIN:
+            inside = circles_containing(circles, latitude, longitude)
+            fences = [f for f in fences if not isinstance(f.shape, Circle)]
+        for fence in fences:
+            if fence.shape.contains(latitude, longitude):
+                inside.add(fence.id)
+        for kind, ids in (("exit", track.inside - inside),
+                          ("enter", inside - track.inside)):
+            for fence_id in ids:
+                track.events.append({
+                    "type": kind,
+                    "fence": fence_id,
+                    "name": self._fences[fence_id].name,
+                    "time": ts,
+                })
+                self.stats["events"] += 1
+        track.inside = inside
+
+    def _follow(self, track, ts, latitude, longitude):
+        anchor = track.anchor
+        if anchor is None:
+            track.anchor = (ts, latitude, longitude)
+            return
+        trip = track.trip
+        moved = distance(anchor[1], anchor[2], latitude, longitude)
+        if moved < self.move_threshold:
+            # Still there: a trip starting later starts from this reading
+            track.anchor = (ts, anchor[1], anchor[2])
+            if trip is not None and ts - trip["end"] >= self.stop_gap:
+                self._end_trip(track)
+            return
+
+        if trip is not None and ts - trip["end"] >= self.stop_gap:
+            # Parked long enough between two readings: a new trip
+            self._end_trip(track)
+            trip = None
+        if trip is None:
+            trip = track.trip = {
+                "start": anchor[0],
+                "end": ts,
+                "start_position": {"latitude": anchor[1],
+                                   "longitude": anchor[2]},
+                "end_position": None,
+                "distance": 0.0,
+            }
+        trip["end"] = ts
+        trip["end_position"] = {"latitude": latitude, "longitude": longitude}
+        trip["distance"] += moved
+        track.anchor = (ts, latitude, longitude)
+
+    def _end_trip(self, track):
+        trip = track.trip
+        trip["distance"] = round(trip["distance"], 1)
+        track.trips.append({**trip, "ongoing": False})
+        track.trip = None
+        self.stats["trips"] += 1
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                stored = json.load(f)
+            for data in stored:
+                self._add(Geofence(
+                    data["owner"], data["name"], make_shape(data),
+                    data.get("vins"), data["id"], data.get("created_at")))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error("Failed to load geofences from %s: %s",
+                         self.path, e)
+
+    def _save(self):
+        if not self.path:
+            return
+        stored = [{**fence.to_dict(), "owner": fence.owner}
+                  for fence in self._fences.values()]
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(stored, f)
+            # Atomic on POSIX: readers never see a half-written file
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error("Failed to save geofences to %s: %s", self.path, e)
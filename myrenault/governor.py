@@ -0,0 +1,220 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+
+class UpstreamBusyError(Exception):
+    """Raised when a call could not get an upstream slot in time."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Account:
+    def __init__(self, burst):
+        self.tokens = float(burst)
+        self.refilled_at = time.monotonic()
+        self.active = 0
+        self.waiters = deque()  # futures waiting for a slot
+        self.blocked_until = 0.0
+        self.last_used = self.refilled_at
+
+    def reserve(self, rate, burst, now):
+        """
+        Takes a token from the bucket and returns how long to wait before
+        it is actually available (the bucket may go into debt).
+        """
+        self.tokens = min(burst, self.tokens + (now - self.refilled_at) * rate)
+        self.refilled_at = now
+        self.tokens -= 1
+        return max(0.0, -self.tokens / rate)
+
+    def idle(self, now):
+        return (not self.active and not self.waiters
+                and now >= self.blocked_until and now - self.last_used > 60)
+
+
+class UpstreamGovernor:
+    """
+    Limits how hard each Renault account, and the process as a whole, hits
+    the upstream API.
+
+    A call first takes a token from its account's bucket (`rate` calls per
+    second, bursts of `burst`) and waits out any backoff requested by
+    Renault (429 / Retry-After). It then waits for a slot: at most
+    `per_account` concurrent calls per account and `global_limit` overall.
+    Slots are handed out round-robin across accounts, so one busy account
+    cannot starve the others. A call that cannot start within `max_wait`
+    seconds fails with UpstreamBusyError instead of queueing forever.
+
+    With a shared `state` backend, the account buckets are kept there, so
+    that the rate holds for every worker together; concurrency limits stay
+    per process.
+    """
+
+    def __init__(self, per_account=4, global_limit=32, rate=2.0, burst=10,
+                 max_wait=10.0, max_accounts=10000, state=None):
+        self.per_account = per_account
+        self.global_limit = global_limit
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self.max_accounts = max_accounts
+        self.state = state
+        self._accounts = {}  # account key -> _Account
+        self._ready = deque()  # accounts with waiters, in round-robin order
+        self._active = 0
+        self.stats = {
+            "calls": 0,
+            "rejected": 0,
+            "backoffs": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0
+        }
+
+    def get_stats(self):
+        return {
+            "active": self._active,
+            "queue_depth": sum(
+                len(a.waiters) for a in self._accounts.values()),
+            "accounts": len(self._accounts),
+            **self.stats
+        }
+
+    def clear(self):
+        self._accounts.clear()
+        self._ready.clear()
+        self._active = 0
+
+    @asynccontextmanager
+    async def slot(self, key):
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+    def backoff(self, key, seconds):
+        """Holds back every new call of the account for `seconds`."""
+        account = self._account(key)
+        until = time.monotonic() + seconds
+        if until > account.blocked_until:
+            logger.warning("Renault throttled an account, backing off "
+                           "for %.0fs", seconds)
+            account.blocked_until = until
+            self.stats["backoffs"] += 1
+
+    async def acquire(self, key):
+        started = time.monotonic()
+        deadline = started + self.max_wait
+        account = self._account(key)
+        account.last_used = started
+
+        # Rate limit and backoff
+        if self.state is None:
+            reserved = account.reserve(self.rate, self.burst, started)
+        else:
+            reserved = await self.state.reserve(
+                f"upstream:{key}", self.rate, self.burst)
+        delay = max(reserved, account.blocked_until - started)
+        if started + delay > deadline:
+            if self.state is None:
+                account.tokens += 1
+            else:
+                await self.state.reserve(
+                    f"upstream:{key}", self.rate, self.burst, -1)
+            self._reject(delay)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        # Concurrency
+        if not self._ready and self._can_start(account):
+            self._start(account)
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            account.waiters.append(waiter)
+            if account not in self._ready:
+                self._ready.append(account)
+            self._dispatch()
+            try:
+                await asyncio.wait_for(
+                    waiter, max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                self._discard(account, waiter)
+                self._reject(None)
+            except asyncio.CancelledError:
+                self._discard(account, waiter)
+                raise
+
+        waited = time.monotonic() - started
+        self.stats["calls"] += 1
+        self.stats["wait_seconds_total"] += waited
+        self.stats["wait_seconds_max"] = max(
+            self.stats["wait_seconds_max"], waited)
+
+    def release(self, key):
+        account = self._accounts.get(key)
+        if account is not None:
+            account.active -= 1
+            account.last_used = time.monotonic()
+        self._active -= 1
+        self._dispatch()
+
+    def _account(self, key):
+        account = self._accounts.get(key)
+        if account is None:
+            if len(self._accounts) >= self.max_accounts:
+                self._prune()
+            account = self._accounts[key] = _Account(self.burst)
+        return account
+
+    def _prune(self):
+        now = time.monotonic()
+        for key in [k for k, a in self._accounts.items() if a.idle(now)]:
+            del self._accounts[key]
+
+    def _can_start(self, account):
+        return (self._active < self.global_limit
+                and account.active < self.per_account)
+
+    def _start(self, account):
+        account.active += 1
+        self._active += 1
+
+    def _discard(self, account, waiter):
+        try:
+            account.waiters.remove(waiter)
+        except ValueError:
+            pass
+        # The slot may have been granted just as the wait timed out
+        if waiter.done() and not waiter.cancelled():
+            account.active -= 1
+            self._active -= 1
+            self._dispatch()
+
+    def _dispatch(self):
+        # Hand free slots to waiting accounts in turn
+        for _ in range(len(self._ready)):
+            if self._active >= self.global_limit:
+                return
+            account = self._ready.popleft()
+            while account.waiters and account.waiters[0].done():
+                account.waiters.popleft()
+            if not account.waiters:
+                continue
+            if account.active < self.per_account:
+                self._start(account)
+                account.waiters.popleft().set_result(None)
+            if account.waiters:
+                self._ready.append(account)
+
+    def _reject(self, retry_after):
+        self.stats["rejected"] += 1
+        raise UpstreamBusyError(
+            "Too many pending requests to the Renault API", retry_after)
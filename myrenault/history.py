@@ -0,0 +1,224 @@
+import time
+import queue
+import sqlite3
+import logging
+import datetime
+import threading
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+# Numeric fields kept for each kind of reading
+FIELDS = {
+    "battery": (
+        "batteryLevel",
+        "batteryAutonomy",
+        "chargingStatus",
+        "plugStatus",
+        "batteryTemperature",
+        "chargingInstantaneousPower",
+    ),
+    "cockpit": ("totalMileage",),
+    "location": ("latitude", "longitude"),
+}
+
+# Upper bound of buckets returned by one query; larger ranges get a
+# coarser step instead of more rows.
+MAX_BUCKETS = 2000
+
+_STOP = object()
+
+
+def parse_timestamp(value):
+    """Converts an upstream ISO 8601 timestamp to epoch seconds."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return int(parsed.timestamp())
+
+
+class HistoryStore:
+    """
+    Append-only store of telemetry samples in SQLite (WAL mode).
+
+    Each kind has its own table keyed by (vin, ts), where ts is the upstream
+    timestamp, so a reading seen several times is stored once. Cockpit
+    readings carry no timestamp: they are stamped on arrival and only
+    stored when the mileage changed.
+
+    Writes never block the event loop: record() queues the sample and a
+    background thread inserts queued samples in batches. Queries are
+    synchronous and meant to be run in a worker thread.
+    """
+
+    def __init__(self, path, retention_days=0, queue_size=10000,
+                 batch_size=500):
+        self.path = path
+        self.retention = retention_days * 86400
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._local = threading.local()
+        self._last_mileage = {}  # VIN -> last recorded totalMileage
+        self._last_prune = 0
+        self.stats = {
+            "recorded": 0,
+            "written": 0,
+            "dropped": 0
+        }
+
+    def get_stats(self):
+        return {"queued": self._queue.qsize(), **self.stats}
+
+    def record(self, kind, vin, data):
+        """Queues a reading for storage. Never blocks."""
+        fields = FIELDS.get(kind)
+        if fields is None or not data:
+            return
+
+        if kind == "cockpit":
+            mileage = data.get("totalMileage")
+            if mileage is None or self._last_mileage.get(vin) == mileage:
+                return
+            self._last_mileage[vin] = mileage
+            ts = int(time.time())
+        else:
+            ts = parse_timestamp(data.get("timestamp")) or int(time.time())
+
+        row = (vin, ts, *(data.get(f) for f in fields))
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait((kind, row))
+            self.stats["recorded"] += 1
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def flush(self):
+        """Waits until every queued sample is written."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def query(self, kind, vin, start, end, step):
+        """
+        Returns samples of `vin` between `start` and `end` (epoch seconds)
+        aggregated into buckets of `step` seconds, as
+        (effective step, [{"time", "count", field: {"min", "max", "avg"}}]).
+        """
+        fields = FIELDS[kind]
+        step = max(1, int(step), -(-(end - start) // MAX_BUCKETS))
+
+        columns = ", ".join(
+            f'MIN("{f}"), MAX("{f}"), AVG("{f}")' for f in fields)
+        sql = (
+            f"SELECT (ts / ?) * ? AS bucket, COUNT(*), {columns} "
+            f"FROM {kind} WHERE vin = ? AND ts >= ? AND ts < ? "
+            "GROUP BY bucket ORDER BY bucket"
+        )
+        cursor = self._connection().execute(
+            sql, (step, step, vin, start, end))
+
+        buckets = []
+        for row in cursor:
+            bucket = {"time": row[0], "count": row[1]}
+            for i, field in enumerate(fields):
+                low, high, avg = row[2 + 3 * i:5 + 3 * i]
+                bucket[field] = {"min": low, "max": high, "avg": avg}
+            buckets.append(bucket)
+        return step, buckets
+
+    def samples(self, kind, vin, start=None, end=None):
+        """
+        Raw samples of `vin` with start <= ts < end, oldest first, as
+        (ts, values) like SampleStore.samples().
+        """
+        fields = FIELDS[kind]
+        columns = ", ".join(f'"{f}"' for f in fields)
+        cursor = self._connection().execute(
+            f"SELECT ts, {columns} FROM {kind} "
+            "WHERE vin = ? AND ts >= ? AND ts < ? ORDER BY ts",
+            (vin, start if start is not None else -2**63,
+             end if end is not None else 2**63 - 1))
+        return [(row[0], row[1:]) for row in cursor]
+
+    def _connection(self):
+        # SQLite connections cannot be shared between threads; WAL lets
+        # each reader thread query while the writer appends.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for kind, fields in FIELDS.items():
+            columns = ", ".join(f'"{f}" REAL' for f in fields)
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {kind} ("
+                f"vin TEXT NOT NULL, ts INTEGER NOT NULL, {columns}, "
+                "PRIMARY KEY (vin, ts)) WITHOUT ROWID"
+            )
+        conn.commit()
+        return conn
+
+    def _start(self):
+        self._connection()  # Creates the schema before any query
+        self._thread = threading.Thread(
+            target=self._write_loop, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = _STOP in batch
+            rows = [item for item in batch if item is not _STOP]
+            try:
+                self._write(conn, rows)
+            except sqlite3.Error as e:
+                logger.error("Failed to write %d samples: %s", len(rows), e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                conn.close()
+                return
+
+    def _write(self, conn, rows):
+        by_kind = {}
+        for kind, row in rows:
+            by_kind.setdefault(kind, []).append(row)
+
+        with conn:
+            for kind, kind_rows in by_kind.items():
+                placeholders = ", ".join("?" * (2 + len(FIELDS[kind])))
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO {kind} VALUES ({placeholders})",
+                    kind_rows)
+            self.stats["written"] += len(rows)
+
+            now = time.time()
+            if self.retention and now - self._last_prune > 3600:
+                self._last_prune = now
+                for kind in FIELDS:
+                    conn.execute(f"DELETE FROM {kind} WHERE ts < ?",
+                                 (int(now - self.retention),))
@@ -0,0 +1,262 @@
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+
+from myrenault.logs import request_id
+from myrenault.pool import credentials_key
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+# Action name -> MyRenaultClient method
+ACTIONS = {
+    "hvac_start": "hvac_start",
+    "hvac_stop": "hvac_stop",
+    "charge_start": "charge_start",
+    "charge_stop": "charge_stop",
+    "lights": "blink_lights",
+    "honk": "honk",
+}
+
+# A queued action is dropped when its opposite is submitted after it
+CONFLICTS = {
+    "hvac_start": "hvac_stop",
+    "hvac_stop": "hvac_start",
+    "charge_start": "charge_stop",
+    "charge_stop": "charge_start",
+}
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+SUPERSEDED = "superseded"
+FINISHED = (SUCCEEDED, FAILED, SUPERSEDED)
+
+
+class Job:
+    def __init__(self, account_key, vin, action, args, email, password):
+        self.id = uuid.uuid4().hex
+        self.account_key = account_key
+        self.vin = vin
+        self.action = action
+        self.args = tuple(args)
+        self.status = QUEUED
+        self.submissions = 1
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.superseded_by = None
+        # Logs of the job carry the id of the request that submitted it
+        self.request_id = request_id.get()
+        # Credentials are only kept until the job has run
+        self._credentials = (email, password)
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "vin": self.vin,
+            "action": self.action,
+            "args": list(self.args),
+            "status": self.status,
+            "submissions": self.submissions,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+            "superseded_by": self.superseded_by,
+        }
+
+    async def wait(self, timeout=None):
+        """
+        Waits for the next status change, up to `timeout` seconds.
+        Returns the job.
+        """
+        if not self.finished:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self
+
+    async def wait_finished(self, timeout):
+        deadline = time.monotonic() + timeout
+        while not self.finished:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await self.wait(remaining)
+        return self
+
+    def _set_status(self, status):
+        self.status = status
+        if status == RUNNING:
+            self.started_at = time.time()
+        elif status in FINISHED:
+            self.finished_at = time.time()
+            self._credentials = None
+        # Wake the current waiters, later ones wait for the next change
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+
+class JobQueue:
+    """
+    Runs remote actions in the background so that POST requests return
+    immediately with a job id.
+
+    Submitting an action identical to one already queued or running for
+    the same vehicle returns the existing job. Submitting an action that
+    conflicts with a queued one (start vs stop, or the same action with
+    other arguments) supersedes the queued job. Actions of one vehicle run
+    one at a time, in submission order.
+    """
+
+    def __init__(self, client_factory, workers=4, max_jobs=1000,
+                 job_ttl=3600, publisher=None):
+        self.client_factory = client_factory
+        self.publisher = publisher  # told about finished jobs, optional
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.job_ttl = job_ttl
+        self._jobs = OrderedDict()  # job id -> Job, oldest first
+        self._pending = {}  # (account key, VIN) -> [queued/running jobs]
+        self._vehicle_locks = {}  # (account key, VIN) -> asyncio.Lock
+        self._queue = None
+        self._tasks = []
+        self.stats = {
+            "submitted": 0,
+            "coalesced": 0,
+            "superseded": 0,
+            "succeeded": 0,
+            "failed": 0
+        }
+
+    def get_stats(self):
+        return {
+            "jobs": len(self._jobs),
+            "queued": self._queue.qsize() if self._queue else 0,
+            **self.stats
+        }
+
+    def get(self, job_id):
+        self._expire()
+        return self._jobs.get(job_id)
+
+    def submit(self, email, password, vin, action, args=()):
+        if action not in ACTIONS:
+            raise KeyError(f"Unknown action: {action}")
+        self._ensure_workers()
+        self._expire()
+
+        vin = vin.strip().upper()
+        key = (credentials_key(email, password), vin)
+        pending = self._pending.setdefault(key, [])
+        self.stats["submitted"] += 1
+
+        for job in pending:
+            if job.action == action and job.args == tuple(args):
+                job.submissions += 1
+                self.stats["coalesced"] += 1
+                return job
+
+        job = Job(key[0], vin, action, args, email, password)
+        for queued in [j for j in pending if j.status == QUEUED]:
+            if queued.action in (action, CONFLICTS.get(action)):
+                queued.superseded_by = job.id
+                queued._set_status(SUPERSEDED)
+                pending.remove(queued)
+                self.stats["superseded"] += 1
+
+        pending.append(job)
+        self._jobs[job.id] = job
+        self._queue.put_nowait(job)
+        return job
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def _ensure_workers(self):
+        loop = asyncio.get_running_loop()
+        alive = [t for t in self._tasks
+                 if not t.done() and t.get_loop() is loop]
+        if self._queue is None or len(alive) != len(self._tasks):
+            # Jobs queued in a loop that is gone cannot run anymore
+            for pending in self._pending.values():
+                for job in pending:
+                    job.error = "Worker stopped before the job finished"
+                    job._set_status(FAILED)
+            self._pending = {}
+            self._vehicle_locks = {}
+            self._queue = asyncio.Queue()
+            self._tasks = []
+        while len(self._tasks) < self.workers:
+            self._tasks.append(asyncio.ensure_future(self._work()))
+
+    async def _work(self):
+        queue = self._queue
+        while True:
+            job = await queue.get()
+            try:
+                if job.status == QUEUED:
+                    await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Job %s crashed", job.id)
+            finally:
+                queue.task_done()
+
+    async def _run(self, job):
+        key = (job.account_key, job.vin)
+        lock = self._vehicle_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            if job.status != QUEUED:
+                return
+            job._set_status(RUNNING)
+            request_id.set(job.request_id)
+            email, password = job._credentials
+            try:
+                client = await self.client_factory(email, password)
+                method = getattr(client, ACTIONS[job.action])
+                job.result = await method(job.vin, *job.args)
+                job._set_status(SUCCEEDED)
+                self.stats["succeeded"] += 1
+            except Exception as e:
+                logger.error("Job %s on %s failed: %s", job.action, job.vin, e)
+                job.error = str(e) or type(e).__name__
+                job._set_status(FAILED)
+                self.stats["failed"] += 1
+            finally:
+                if self.publisher is not None and job.finished:
+                    self.publisher.publish_job(job)
+                pending = self._pending.get(key, [])
+                if job in pending:
+                    pending.remove(job)
+                if not pending:
+                    self._pending.pop(key, None)
+                    self._vehicle_locks.pop(key, None)
+
+    def _expire(self):
+        now = time.time()
+        while self._jobs:
+            job = next(iter(self._jobs.values()))
+            too_many = len(self._jobs) > self.max_jobs
+            expired = job.finished and now - job.finished_at > self.job_ttl
+            if not (too_many and job.finished) and not expired:
+                break
+            del self._jobs[job.id]
@@ -0,0 +1,60 @@
+import sys
+import time
+import logging
+import importlib
+import importlib.util
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+# Heavy modules imported on first use rather than when the app starts:
+# together they take more time to import than the rest of the app. numpy
+# is imported inside the functions using it rather than with
+# lazy_import(): libraries look it up in sys.modules (pytest.approx does)
+# and would load a lazy one at unexpected times.
+DEFERRED = (
+    "aiohttp",
+    "renault_api.kamereon",
+    "renault_api.credential",
+    "renault_api.renault_client",
+    "numpy",
+)
+
+
+def lazy_import(name):
+    """
+    Module `name`, registered in sys.modules but only executed on first
+    attribute access (importlib.util.LazyLoader). Code keeps using it as
+    an imported module: `aiohttp.ClientError` in an except clause loads
+    aiohttp the first time an exception reaches that clause.
+
+    The parent package of `name` is imported right away, so it must be
+    light (renault_api is, renault_api.kamereon is not).
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    parent, _, child = name.rpartition(".")
+    if parent:
+        # As the import system does, for `import a.b` then `a.b.x`
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
+def load(names=DEFERRED):
+    """Imports the deferred modules of `names` now."""
+    for name in names:
+        started = time.perf_counter()
+        # Lazy modules (from lazy_import) run on any attribute access;
+        # the others (e.g. numpy, imported where used) are imported here
+        getattr(importlib.import_module(name), "__file__", None)
+        logger.debug("Loaded %s in %.0f ms", name,
+                     (time.perf_counter() - started) * 1000)
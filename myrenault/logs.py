@@ -0,0 +1,282 @@
+import re
+import sys
+import json
+import time
+import uuid
+import queue
+import logging
+import contextvars
+from collections.abc import Mapping
+from logging.handlers import QueueHandler, QueueListener
+
+# Id of the API request being served, attached to every record logged
+# while serving it (None outside of requests, e.g. background loops)
+request_id = contextvars.ContextVar("request_id", default=None)
+
+REDACTED = "[redacted]"
+
+# Keys of dicts (and `extra` fields) whose values never reach the logs:
+# credentials, tokens and GPS coordinates
+REDACTED_KEYS = frozenset({
+    "email", "password", "x-renault-email", "x-renault-password",
+    "authorization", "token", "login_token", "jwt", "credentials",
+    "latitude", "longitude", "gpslatitude", "gpslongitude",
+})
+
+# Same, for text already formatted into a message (e.g. exceptions)
+_SECRET_PATTERNS = (
+    (re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+"), REDACTED),
+    (re.compile(r"(?i)(bearer\s+)[^\s,;]+"), rf"\g<1>{REDACTED}"),
+    (re.compile(r"(?i)((?:gps)?(?:latitude|longitude)['\"]?[:=]\s*)"
+                r"-?\d+(?:\.\d+)?"), rf"\g<1>{REDACTED}"),
+)
+
+# Attributes of every LogRecord; anything else was passed with `extra`
+_RECORD_ATTRIBUTES = frozenset(
+    vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "request_id", "sampled_out"}
+
+
+def redact(value):
+    """Copy of `value` without credentials and GPS coordinates."""
+    if isinstance(value, Mapping):
+        return {
+            k: REDACTED if str(k).lower() in REDACTED_KEYS else redact(v)
+            for k, v in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return type(value)(redact(v) for v in value)
+    if isinstance(value, str):
+        return scrub(value)
+    return value
+
+
+def scrub(text):
+    for pattern, replacement in _SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class _RedactingFormatter(logging.Formatter):
+    def message(self, record):
+        if isinstance(record.args, Mapping):
+            record.args = redact(record.args)
+        elif record.args:
+            record.args = tuple(redact(a) for a in record.args)
+        return scrub(record.getMessage())
+
+
+class TextFormatter(_RedactingFormatter):
+    def __init__(self):
+        super().__init__(
+            "%(asctime)s %(levelname)s %(name)s [%(request_id)s] "
+            "%(message)s")
+
+    def format(self, record):
+        record.message = self.message(record)
+        record.asctime = self.formatTime(record)
+        record.request_id = getattr(record, "request_id", None) or "-"
+        text = self.formatMessage(record)
+        if getattr(record, "sampled_out", 0):
+            text += f" ({record.sampled_out} similar messages sampled out)"
+        if record.exc_info:
+            text += "\n" + scrub(self.formatException(record.exc_info))
+        return text
+
+
+class JsonFormatter(_RedactingFormatter):
+    """
+    One JSON object per record. Fields passed with `extra` are kept as
+    structured fields.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": self.message(record),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES:
+                entry[name] = REDACTED if name.lower() in REDACTED_KEYS \
+                    else redact(value)
+        if getattr(record, "sampled_out", 0):
+            entry["sampled_out"] = record.sampled_out
+        if record.exc_info:
+            entry["exception"] = scrub(self.formatException(record.exc_info))
+        return json.dumps(entry, default=str)
+
+    def formatTime(self, record, datefmt=None):
+        return time.strftime(
+            "%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + (
+            f".{int(record.msecs):03d}Z")
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets through at most `burst` records of each message below WARNING
+    every `period` seconds. The next record let through tells how many
+    were dropped in between (`sampled_out`).
+
+    Messages are told apart by their template, so this expects lazy
+    formatting (logger.debug("Read %s", vin)), not f-strings.
+    """
+
+    MAX_MESSAGES = 1024
+
+    def __init__(self, burst=20, period=1.0):
+        super().__init__()
+        self.burst = burst
+        self.period = period
+        self._windows = {}  # (logger, template) -> [start, count, dropped]
+        self.sampled_out = 0
+
+    def filter(self, record):
+        if self.burst <= 0 or record.levelno >= logging.WARNING:
+            return True
+        now = record.created
+        key = (record.name, record.msg)
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.period:
+            if window is None and len(self._windows) >= self.MAX_MESSAGES:
+                self._windows.clear()
+            dropped = window[2] if window is not None else 0
+            window = self._windows[key] = [now, 0, 0]
+            if dropped:
+                record.sampled_out = dropped
+        window[1] += 1
+        if window[1] > self.burst:
+            window[2] += 1
+            self.sampled_out += 1
+            return False
+        return True
+
+
+class _AsyncHandler(QueueHandler):
+    """
+    Hands records to the writer thread as they are: formatting,
+    redaction and I/O all happen off the event loop.
+    """
+
+    def __init__(self, records, stats):
+        super().__init__(records)
+        self.stats = stats
+
+    def prepare(self, record):
+        # The writer thread does not run in the context of the request
+        record.request_id = request_id.get()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            self.stats["queued"] += 1
+        except queue.Full:
+            # Never block the event loop on a slow log sink
+            self.stats["dropped"] += 1
+
+
+class LogPipeline:
+    """
+    Logging of the whole process through a bounded queue: the root logger
+    only enqueues records, which a background thread formats (as JSON or
+    text) and writes to `stream`. Records below WARNING are sampled per
+    message, and records are dropped rather than blocking when the queue
+    is full.
+
+    start() and stop() (which flushes the queue) are idempotent.
+    """
+
+    def __init__(self, level="INFO", fmt="json", queue_size=10000,
+                 sample_burst=20, sample_period=1.0, stream=None):
+        self.level = level
+        self.fmt = fmt
+        self.queue_size = queue_size
+        self.stream = stream
+        self.sampler = SamplingFilter(sample_burst, sample_period)
+        self._queue = queue.Queue(queue_size)
+        self._handler = None
+        self._listener = None
+        self._previous_level = None
+        self.stats = {
+            "queued": 0,
+            "dropped": 0
+        }
+
+    def get_stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "sampled_out": self.sampler.sampled_out,
+            **self.stats
+        }
+
+    def start(self):
+        if self._listener is not None:
+            return
+        writer = logging.StreamHandler(self.stream or sys.stderr)
+        writer.setFormatter(
+            JsonFormatter() if self.fmt == "json" else TextFormatter())
+        self._listener = QueueListener(self._queue, writer)
+        self._listener.start()
+
+        self._handler = _AsyncHandler(self._queue, self.stats)
+        self._handler.addFilter(self.sampler)
+        root = logging.getLogger()
+        root.addHandler(self._handler)
+        self._previous_level = root.level
+        root.setLevel(self.level)
+
+    def stop(self):
+        if self._listener is None:
+            return
+        root = logging.getLogger()
+        root.removeHandler(self._handler)
+        root.setLevel(self._previous_level)
+        self._listener.stop()
+        self._handler = None
+        self._listener = None
+
+
+class RequestIdMiddleware:
+    """
+    ASGI middleware giving every HTTP request a correlation id: the
+    caller's X-Request-ID if it sent a sensible one, a new one otherwise.
+    The id is returned in the X-Request-ID response header and attached
+    to every record logged while serving the request, down to the
+    client calls and the jobs it submits.
+    """
+
+    HEADER = b"x-request-id"
+    MAX_LENGTH = 128
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+
+        value = dict(scope["headers"]).get(self.HEADER, b"")
+        try:
+            value = value.decode("ascii")
+        except UnicodeDecodeError:
+            value = ""
+        if not value or len(value) > self.MAX_LENGTH or \
+                not value.isprintable():
+            value = uuid.uuid4().hex
+        token = request_id.set(value)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (self.HEADER, value.encode("ascii"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id.reset(token)
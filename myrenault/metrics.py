@@ -0,0 +1,289 @@
+import time
+from bisect import bisect_left
+
+# Latency buckets (seconds) covering cache hits up to upstream timeouts
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0)
+
+
+def _escape(value):
+    return (str(value).replace("\\", "\\\\").replace("\n", "\\n")
+            .replace('"', '\\"'))
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}  # label values -> child
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def labels(self, *values):
+        """
+        Returns the child for these label values. Callers on a hot path
+        should keep the child rather than look it up on every call.
+        """
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def clear(self):
+        self._children.clear()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def _render_child(self, values, child):
+        labels = _format_labels(self.labelnames, values)
+        yield f"{self.name}{labels} {_format_value(child.value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        # Counts are stored per bucket and made cumulative when rendered
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def _render_child(self, values, child):
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),),
+                                child.counts):
+            total += count
+            le = 'le="' + _format_value(float(bound)) + '"'
+            labels = _format_labels(self.labelnames, values, le)
+            yield f"{self.name}_bucket{labels} {total}"
+        labels = _format_labels(self.labelnames, values)
+        yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+        yield f"{self.name}_count{labels} {total}"
+
+
+class Registry:
+    """
+    Process-wide set of metrics, rendered in the Prometheus text format.
+
+    Besides metrics updated as events happen, collectors (callables
+    returning (name, type, help, labels dict, value) tuples) are called at
+    scrape time to export state that components already keep, such as
+    cache statistics.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+
+    def register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(),
+                  buckets=DEFAULT_BUCKETS):
+        return self.register(
+            Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def clear(self):
+        for metric in self._metrics.values():
+            metric.clear()
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+
+        described = set()
+        for collector in self._collectors:
+            for name, kind, documentation, labels, value in collector():
+                if name not in described:
+                    described.add(name)
+                    lines.append(f"# HELP {name} {documentation}")
+                    lines.append(f"# TYPE {name} {kind}")
+                label_text = _format_labels(labels.keys(), labels.values())
+                lines.append(f"{name}{label_text} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def stats_collector(prefix, get_stats, gauges=()):
+    """
+    Exports the numeric entries of a component's get_stats() as metrics
+    named `<prefix>_<entry>`. Entries listed in `gauges` are current
+    values; the others only grow and are exported as counters.
+    """
+    def collect():
+        for name, value in get_stats().items():
+            if not isinstance(value, (int, float)):
+                continue
+            if name in gauges:
+                kind = "gauge"
+            else:
+                kind = "counter"
+                if not name.endswith("_total"):
+                    name += "_total"
+            yield (f"{prefix}_{name}", kind, f"{prefix} {name}", {}, value)
+    return collect
+
+
+REGISTRY = Registry()
+
+UPSTREAM_LATENCY = REGISTRY.histogram(
+    "renault_upstream_request_duration_seconds",
+    "Duration of calls to the Renault API.",
+    ("operation",))
+UPSTREAM_ERRORS = REGISTRY.counter(
+    "renault_upstream_errors_total",
+    "Failed calls to the Renault API, by exception class.",
+    ("operation", "exception"))
+UPSTREAM_IN_FLIGHT = REGISTRY.gauge(
+    "renault_upstream_in_flight",
+    "Calls to the Renault API currently in progress.",
+    ("operation",))
+CLIENT_CALLS = REGISTRY.counter(
+    "renault_client_calls_total",
+    "MyRenaultClient operations, by outcome.",
+    ("method", "outcome"))
+CLIENT_ERRORS = REGISTRY.counter(
+    "renault_client_errors_total",
+    "Failed MyRenaultClient operations, by exception class.",
+    ("method", "exception"))
+HTTP_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds",
+    "Duration of HTTP requests, by route.",
+    ("method", "route"))
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total",
+    "HTTP requests, by route and status code.",
+    ("method", "route", "status"))
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being served.")
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request by route template (e.g.
+    /api/v1/vehicle/{vin}/battery), so that label values stay bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope["method"]
+            HTTP_LATENCY.labels(method, route).observe(
+                time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, route, status).inc()
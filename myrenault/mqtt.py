@@ -0,0 +1,201 @@
+import os
+import time
+import uuid
+import struct
+import asyncio
+import logging
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+# MQTT 3.1.1 control packet types (high nibble of the first byte)
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+CONNACK_ERRORS = {
+    1: "unacceptable protocol version",
+    2: "client identifier rejected",
+    3: "server unavailable",
+    4: "bad user name or password",
+    5: "not authorized",
+}
+
+
+class MQTTError(Exception):
+    pass
+
+
+def encode_string(value):
+    data = value.encode("utf-8") if isinstance(value, str) else value
+    return struct.pack("!H", len(data)) + data
+
+
+def encode_packet(packet_type, flags, body):
+    """Fixed header (type, flags, remaining length) followed by `body`."""
+    header = bytearray([packet_type << 4 | flags])
+    length = len(body)
+    while True:
+        byte = length % 128
+        length //= 128
+        header.append(byte | 0x80 if length else byte)
+        if not length:
+            break
+    return bytes(header) + body
+
+
+async def read_packet(reader):
+    """Reads one packet, returning (type, flags, body)."""
+    first = await reader.readexactly(1)
+    length = 0
+    for shift in range(0, 28, 7):
+        byte = (await reader.readexactly(1))[0]
+        length |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+    else:
+        raise MQTTError("Malformed remaining length")
+    body = await reader.readexactly(length) if length else b""
+    return first[0] >> 4, first[0] & 0x0F, body
+
+
+def publish_packet(topic, payload, qos=0, retain=False, packet_id=None):
+    body = encode_string(topic)
+    if qos:
+        body += struct.pack("!H", packet_id)
+    return encode_packet(PUBLISH, qos << 1 | int(retain), body + payload)
+
+
+class MQTTClient:
+    """
+    Minimal MQTT 3.1.1 client publishing messages with QoS 0 or 1: enough
+    to feed a broker (e.g. mosquitto) without a client library. It does
+    not subscribe.
+
+    The connection is opened on the first publish() and again after an
+    error. publish_many() writes a whole batch at once and then waits for
+    the PUBACK of each QoS 1 message, so a batch costs one round trip.
+
+    Brokers drop a session when another connects with its client id: the
+    default id is unique to the process, so that workers do not take turns
+    kicking each other off. `tls` (True or an ssl.SSLContext) encrypts the
+    connection.
+    """
+
+    def __init__(self, host, port=1883, client_id=None, username=None,
+                 password=None, keepalive=60, timeout=10, tls=False):
+        self.host = host
+        self.port = port
+        self.client_id = client_id or \
+            f"renault-backend-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.username = username
+        self.password = password
+        self.keepalive = keepalive
+        self.timeout = timeout
+        if tls is True:
+            import ssl
+            tls = ssl.create_default_context()
+        self.tls = tls or None
+        self._reader = None
+        self._writer = None
+        self._packet_id = 0
+        self._last_io = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def connected(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                self.host, self.port, ssl=self.tls), self.timeout)
+        flags = 0x02  # Clean session
+        payload = encode_string(self.client_id)
+        if self.username is not None:
+            flags |= 0x80
+            payload += encode_string(self.username)
+            if self.password is not None:
+                flags |= 0x40
+                payload += encode_string(self.password)
+        body = (encode_string("MQTT") + bytes([4, flags])
+                + struct.pack("!H", self.keepalive) + payload)
+        self._writer.write(encode_packet(CONNECT, 0, body))
+        await self._writer.drain()
+        packet_type, _, body = await asyncio.wait_for(
+            read_packet(self._reader), self.timeout)
+        if packet_type != CONNACK or len(body) < 2:
+            await self.close()
+            raise MQTTError("Broker did not acknowledge the connection")
+        if body[1]:
+            await self.close()
+            raise MQTTError("Connection refused: " + CONNACK_ERRORS.get(
+                body[1], f"code {body[1]}"))
+        self._last_io = time.monotonic()
+
+    async def publish(self, topic, payload, qos=1, retain=False):
+        await self.publish_many([(topic, payload, retain)], qos)
+
+    async def publish_many(self, messages, qos=1):
+        """Publishes (topic, payload, retain) messages, in order."""
+        async with self._lock:
+            try:
+                await self._publish_many(messages, qos)
+            except (OSError, asyncio.IncompleteReadError,
+                    asyncio.TimeoutError, MQTTError):
+                # Reconnect on the next batch
+                await self.close()
+                raise
+
+    async def _publish_many(self, messages, qos):
+        if not self.connected:
+            await self.connect()
+        elif self.keepalive and (
+                time.monotonic() - self._last_io > self.keepalive / 2):
+            await self._ping()
+
+        pending = set()
+        data = []
+        for topic, payload, retain in messages:
+            packet_id = None
+            if qos:
+                packet_id = self._packet_id = self._packet_id % 65535 + 1
+                pending.add(packet_id)
+            if isinstance(payload, str):
+                payload = payload.encode("utf-8")
+            data.append(publish_packet(topic, payload, qos, retain,
+                                       packet_id))
+        self._writer.write(b"".join(data))
+        await self._writer.drain()
+        while pending:
+            packet_type, _, body = await asyncio.wait_for(
+                read_packet(self._reader), self.timeout)
+            if packet_type == PUBACK:
+                pending.discard(struct.unpack("!H", body[:2])[0])
+        self._last_io = time.monotonic()
+
+    async def _ping(self):
+        # Brokers drop connections idle for 1.5 keepalive periods
+        self._writer.write(encode_packet(PINGREQ, 0, b""))
+        await self._writer.drain()
+        packet_type, _, _ = await asyncio.wait_for(
+            read_packet(self._reader), self.timeout)
+        if packet_type != PINGRESP:
+            raise MQTTError("Broker did not answer the ping")
+        self._last_io = time.monotonic()
+
+    async def close(self):
+        writer, self._writer, self._reader = self._writer, None, None
+        if writer is None:
+            return
+        try:
+            if not writer.is_closing():
+                writer.write(encode_packet(DISCONNECT, 0, b""))
+            writer.close()
+            await writer.wait_closed()
+        except OSError:
+            pass
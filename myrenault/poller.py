@@ -0,0 +1,238 @@
+import time
+import asyncio
+import logging
+
+from myrenault.logs import request_id
+from myrenault.pool import credentials_key
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+# Kamereon chargingStatus reported while energy is flowing into the battery
+CHARGING_STATUSES = (1.0,)
+
+
+def is_charging(battery):
+    if not battery:
+        return False
+    return battery.get("chargingStatus") in CHARGING_STATUSES
+
+
+def diff(previous, current):
+    """Returns the fields of `current` that differ from `previous`."""
+    if previous is None:
+        return dict(current)
+    return {
+        field: value for field, value in current.items()
+        if previous.get(field) != value
+    }
+
+
+class Subscription:
+    def __init__(self, watch_key, vin, kinds, interval, queue_size=100):
+        self.watch_key = watch_key
+        self.vin = vin
+        self.kinds = tuple(kinds)
+        self.interval = interval
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+    async def get(self, timeout=None):
+        """Waits for the next event, or returns None after `timeout`."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class _Watch:
+    """Polling state of one vehicle for one account."""
+
+    def __init__(self, email, password, vin):
+        self.email = email
+        self.password = password
+        self.vin = vin
+        self.subscribers = set()
+        self.state = {}  # kind -> latest reading
+        self.idle_polls = 0
+        self.interval = None
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    @property
+    def kinds(self):
+        kinds = []
+        for sub in self.subscribers:
+            kinds.extend(k for k in sub.kinds if k not in kinds)
+        return kinds
+
+    @property
+    def base_interval(self):
+        return min(sub.interval for sub in self.subscribers)
+
+
+class TelemetryPoller:
+    """
+    Polls vehicles on behalf of streaming subscribers and pushes changes.
+
+    Subscribers of the same vehicle and account share one polling loop, so
+    Renault is read at most once per interval whatever the number of
+    subscribers. Readings go through MyRenaultClient.read(), so they also
+    refresh the response cache for regular GET requests.
+
+    The interval adapts to the vehicle: it is shortened to `fast_interval`
+    while charging and doubles (up to `max_interval`) with each poll that
+    brings no change, e.g. while the car is parked.
+    """
+
+    def __init__(self, client_factory, min_interval=30, fast_interval=60,
+                 max_interval=900, queue_size=100):
+        self.client_factory = client_factory
+        self.min_interval = min_interval
+        self.fast_interval = fast_interval
+        self.max_interval = max_interval
+        self.queue_size = queue_size
+        self._watches = {}  # (account key, VIN) -> _Watch
+        self.stats = {
+            "polls": 0,
+            "events": 0,
+            "dropped": 0
+        }
+
+    def get_stats(self):
+        return {
+            "watches": len(self._watches),
+            "subscribers": sum(
+                len(w.subscribers) for w in self._watches.values()),
+            **self.stats
+        }
+
+    def subscribe(self, email, password, vin, kinds, interval):
+        vin = vin.strip().upper()
+        key = (credentials_key(email, password), vin)
+        sub = Subscription(key, vin, kinds, max(interval, self.min_interval),
+                           self.queue_size)
+
+        watch = self._watches.get(key)
+        if watch is None:
+            watch = self._watches[key] = _Watch(email, password, vin)
+
+        # Late subscribers start from the state already known
+        for kind in sub.kinds:
+            if kind in watch.state:
+                self._push(sub, self._event(
+                    vin, kind, dict(watch.state[kind])))
+
+        watch.subscribers.add(sub)
+        if watch.task is None or watch.task.done():
+            watch.task = asyncio.ensure_future(self._run(watch))
+        elif watch.interval is not None and sub.interval < watch.interval:
+            # Poll sooner than the current schedule for the new subscriber
+            watch.wakeup.set()
+        return sub
+
+    def unsubscribe(self, sub):
+        watch = self._watches.get(sub.watch_key)
+        if watch is None:
+            return
+        watch.subscribers.discard(sub)
+        if not watch.subscribers:
+            del self._watches[sub.watch_key]
+            if watch.task is not None:
+                watch.task.cancel()
+
+    async def close(self):
+        tasks = [w.task for w in self._watches.values() if w.task]
+        self._watches.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, watch):
+        # Shared by every subscriber, not part of the request that started it
+        request_id.set(None)
+        while watch.subscribers:
+            started = time.monotonic()
+            changed = await self._poll(watch)
+            if not watch.subscribers:
+                break
+
+            if changed:
+                watch.idle_polls = 0
+            else:
+                watch.idle_polls += 1
+            watch.interval = self._next_interval(watch)
+
+            # Sleep for the remaining interval, unless a new subscriber
+            # asks for an earlier poll.
+            delay = watch.interval - (time.monotonic() - started)
+            watch.wakeup.clear()
+            try:
+                await asyncio.wait_for(watch.wakeup.wait(), max(0, delay))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, watch):
+        kinds = watch.kinds
+        if not kinds:
+            return False
+        self.stats["polls"] += 1
+        try:
+            client = await self.client_factory(watch.email, watch.password)
+            # A reading fetched by someone else within the interval is
+            # recent enough.
+            snapshot = await client.snapshot(
+                watch.vin, kinds, max_age=watch.base_interval)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Polling %s failed: %s", watch.vin, e)
+            self._broadcast(watch, "error", {"detail": str(e)})
+            return False
+
+        changed = False
+        for kind in kinds:
+            reading = snapshot.get(kind)
+            if reading is None:
+                error = snapshot["errors"].get(kind)
+                self._broadcast(watch, "error", {"kind": kind,
+                                                 "detail": error})
+                continue
+            delta = diff(watch.state.get(kind), reading)
+            if delta:
+                watch.state[kind] = reading
+                self._broadcast(watch, kind, delta)
+                changed = True
+        return changed
+
+    def _next_interval(self, watch):
+        base = watch.base_interval
+        if is_charging(watch.state.get("battery")):
+            return max(self.min_interval, min(base, self.fast_interval))
+        backoff = base * (2 ** min(watch.idle_polls, 10))
+        return max(base, min(backoff, self.max_interval))
+
+    def _event(self, vin, kind, data):
+        return {"vin": vin, "kind": kind, "data": data, "time": time.time()}
+
+    def _broadcast(self, watch, kind, data):
+        event = self._event(watch.vin, kind, data)
+        for sub in list(watch.subscribers):
+            if kind == "error" or kind in sub.kinds:
+                self._push(sub, event, watch)
+
+    def _push(self, sub, event, watch=None):
+        try:
+            sub.queue.put_nowait(event)
+            self.stats["events"] += 1
+        except asyncio.QueueFull:
+            # A slow consumer missed deltas: replace its backlog with the
+            # full current state so that it stays consistent.
+            self.stats["dropped"] += sub.queue.qsize()
+            while not sub.queue.empty():
+                sub.queue.get_nowait()
+            if watch is not None:
+                for kind in sub.kinds:
+                    if kind in watch.state:
+                        sub.queue.put_nowait(
+                            self._event(sub.vin, kind,
+                                        dict(watch.state[kind])))
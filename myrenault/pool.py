@@ -0,0 +1,220 @@
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+
+from myrenault.lazy import lazy_import
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+renault_credential = lazy_import("renault_api.credential")
+
+GIGYA_JWT_KEY = "gigya_jwt"
+
+
+def credentials_key(email, password):
+    """
+    Returns an opaque key identifying a set of credentials.
+    The credentials themselves are never kept as dictionary keys.
+    """
+    raw = f"{email.strip().lower()}\0{password}".encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+def get_token_expiry(client):
+    """
+    Returns the expiry (epoch seconds) of the Kamereon JWT held by a
+    RenaultClient, or None if no JWT has been minted yet.
+    """
+    try:
+        credential = client.session._credentials.get(GIGYA_JWT_KEY)
+    except Exception:
+        return None
+    if isinstance(credential, renault_credential.JWTCredential):
+        return credential.expiry
+    return None
+
+
+def supports_token_refresh(client):
+    """
+    Whether the renault-api session of a RenaultClient has the private
+    methods MyRenaultClient.refresh_token() uses to mint a JWT (they exist
+    in the version pinned in requirements.txt). Without them, a new JWT
+    takes a new login.
+    """
+    session = getattr(client, "session", None)
+    credentials = getattr(session, "_credentials", None)
+    return callable(getattr(session, "_get_jwt", None)) and \
+        callable(getattr(credentials, "clear_keys", None))
+
+
+def has_login_token(client):
+    """
+    The library drops the Gigya login token when Renault reports it as
+    expired; a client without one must log in again.
+    """
+    try:
+        token = client.session.login_token
+    except Exception:
+        return True
+    # Mocked sessions do not expose a real token, only treat an explicit
+    # None as "logged out".
+    return token is not None
+
+
+class PooledSession:
+    def __init__(self, key, client, websession):
+        self.key = key
+        self.client = client
+        self.websession = websession
+        self.logged_in_at = time.monotonic()
+        self.last_used = self.logged_in_at
+        self.vehicles = {}  # VIN -> vehicle object
+
+    def is_usable(self, websession, idle_ttl, max_age, now):
+        if self.websession is not websession:
+            return False
+        if self.websession is not None and self.websession.closed:
+            return False
+        if now - self.last_used > idle_ttl:
+            return False
+        if now - self.logged_in_at > max_age:
+            return False
+        return has_login_token(self.client)
+
+
+class SessionPool:
+    """
+    Bounded pool of logged-in RenaultClient instances shared by every
+    request of the process.
+
+    Entries are keyed by a hash of the credentials, evicted in LRU order
+    once `max_size` is reached, and dropped after `idle_ttl` seconds without
+    use or `max_age` seconds after login. Kamereon JWTs are refreshed by
+    renault-api itself from the Gigya login token, so a pooled client only
+    has to log in again when that token is gone.
+    """
+
+    def __init__(self, max_size=128, idle_ttl=1800, max_age=43200):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.max_age = max_age
+        self._entries = OrderedDict()  # key -> PooledSession
+        self._locks = {}  # key -> asyncio.Lock
+        self.stats = {
+            "hits": 0,
+            "logins": 0,
+            "evictions": 0
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get_stats(self):
+        return {"size": len(self._entries), **self.stats}
+
+    async def acquire(self, key, websession, login):
+        """
+        Returns the PooledSession for `key`, calling `login()` to create a
+        logged-in client when none is usable. Concurrent callers for the
+        same key share a single login.
+        """
+        entry = self._get_usable(key, websession)
+        if entry is not None:
+            return entry
+
+        async with self._lock(key):
+            # Another caller may have logged in while we were waiting
+            entry = self._get_usable(key, websession)
+            if entry is not None:
+                return entry
+            return await self._login(key, websession, login)
+
+    async def renew(self, key, websession, login):
+        """
+        Logs `key` in again ahead of `max_age`. Unlike invalidate(), the
+        current session keeps serving requests until the new one is ready.
+        """
+        async with self._lock(key):
+            return await self._login(key, websession, login)
+
+    def login_age(self, key):
+        """Seconds since `key` logged in, or None without a session."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        return time.monotonic() - entry.logged_in_at
+
+    def invalidate(self, key):
+        """Drop the pooled client for `key`, forcing a new login."""
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+        self._locks.clear()
+
+    def token_expiry(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        return get_token_expiry(entry.client)
+
+    def _lock(self, key):
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+    async def _login(self, key, websession, login):
+        try:
+            client = await login()
+        except BaseException:
+            # Locks go with the entries: a key that never logged in (e.g.
+            # a wrong password) must not leave one behind
+            if key not in self._entries:
+                self._locks.pop(key, None)
+            raise
+        self.stats["logins"] += 1
+        entry = PooledSession(key, client, websession)
+        self._store(entry)
+        return entry
+
+    def _get_usable(self, key, websession):
+        now = time.monotonic()
+        self._purge_idle(now)
+
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if not entry.is_usable(websession, self.idle_ttl, self.max_age, now):
+            logger.info("Pooled Renault session expired, logging in again.")
+            self.invalidate(key)
+            return None
+
+        entry.last_used = now
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry
+
+    def _store(self, entry):
+        self._entries[entry.key] = entry
+        self._entries.move_to_end(entry.key)
+        while len(self._entries) > self.max_size:
+            evicted_key, _ = self._entries.popitem(last=False)
+            self._locks.pop(evicted_key, None)
+            self.stats["evictions"] += 1
+
+    def _purge_idle(self, now):
+        # Entries are kept in least-recently-used order, so the idle ones
+        # are always at the front.
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry.last_used <= self.idle_ttl:
+                break
+            del self._entries[key]
+            self._locks.pop(key, None)
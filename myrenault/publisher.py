@@ -0,0 +1,474 @@
+import os
+import hmac
+import json
+import time
+import random
+import shutil
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict, deque
+from urllib.parse import urlsplit, unquote
+
+from myrenault.lazy import lazy_import
+from myrenault.mqtt import MQTTClient
+from myrenault.poller import diff
+from myrenault.serialization import dumps
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+aiohttp = lazy_import("aiohttp")
+
+# Exponential backoff of a failing destination (seconds)
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 300.0
+
+# Home Assistant sensor settings of the reading fields
+SENSORS = {
+    "batteryLevel": {"unit_of_measurement": "%", "device_class": "battery"},
+    "batteryAutonomy": {"unit_of_measurement": "km",
+                        "device_class": "distance"},
+    "batteryTemperature": {"unit_of_measurement": "°C",
+                           "device_class": "temperature"},
+    "chargingInstantaneousPower": {"unit_of_measurement": "kW",
+                                   "device_class": "power"},
+    "chargingStatus": {},
+    "plugStatus": {},
+    "totalMileage": {"unit_of_measurement": "km", "device_class": "distance",
+                     "state_class": "total_increasing"},
+}
+
+
+class DeliveryRejected(Exception):
+    """The destination refused the batch; sending it again cannot help."""
+
+
+def reading_event(vin, kind, data, changes):
+    return {"type": "reading", "vin": vin, "kind": kind, "time": time.time(),
+            "data": dict(data), "changes": changes}
+
+
+def job_event(job):
+    # Results are left out: they are raw Kamereon responses
+    return {"type": "job", "vin": job.vin, "time": time.time(),
+            "job": {"id": job.id, "action": job.action,
+                    "status": job.status, "error": job.error}}
+
+
+class WebhookDestination:
+    """
+    POSTs each batch of events to `url` as {"events": [...]}. With a
+    `secret`, the X-Renault-Signature header carries the HMAC-SHA256 of the
+    body ("sha256=<hex>") so that receivers can check where it comes from.
+    """
+
+    def __init__(self, url, secret=None, timeout=10):
+        self.url = url
+        self.name = f"webhook:{urlsplit(url).netloc}"
+        self.secret = secret.encode() if secret else None
+        self.timeout = timeout
+        self._session = None
+
+    async def send(self, events):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+        body = dumps({"events": events})
+        headers = {"Content-Type": "application/json"}
+        if self.secret:
+            digest = hmac.new(self.secret, body, hashlib.sha256).hexdigest()
+            headers["X-Renault-Signature"] = f"sha256={digest}"
+        async with self._session.post(
+                self.url, data=body, headers=headers) as response:
+            if 400 <= response.status < 500 and response.status not in (
+                    408, 429):
+                raise DeliveryRejected(
+                    f"{self.url} answered {response.status}")
+            if response.status >= 400:
+                raise aiohttp.ClientResponseError(
+                    response.request_info, response.history,
+                    status=response.status, message=response.reason)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class MQTTDestination:
+    """
+    Publishes events to an MQTT broker with Home Assistant style topics:
+
+    - `<prefix>/<VIN>/<kind>`: the latest reading as JSON (retained);
+    - `<prefix>/<VIN>/job`: finished remote actions;
+    - `<discovery>/sensor/...` and `<discovery>/device_tracker/...`:
+      MQTT discovery configs, published (retained) the first time a
+      vehicle is seen, so that its sensors appear in Home Assistant.
+    """
+
+    def __init__(self, client, prefix="renault", discovery="homeassistant"):
+        self.client = client
+        self.name = f"mqtt:{client.host}:{client.port}"
+        self.prefix = prefix.strip("/")
+        self.discovery = discovery.strip("/") if discovery else None
+        self._announced = set()  # (VIN, kind)
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        """mqtt://[user:password@]host[:port], or mqtts:// for TLS"""
+        parts = urlsplit(url)
+        if parts.scheme not in ("mqtt", "mqtts"):
+            raise ValueError(f"Unsupported MQTT URL scheme: {parts.scheme}")
+        tls = parts.scheme == "mqtts"
+        client = MQTTClient(
+            parts.hostname, parts.port or (8883 if tls else 1883),
+            username=unquote(parts.username) if parts.username else None,
+            password=unquote(parts.password) if parts.password else None,
+            tls=tls)
+        return cls(client, **kwargs)
+
+    def messages(self, event, announced):
+        """
+        (topic, payload, retain) of an event, with the discovery configs
+        of a vehicle and kind missing from `announced` (then added to it).
+        """
+        vin = event["vin"]
+        if event["type"] == "job":
+            return [(f"{self.prefix}/{vin}/job", dumps(event["job"]), False)]
+        kind = event["kind"]
+        messages = []
+        if self.discovery and (vin, kind) not in announced:
+            announced.add((vin, kind))
+            messages.extend(self.discovery_messages(vin, kind, event["data"]))
+        messages.append((f"{self.prefix}/{vin}/{kind}",
+                         dumps(event["data"]), True))
+        return messages
+
+    def discovery_messages(self, vin, kind, data):
+        state_topic = f"{self.prefix}/{vin}/{kind}"
+        device = {"identifiers": [f"renault_{vin}"],
+                  "name": f"Renault {vin}", "manufacturer": "Renault"}
+        if kind == "location":
+            config = {"name": "Location",
+                      "unique_id": f"renault_{vin}_location",
+                      "json_attributes_topic": state_topic,
+                      "device": device}
+            return [(f"{self.discovery}/device_tracker/renault_{vin}/config",
+                     dumps(config), True)]
+        messages = []
+        for field in data:
+            if field not in SENSORS:
+                continue
+            config = {
+                "name": field,
+                "unique_id": f"renault_{vin}_{field}",
+                "state_topic": state_topic,
+                "value_template": f"{{{{ value_json.{field} }}}}",
+                "device": device,
+                **SENSORS[field],
+            }
+            messages.append((
+                f"{self.discovery}/sensor/renault_{vin}_{field}/config",
+                dumps(config), True))
+        return messages
+
+    async def send(self, events):
+        announced = set(self._announced)
+        messages = [m for event in events
+                    for m in self.messages(event, announced)]
+        await self.client.publish_many(messages)
+        self._announced = announced
+
+    async def close(self):
+        await self.client.close()
+
+
+def _running(pid):
+    """Whether a process `pid` exists."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # e.g. owned by another user
+    return True
+
+
+class _Outbox:
+    """Events waiting for one destination."""
+
+    def __init__(self, destination, spill_path):
+        self.destination = destination
+        self.queue = deque()
+        self.overflow = []  # oldest events, to move to the spill file
+        self.spill_path = spill_path
+        self.spill_offset = 0  # bytes of the spill file already delivered
+        self.spilled = 0  # events in the spill file
+        self.failures = 0  # consecutive
+        self.busy = False  # a batch is being delivered
+        self.wakeup = asyncio.Event()
+        self.task = None
+        if spill_path and os.path.exists(spill_path):
+            with open(spill_path, "rb") as f:
+                self.spilled = sum(1 for _ in f)
+
+
+class EventPublisher:
+    """
+    Pushes telemetry changes and finished remote actions to webhooks and
+    MQTT brokers, so that home automation does not have to poll.
+
+    MyRenaultClient.read() and JobQueue call publish_reading() and
+    publish_job(), which only append the event to the outbox of each
+    destination. One task per destination sends the events in batches of
+    `batch_size`, waiting up to `batch_delay` seconds for a batch to fill,
+    with at most `concurrency` deliveries in progress overall. A failed
+    batch is retried with exponential backoff (and jitter) and keeps its
+    place, so events of a destination are delivered in order.
+
+    An outbox holds at most `queue_size` events. Beyond that the oldest
+    are appended to a file of `spill_dir` (JSON lines) and delivered from
+    there once the destination is back, also after a restart; without a
+    spill directory they are dropped.
+    """
+
+    def __init__(self, destinations, queue_size=1000, batch_size=50,
+                 batch_delay=0.5, concurrency=4, spill_dir=None,
+                 max_vehicles=20000):
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.concurrency = concurrency
+        self.spill_dir = spill_dir
+        self.max_vehicles = max_vehicles
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        self._outboxes = [
+            _Outbox(d, self._claim_spill(d) if spill_dir else None)
+            for d in destinations]
+        self._last = OrderedDict()  # (VIN, kind) -> latest reading
+        self._semaphore = None
+        self._loop = None
+        self.stats = {
+            "published": 0,
+            "delivered": 0,
+            "batches": 0,
+            "failures": 0,
+            "rejected": 0,
+            "spilled": 0,
+            "dropped": 0
+        }
+
+    def get_stats(self):
+        return {
+            "destinations": len(self._outboxes),
+            "queued": sum(len(o.queue) + len(o.overflow) + o.spilled
+                          for o in self._outboxes),
+            **self.stats
+        }
+
+    def publish_reading(self, vin, kind, data):
+        """Publishes `data` if it differs from the last reading of `vin`."""
+        key = (vin, kind)
+        changes = diff(self._last.get(key), data)
+        if not changes:
+            return
+        self._last[key] = data
+        self._last.move_to_end(key)
+        while len(self._last) > self.max_vehicles * 3:
+            self._last.popitem(last=False)
+        self.publish(reading_event(vin, kind, data, changes))
+
+    def publish_job(self, job):
+        self.publish(job_event(job))
+
+    def publish(self, event):
+        self.stats["published"] += 1
+        for outbox in self._outboxes:
+            outbox.queue.append(event)
+            while len(outbox.queue) > self.queue_size:
+                spill = outbox.spill_path and (
+                    len(outbox.overflow) < self.queue_size)
+                if spill:
+                    outbox.overflow.append(outbox.queue.popleft())
+                else:
+                    outbox.queue.popleft()
+                    self.stats["dropped"] += 1
+            self._ensure_worker(outbox)
+            outbox.wakeup.set()
+
+    async def flush(self, timeout=None):
+        """Waits until every queued event was delivered (or `timeout`)."""
+        async def drained():
+            while any(o.queue or o.overflow or o.spilled or o.busy
+                      for o in self._outboxes):
+                await asyncio.sleep(0.01)
+        await asyncio.wait_for(drained(), timeout)
+
+    async def close(self):
+        for outbox in self._outboxes:
+            if outbox.task is not None:
+                outbox.task.cancel()
+                await asyncio.gather(outbox.task, return_exceptions=True)
+                outbox.task = None
+            if outbox.spill_path:
+                # Kept for the next start
+                events = outbox.overflow + list(outbox.queue)
+                outbox.overflow = []
+                outbox.queue.clear()
+                await asyncio.to_thread(self._spill, outbox, events)
+            await outbox.destination.close()
+
+    def clear(self):
+        self._last.clear()
+
+    def _claim_spill(self, destination):
+        """
+        The spill file of `destination` for this process. Each worker has
+        its own (named after its pid), since the offsets of a file are
+        only known to its writer; the files left by workers that no longer
+        run are taken over, so their events survive restarts.
+        """
+        name = hashlib.sha256(destination.name.encode()).hexdigest()[:16]
+        path = os.path.join(self.spill_dir, f"{name}-{os.getpid()}.jsonl")
+        for filename in sorted(os.listdir(self.spill_dir)):
+            prefix, _, pid = filename.removesuffix(".jsonl").rpartition("-")
+            if prefix != name or not pid.isdigit() or \
+                    int(pid) == os.getpid() or _running(int(pid)):
+                continue
+            orphan = os.path.join(self.spill_dir, filename)
+            claimed = f"{path}.{pid}"
+            try:
+                # Atomic: of the workers starting together, one gets it
+                os.rename(orphan, claimed)
+            except FileNotFoundError:
+                continue
+            with open(claimed, "rb") as src, open(path, "ab") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(claimed)
+            logger.info("Took over the spilled events of process %s", pid)
+        return path
+
+    def _ensure_worker(self, outbox):
+        loop = asyncio.get_running_loop()
+        if outbox.task is None or outbox.task.done() or (
+                outbox.task.get_loop() is not loop):
+            outbox.wakeup = asyncio.Event()
+            outbox.task = asyncio.ensure_future(self._deliver(outbox))
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def _deliver(self, outbox):
+        while True:
+            if not (outbox.queue or outbox.overflow or outbox.spilled):
+                outbox.wakeup.clear()
+                await outbox.wakeup.wait()
+            if outbox.overflow:
+                events, outbox.overflow = outbox.overflow, []
+                await asyncio.to_thread(self._spill, outbox, events)
+
+            if outbox.spilled:
+                # Spilled events are older than the queued ones
+                batch, end = await asyncio.to_thread(
+                    self._read_spill, outbox)
+            else:
+                if len(outbox.queue) < self.batch_size and self.batch_delay:
+                    await asyncio.sleep(self.batch_delay)
+                batch = [outbox.queue.popleft() for _ in range(
+                    min(self.batch_size, len(outbox.queue)))]
+                end = None
+            if not batch:
+                continue
+
+            outbox.busy = True
+            try:
+                async with self._semaphore:
+                    await outbox.destination.send(batch)
+            except asyncio.CancelledError:
+                if end is None:
+                    outbox.queue.extendleft(reversed(batch))
+                raise
+            except DeliveryRejected as e:
+                logger.error("%s: dropping %d events", e, len(batch))
+                self.stats["rejected"] += len(batch)
+            except Exception as e:
+                outbox.failures += 1
+                self.stats["failures"] += 1
+                delay = min(BACKOFF_MAX,
+                            BACKOFF_BASE * 2 ** (outbox.failures - 1))
+                delay *= random.uniform(0.5, 1.0)
+                logger.warning("Delivery to %s failed (%s), retrying in "
+                               "%.0f s", outbox.destination.name,
+                               str(e) or type(e).__name__, delay)
+                if end is None:
+                    outbox.queue.extendleft(reversed(batch))
+                outbox.busy = False
+                await self._backoff(outbox, delay)
+                continue
+            else:
+                self.stats["batches"] += 1
+                self.stats["delivered"] += len(batch)
+            finally:
+                outbox.busy = False
+
+            outbox.failures = 0
+            if end is not None:
+                outbox.spill_offset = end
+                outbox.spilled -= len(batch)
+                if outbox.spilled <= 0:
+                    await asyncio.to_thread(self._truncate_spill, outbox)
+
+    async def _backoff(self, outbox, delay):
+        # Events keep coming in the meantime: spill them as they overflow
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + delay
+        while True:
+            if outbox.overflow:
+                events, outbox.overflow = outbox.overflow, []
+                await asyncio.to_thread(self._spill, outbox, events)
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            outbox.wakeup.clear()
+            try:
+                await asyncio.wait_for(outbox.wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    def _spill(self, outbox, events):
+        if not events:
+            return
+        with open(outbox.spill_path, "ab") as f:
+            f.write(b"".join(dumps(event) + b"\n" for event in events))
+        outbox.spilled += len(events)
+        self.stats["spilled"] += len(events)
+
+    def _read_spill(self, outbox):
+        batch = []
+        with open(outbox.spill_path, "rb") as f:
+            f.seek(outbox.spill_offset)
+            while len(batch) < self.batch_size:
+                line = f.readline()
+                if not line:
+                    break
+                try:
+                    batch.append(json.loads(line))
+                except ValueError:
+                    logger.error("Skipping a corrupt line of %s",
+                                 outbox.spill_path)
+                    outbox.spilled -= 1
+            end = f.tell()
+        if not batch:
+            # End of the file (it held fewer events than counted)
+            self._truncate_spill(outbox)
+        return batch, end
+
+    def _truncate_spill(self, outbox):
+        outbox.spilled = 0
+        outbox.spill_offset = 0
+        try:
+            os.remove(outbox.spill_path)
+        except FileNotFoundError:
+            pass
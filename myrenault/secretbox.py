@@ -0,0 +1,46 @@
+import base64
+import hashlib
+import logging
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+
+class SecretBox:
+    """
+    Encrypts the Renault passwords that have to be written somewhere (the
+    shared state backend, the charge schedule database) with a key known
+    only to the server, so that reading those stores does not reveal
+    them. Uses Fernet (AES with an HMAC), from the `cryptography` package,
+    imported when a box is created.
+
+    `key` is any secret string, e.g. from
+    `python -c "import secrets; print(secrets.token_urlsafe(32))"`.
+    """
+
+    def __init__(self, key):
+        if not key:
+            raise ValueError("A secret key is required")
+        try:
+            from cryptography.fernet import Fernet, InvalidToken
+        except ImportError as e:
+            raise RuntimeError(
+                "Encrypting stored passwords needs the cryptography "
+                "package (pip install cryptography)") from e
+        digest = hashlib.sha256(key.encode("utf-8")).digest()
+        self._fernet = Fernet(base64.urlsafe_b64encode(digest))
+        self._invalid = InvalidToken
+
+    def seal(self, value):
+        return self._fernet.encrypt(value.encode("utf-8")).decode("ascii")
+
+    def open(self, sealed):
+        """
+        The value of `sealed`. Raises ValueError when it was not sealed
+        with this key (e.g. after the key changed) or was tampered with.
+        """
+        try:
+            return self._fernet.decrypt(sealed.encode("ascii")).decode(
+                "utf-8")
+        except (self._invalid, AttributeError, UnicodeError) as e:
+            raise ValueError("Cannot decrypt a stored secret") from e
@@ -0,0 +1,136 @@
+import json
+import types
+import typing
+import logging
+import datetime
+from collections.abc import Mapping
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # Optional speed-up, see requirements.txt
+    orjson = None
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+
+def _default(value):
+    # Readings (myrenault.telemetry) are mappings rather than dicts
+    if isinstance(value, Mapping):
+        return dict(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(value):
+    """Encodes `value` to compact JSON bytes, with orjson if installed."""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default)
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False,
+                      default=_default).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoding with dumps()."""
+
+    def render(self, content):
+        return dumps(content)
+
+
+def _to_int(value):
+    # As pydantic validates int fields: 0.0 (or True) becomes 0 (or 1)
+    if isinstance(value, bool) or (
+            isinstance(value, float) and value.is_integer()):
+        return int(value)
+    return value
+
+
+def _to_float(value):
+    # As pydantic validates float fields: 0 becomes 0.0
+    if isinstance(value, int):
+        return float(value)
+    return value
+
+
+# Scalar field type -> conversion of values to that type
+_SCALARS = {int: _to_int, float: _to_float}
+
+
+def _scalar(annotation):
+    """The conversion of a scalar field type (or Optional of one), or None."""
+    if typing.get_origin(annotation) in (typing.Union, types.UnionType):
+        inner = [a for a in typing.get_args(annotation) if a is not type(None)]
+        return _scalar(inner[0]) if len(inner) == 1 else None
+    return _SCALARS.get(annotation)
+
+
+def coerce(annotation, value):
+    """
+    `value` converted to the scalar type `annotation` the way a response
+    model would, so that an encoded body does not depend on whether
+    Renault sent 0 or 0.0. Other values are returned as they are.
+    """
+    convert = _scalar(annotation)
+    return value if convert is None else convert(value)
+
+
+def _project(annotation):
+    """
+    Returns a function keeping the fields of `annotation` (a model, a list
+    or an Optional of one) from a value of that shape, or None when values
+    are kept as they are.
+    """
+    origin = typing.get_origin(annotation)
+    if origin in (typing.Union, types.UnionType):
+        inner = [a for a in typing.get_args(annotation) if a is not type(None)]
+        return _project(inner[0]) if len(inner) == 1 else None
+    if origin is list:
+        item = _project(typing.get_args(annotation)[0])
+        if item is None:
+            return None
+        return lambda value: None if value is None else [
+            item(v) for v in value]
+    if not (isinstance(annotation, type) and issubclass(annotation, BaseModel)):
+        return None
+
+    fields = tuple(
+        (name, _project(field.annotation) or _scalar(field.annotation),
+         None if field.is_required() else field.get_default(
+             call_default_factory=True))
+        for name, field in annotation.model_fields.items()
+    )
+    names = tuple(name for name, _, _ in fields)
+
+    def project(value):
+        if value is None:
+            return None
+        if getattr(value, "fields", None) == names:
+            # A Reading of the same fields: encoded as it is
+            return value
+        projected = {}
+        for name, inner, default in fields:
+            field = value.get(name, default)
+            projected[name] = field if inner is None else inner(field)
+        return projected
+    return project
+
+
+def serializer(annotation):
+    """
+    Builds, once, an encoder of response bodies of type `annotation` (e.g.
+    list[VehicleResponse]) to JSON bytes.
+
+    Unlike FastAPI's response_model handling, values are not validated
+    again: the client already builds them with the right fields. Fields
+    missing from a value get the model default, fields unknown to the model
+    are left out and int and float fields are converted to their type, so
+    the body is the one the response model would give.
+    """
+    project = _project(annotation)
+    if project is None:
+        return dumps
+    return lambda value: dumps(project(value))
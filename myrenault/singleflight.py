@@ -0,0 +1,52 @@
+import asyncio
+import logging
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: while a call for a given key is
+    in flight, later callers await the same upstream task instead of
+    starting their own.
+    """
+
+    def __init__(self):
+        self._calls = {}  # key -> asyncio.Task
+        self.stats = {
+            "calls_total": 0,
+            "calls_executed": 0,
+            "calls_coalesced": 0
+        }
+
+    def __len__(self):
+        return len(self._calls)
+
+    def get_stats(self):
+        return {"in_flight": len(self._calls), **self.stats}
+
+    async def do(self, key, func, *args):
+        self.stats["calls_total"] += 1
+
+        task = self._calls.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            self.stats["calls_executed"] += 1
+            task = asyncio.ensure_future(func(*args))
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.stats["calls_coalesced"] += 1
+            logger.debug("Coalesced in-flight call %s", key[-1])
+
+        # Shield the shared task so that one cancelled caller does not
+        # cancel the upstream call for everybody else.
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Retrieve the exception so that asyncio does not log it as never
+        # retrieved when every waiter was cancelled.
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,485 @@
+import json
+import time
+import uuid
+import random
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections.abc import Mapping
+from contextlib import asynccontextmanager
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+# Seconds a cross-worker lock is held at most, so that a worker dying
+# while holding it cannot block the others for longer
+LOCK_LEASE = 60
+# Seconds to wait for a lock before going ahead without it
+LOCK_TIMEOUT = 30
+# Seconds between two purges of expired entries
+PURGE_INTERVAL = 60
+
+
+def open_state(url):
+    """
+    Returns the StateBackend for `url`:
+
+        memory://                   this process only
+        sqlite:///path/to/state.db  workers of one host
+        redis://host:6379/0         workers and replicas (needs `redis`)
+    """
+    scheme, _, rest = url.partition("://")
+    if scheme == "memory":
+        return MemoryBackend()
+    if scheme == "sqlite":
+        # sqlite:///relative.db and sqlite:////absolute/path.db
+        return SQLiteBackend(rest[1:] if rest.startswith("/") else rest)
+    if scheme in ("redis", "rediss", "unix"):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported state backend URL: {url}")
+
+
+def _encode(value):
+    # Readings (myrenault.telemetry) are mappings rather than dicts
+    if isinstance(value, Mapping):
+        return dict(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class StateBackend:
+    """
+    State shared by every worker (and replica) of the API: serialized
+    logins, VIN to account mappings, upstream readings and rate limit
+    buckets, so that N workers call Renault about as often as one.
+
+    Values are stored as JSON under a (namespace, key) pair, optionally
+    for `ttl` seconds. Times are wall clock (time.time()) since they are
+    compared across processes. Besides storage, a backend offers:
+
+    - reserve(): an atomic token bucket, for rate limits that hold for the
+      whole deployment rather than for each worker.
+    - lock(): a lease-based mutex, so that only one worker at a time logs
+      in an account or fetches a given reading while the others wait for
+      its result.
+
+    Shared state is a second level behind the in-process structures
+    (session pool, response cache, VIN index...): it is only consulted
+    when those miss, and nothing breaks if it is unavailable, calls then
+    simply go upstream.
+    """
+
+    def __init__(self):
+        self.stats = {
+            "gets": 0,
+            "hits": 0,
+            "sets": 0,
+            "errors": 0,
+            "lock_waits": 0,
+            "lock_timeouts": 0
+        }
+
+    def get_stats(self):
+        return dict(self.stats)
+
+    async def get(self, namespace, key):
+        """Returns the value stored under (namespace, key), or None."""
+        self.stats["gets"] += 1
+        try:
+            raw = await self._get(namespace, key)
+        except Exception as e:
+            self._failed("get", e)
+            return None
+        if raw is None:
+            return None
+        self.stats["hits"] += 1
+        return json.loads(raw)
+
+    async def set(self, namespace, key, value, ttl=None):
+        self.stats["sets"] += 1
+        expires_at = time.time() + ttl if ttl else None
+        try:
+            await self._set(namespace, key, json.dumps(value, default=_encode),
+                            expires_at)
+        except Exception as e:
+            self._failed("set", e)
+
+    async def delete(self, namespace, key):
+        try:
+            await self._delete(namespace, key)
+        except Exception as e:
+            self._failed("delete", e)
+
+    async def reserve(self, name, rate, burst, tokens=1):
+        """
+        Takes `tokens` from the bucket `name` (refilled at `rate` per
+        second up to `burst`) and returns how many seconds to wait before
+        they are actually available. Negative `tokens` give them back.
+        """
+        try:
+            return await self._reserve(name, rate, burst, tokens)
+        except Exception as e:
+            self._failed("reserve", e)
+            return 0.0
+
+    @asynccontextmanager
+    async def lock(self, name, timeout=LOCK_TIMEOUT, lease=LOCK_LEASE):
+        """
+        Holds the lock `name` across workers for at most `lease` seconds.
+        Yields whether it was acquired: after `timeout` seconds, or if the
+        backend fails, the caller goes ahead without it.
+        """
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        delay = 0.005
+        acquired = False
+        while True:
+            try:
+                acquired = await self._try_lock(name, owner, lease)
+            except Exception as e:
+                self._failed("lock", e)
+                break
+            if acquired:
+                break
+            if delay == 0.005:
+                self.stats["lock_waits"] += 1
+            if time.monotonic() + delay > deadline:
+                self.stats["lock_timeouts"] += 1
+                logger.warning("Gave up waiting for shared lock %s", name)
+                break
+            # Jittered backoff, so that waiters do not poll in lockstep
+            await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+            delay = min(delay * 2, 0.1)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                try:
+                    await self._unlock(name, owner)
+                except Exception as e:
+                    self._failed("unlock", e)
+
+    async def clear(self):
+        await self._clear()
+
+    async def close(self):
+        pass
+
+    def _failed(self, operation, error):
+        self.stats["errors"] += 1
+        logger.error("Shared state %s failed: %s", operation, error)
+
+
+def _refill(tokens, updated_at, rate, burst, now, taken):
+    """Token bucket arithmetic shared by the backends without scripting."""
+    if tokens is None:
+        tokens = float(burst)
+    else:
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+    tokens -= taken
+    return tokens, max(0.0, -tokens / rate)
+
+
+class MemoryBackend(StateBackend):
+    """
+    Reference backend keeping everything in this process. Values are
+    serialized like in the shared backends, so that it behaves the same.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._values = {}  # (namespace, key) -> (json, expires_at)
+        self._buckets = {}  # name -> (tokens, updated_at)
+        self._locks = {}  # name -> (owner, expires_at)
+        self._purged_at = time.monotonic()
+
+    def __len__(self):
+        return len(self._values)
+
+    def get_stats(self):
+        return {"size": len(self._values), **self.stats}
+
+    async def _get(self, namespace, key):
+        entry = self._values.get((namespace, key))
+        if entry is None:
+            return None
+        raw, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self._values[(namespace, key)]
+            return None
+        return raw
+
+    async def _set(self, namespace, key, raw, expires_at):
+        self._values[(namespace, key)] = (raw, expires_at)
+        if time.monotonic() - self._purged_at > PURGE_INTERVAL:
+            self._purge()
+
+    async def _delete(self, namespace, key):
+        self._values.pop((namespace, key), None)
+
+    async def _reserve(self, name, rate, burst, tokens):
+        now = time.time()
+        left, updated_at = self._buckets.get(name, (None, now))
+        left, wait = _refill(left, updated_at, rate, burst, now, tokens)
+        self._buckets[name] = (left, now)
+        return wait
+
+    async def _try_lock(self, name, owner, lease):
+        holder = self._locks.get(name)
+        if holder is not None and holder[1] > time.time():
+            return False
+        self._locks[name] = (owner, time.time() + lease)
+        return True
+
+    async def _unlock(self, name, owner):
+        holder = self._locks.get(name)
+        if holder is not None and holder[0] == owner:
+            del self._locks[name]
+
+    async def _clear(self):
+        self._values.clear()
+        self._buckets.clear()
+        self._locks.clear()
+
+    def _purge(self):
+        self._purged_at = time.monotonic()
+        now = time.time()
+        expired = [k for k, (_, expires_at) in self._values.items()
+                   if expires_at is not None and expires_at <= now]
+        for key in expired:
+            del self._values[key]
+
+
+class SQLiteBackend(StateBackend):
+    """
+    Backend in a SQLite file (WAL mode), for several workers of one host,
+    e.g. `uvicorn --workers N`. Queries run in worker threads so that they
+    never block the event loop; each thread has its own connection.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        self._connections = []  # one per thread, closed by close()
+        self._purged_at = time.monotonic()
+        self._connection()  # Creates the schema up front
+
+    def get_stats(self):
+        return {"path": self.path, **self.stats}
+
+    async def _get(self, namespace, key):
+        return await asyncio.to_thread(self._get_sync, namespace, key)
+
+    async def _set(self, namespace, key, raw, expires_at):
+        await asyncio.to_thread(
+            self._set_sync, namespace, key, raw, expires_at)
+
+    async def _delete(self, namespace, key):
+        await asyncio.to_thread(self._execute, (
+            "DELETE FROM state WHERE namespace = ? AND key = ?",
+            (namespace, key)))
+
+    async def _reserve(self, name, rate, burst, tokens):
+        return await asyncio.to_thread(
+            self._reserve_sync, name, rate, burst, tokens)
+
+    async def _try_lock(self, name, owner, lease):
+        return await asyncio.to_thread(self._try_lock_sync, name, owner, lease)
+
+    async def _unlock(self, name, owner):
+        await asyncio.to_thread(self._execute, (
+            "DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner)))
+
+    async def _clear(self):
+        await asyncio.to_thread(
+            self._execute, ("DELETE FROM state", ()),
+            ("DELETE FROM buckets", ()), ("DELETE FROM locks", ()))
+
+    async def close(self):
+        # Threads of the default executor may still hold a connection; they
+        # are closed here and reopened on demand should the backend be used
+        # again.
+        self._local = threading.local()
+        connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            self._connections.append(conn)
+        return conn
+
+    def _connect(self):
+        # Transactions are managed explicitly (BEGIN IMMEDIATE) so that
+        # read-modify-write sequences are atomic across processes.
+        conn = sqlite3.connect(self.path, isolation_level=None,
+                               check_same_thread=False, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT, "
+            "expires_at REAL, PRIMARY KEY (namespace, key)) WITHOUT ROWID")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            "name TEXT PRIMARY KEY, tokens REAL, updated_at REAL)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS locks ("
+            "name TEXT PRIMARY KEY, owner TEXT, expires_at REAL)")
+        return conn
+
+    def _execute(self, *statements):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, params in statements:
+                conn.execute(sql, params)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _get_sync(self, namespace, key):
+        row = self._connection().execute(
+            "SELECT value FROM state WHERE namespace = ? AND key = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def _set_sync(self, namespace, key, raw, expires_at):
+        statements = [(
+            "INSERT OR REPLACE INTO state VALUES (?, ?, ?, ?)",
+            (namespace, key, raw, expires_at))]
+        if time.monotonic() - self._purged_at > PURGE_INTERVAL:
+            self._purged_at = time.monotonic()
+            now = time.time()
+            statements += [
+                ("DELETE FROM state WHERE expires_at <= ?", (now,)),
+                ("DELETE FROM locks WHERE expires_at <= ?", (now,)),
+            ]
+        self._execute(*statements)
+
+    def _reserve_sync(self, name, rate, burst, tokens):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM buckets WHERE name = ?",
+                (name,)).fetchone()
+            left, wait = _refill(row[0] if row else None,
+                                 row[1] if row else now,
+                                 rate, burst, now, tokens)
+            conn.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)",
+                         (name, left, now))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return wait
+
+    def _try_lock_sync(self, name, owner, lease):
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM locks WHERE name = ? AND expires_at <= ?",
+                         (name, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO locks VALUES (?, ?, ?)",
+                (name, owner, now + lease))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return cursor.rowcount == 1
+
+
+# Token bucket run atomically by Redis: KEYS[1] = bucket,
+# ARGV = rate, burst, tokens taken, now. Returns the wait in seconds.
+_RESERVE_SCRIPT = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local now = tonumber(ARGV[4])
+local tokens = tonumber(bucket[1])
+if tokens == nil then
+  tokens = burst
+else
+  tokens = math.min(burst, tokens + (now - tonumber(bucket[2])) * rate)
+end
+tokens = tokens - tonumber(ARGV[3])
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens),
+           'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+if tokens >= 0 then return '0' end
+return tostring(-tokens / rate)
+"""
+
+# Deletes a lock only if it is still held by this owner
+_UNLOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisBackend(StateBackend):
+    """
+    Backend in Redis, for workers spread over several hosts. Needs the
+    optional `redis` package.
+    """
+
+    def __init__(self, url, prefix="myrenault:"):
+        super().__init__()
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError(
+                "The Redis state backend needs the redis package "
+                "(pip install redis)") from e
+        self.prefix = prefix
+        self._redis = redis.from_url(url)
+        self._reserve_script = self._redis.register_script(_RESERVE_SCRIPT)
+        self._unlock_script = self._redis.register_script(_UNLOCK_SCRIPT)
+
+    def _key(self, *parts):
+        return self.prefix + ":".join(parts)
+
+    async def _get(self, namespace, key):
+        raw = await self._redis.get(self._key("state", namespace, key))
+        return raw.decode("utf-8") if raw is not None else None
+
+    async def _set(self, namespace, key, raw, expires_at):
+        ttl = None
+        if expires_at is not None:
+            ttl = max(1, int((expires_at - time.time()) * 1000))
+        await self._redis.set(
+            self._key("state", namespace, key), raw, px=ttl)
+
+    async def _delete(self, namespace, key):
+        await self._redis.delete(self._key("state", namespace, key))
+
+    async def _reserve(self, name, rate, burst, tokens):
+        wait = await self._reserve_script(
+            keys=[self._key("bucket", name)],
+            args=[rate, burst, tokens, time.time()])
+        return float(wait)
+
+    async def _try_lock(self, name, owner, lease):
+        return bool(await self._redis.set(
+            self._key("lock", name), owner, nx=True, px=int(lease * 1000)))
+
+    async def _unlock(self, name, owner):
+        await self._unlock_script(keys=[self._key("lock", name)], args=[owner])
+
+    async def _clear(self):
+        keys = [key async for key in self._redis.scan_iter(self.prefix + "*")]
+        if keys:
+            await self._redis.delete(*keys)
+
+    async def close(self):
+        await self._redis.aclose()
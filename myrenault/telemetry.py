@@ -0,0 +1,309 @@
+import time
+import logging
+from array import array
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from myrenault.history import FIELDS, MAX_BUCKETS, parse_timestamp
+from myrenault.serialization import coerce, dumps
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+
+class Reading(Mapping):
+    """
+    A reading of one kind, as returned by MyRenaultClient.read().
+
+    Readings are slotted records rather than dicts: a battery reading takes
+    about a third of the memory of the equivalent dict, which matters with
+    one cached reading per vehicle and kind. They are read-only mappings,
+    so code written for dicts (reading.get("batteryLevel"), dict(reading))
+    keeps working, and they are treated as immutable once built.
+
+    body() encodes the reading to JSON once; the API sends those bytes as
+    they are, without validating the reading against its response model
+    again.
+    """
+
+    __slots__ = ("_body",)
+    kind = None
+    fields = ()
+    # Types of the fields, those of the response model of the kind
+    types = ()
+
+    def __init__(self, **values):
+        for field, type_ in zip(self.fields, self.types):
+            setattr(self, field, coerce(type_, values.get(field)))
+        self._body = None
+
+    def __getitem__(self, key):
+        if key in self.fields:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self)!r})"
+
+    def body(self):
+        """The reading as compact JSON (bytes)."""
+        if self._body is None:
+            self._body = dumps(dict(self))
+        return self._body
+
+
+class BatteryReading(Reading):
+    __slots__ = fields = (
+        "batteryLevel",
+        "batteryAutonomy",
+        "chargingStatus",
+        "plugStatus",
+        "batteryTemperature",
+        "chargingInstantaneousPower",
+        "timestamp",
+    )
+    types = (int, int, int, int, int, float, str)
+    kind = "battery"
+
+
+class CockpitReading(Reading):
+    __slots__ = fields = ("totalMileage",)
+    types = (float,)
+    kind = "cockpit"
+
+
+class LocationReading(Reading):
+    __slots__ = fields = ("latitude", "longitude", "timestamp")
+    types = (float, float, str)
+    kind = "location"
+
+
+# Kind -> Reading class
+READINGS = {cls.kind: cls for cls in (
+    BatteryReading, CockpitReading, LocationReading)}
+
+
+def to_reading(kind, value):
+    """
+    Converts `value`, a reading as a dict (e.g. shared by another worker),
+    to the Reading of its kind. Other values are returned as they are.
+    """
+    cls = READINGS.get(kind)
+    if cls is None or value is None or isinstance(value, cls):
+        return value
+    return cls(**value)
+
+
+# Fixed-point scale of the fields stored by SampleRing: coordinates are
+# kept to 1e-6 degree (about 10 cm), other fields to 1e-3 of their unit.
+SCALES = {"latitude": 10**6, "longitude": 10**6}
+DEFAULT_SCALE = 1000
+
+# Sample rows are stored as 32-bit deltas; MISSING marks a null field
+MISSING = -2**31
+_MAX_DELTA = 2**31 - 1
+
+
+class SampleRing:
+    """
+    The last `capacity` samples of one series, delta-encoded.
+
+    Each sample is a row of fixed-point integers (the timestamp first,
+    then the fields) stored as its difference with the previous sample,
+    in a flat array of 32-bit integers: a battery sample takes 28 bytes.
+    `_base` holds the absolute values the oldest row is relative to, and
+    is moved forward when the oldest row is overwritten.
+
+    Samples must be appended in timestamp order. A delta too large for 32
+    bits (e.g. a field first null, then set) restarts the ring from the
+    new sample.
+    """
+
+    __slots__ = ("scales", "capacity", "_rows", "_base", "_last", "_start",
+                 "_count")
+
+    def __init__(self, fields, capacity=256):
+        self.scales = (1,) + tuple(
+            SCALES.get(field, DEFAULT_SCALE) for field in fields)
+        self.capacity = capacity
+        self.clear()
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        self._rows = array("i")
+        self._base = [0] * len(self.scales)
+        self._last = [0] * len(self.scales)
+        self._start = 0
+        self._count = 0
+
+    @property
+    def last_ts(self):
+        return self._last[0] if self._count else None
+
+    def last(self):
+        """Values of the fields (without timestamp) of the newest sample."""
+        if not self._count:
+            return None
+        return tuple(value / scale for value, scale
+                     in zip(self._last[1:], self.scales[1:]))
+
+    def append(self, ts, values):
+        encoded = [int(ts)] + [
+            None if value is None else round(value * scale)
+            for value, scale in zip(values, self.scales[1:])]
+
+        if not self._count:
+            self._base = [value or 0 for value in encoded]
+            self._last = list(self._base)
+            row = [0 if value is not None else MISSING for value in encoded]
+        else:
+            row = []
+            last = list(self._last)
+            for i, value in enumerate(encoded):
+                if value is None:
+                    row.append(MISSING)
+                    continue
+                delta = value - last[i]
+                if not MISSING < delta <= _MAX_DELTA:
+                    self.clear()
+                    return self.append(ts, values)
+                row.append(delta)
+                last[i] = value
+            self._last = last
+
+        width = len(self.scales)
+        if self._count < self.capacity:
+            self._rows.extend(row)
+            self._count += 1
+            return
+        # Full: the oldest row is folded into the base, then overwritten
+        offset = self._start * width
+        for i in range(width):
+            delta = self._rows[offset + i]
+            if delta != MISSING:
+                self._base[i] += delta
+        self._rows[offset:offset + width] = array("i", row)
+        self._start = (self._start + 1) % self.capacity
+
+    def __iter__(self):
+        """Yields (ts, values) from the oldest sample to the newest."""
+        width = len(self.scales)
+        running = list(self._base)
+        rows = self._rows
+        for n in range(self._count):
+            offset = (self._start + n) % self.capacity * width
+            values = []
+            for i in range(width):
+                delta = rows[offset + i]
+                if delta == MISSING:
+                    values.append(None)
+                else:
+                    running[i] += delta
+                    values.append(running[i] / self.scales[i])
+            yield int(values[0]), tuple(values[1:])
+
+
+class SampleStore:
+    """
+    Recent telemetry samples of each vehicle, in memory: the last
+    `capacity` samples of each (kind, VIN) in a SampleRing, for at most
+    `max_series` series (least recently recorded first out).
+
+    Samples are recorded like in HistoryStore (deduplicated on the
+    upstream timestamp, cockpit readings only when the mileage changed)
+    and query() has the same signature and result, so that the history
+    endpoint works without a database, over the recent samples.
+    """
+
+    def __init__(self, capacity=256, max_series=20000):
+        self.capacity = capacity
+        self.max_series = max_series
+        self._series = OrderedDict()  # (kind, VIN) -> SampleRing
+        self.stats = {
+            "recorded": 0,
+            "evictions": 0
+        }
+
+    def __len__(self):
+        return len(self._series)
+
+    def get_stats(self):
+        return {
+            "series": len(self._series),
+            "samples": sum(len(ring) for ring in self._series.values()),
+            **self.stats
+        }
+
+    def record(self, kind, vin, data):
+        fields = FIELDS.get(kind)
+        if fields is None or not data or self.capacity <= 0:
+            return
+
+        key = (kind, vin)
+        ring = self._series.get(key)
+        values = tuple(data.get(f) for f in fields)
+        if kind == "cockpit":
+            ts = int(time.time())
+            if ring is not None and ring.last() == values:
+                return
+        else:
+            ts = parse_timestamp(data.get("timestamp")) or int(time.time())
+        if ring is not None and ring.last_ts is not None and (
+                ts <= ring.last_ts):
+            return
+
+        if ring is None:
+            ring = self._series[key] = SampleRing(fields, self.capacity)
+            while len(self._series) > self.max_series:
+                self._series.popitem(last=False)
+                self.stats["evictions"] += 1
+        self._series.move_to_end(key)
+        ring.append(ts, values)
+        self.stats["recorded"] += 1
+
+    def samples(self, kind, vin, start=None, end=None):
+        """(ts, values) of `vin` with start <= ts < end, oldest first."""
+        ring = self._series.get((kind, vin))
+        if ring is None:
+            return []
+        return [
+            (ts, values) for ts, values in ring
+            if (start is None or ts >= start) and (end is None or ts < end)
+        ]
+
+    def query(self, kind, vin, start, end, step):
+        """Same as HistoryStore.query, over the samples kept in memory."""
+        fields = FIELDS[kind]
+        step = max(1, int(step), -(-(end - start) // MAX_BUCKETS))
+
+        buckets = OrderedDict()  # bucket time -> (count, [values per field])
+        for ts, values in self.samples(kind, vin, start, end):
+            bucket = buckets.setdefault(
+                ts // step * step, [0, [[] for _ in fields]])
+            bucket[0] += 1
+            for column, value in zip(bucket[1], values):
+                if value is not None:
+                    column.append(value)
+
+        result = []
+        for bucket_time, (count, columns) in buckets.items():
+            bucket = {"time": bucket_time, "count": count}
+            for field, column in zip(fields, columns):
+                bucket[field] = {
+                    "min": min(column, default=None),
+                    "max": max(column, default=None),
+                    "avg": sum(column) / len(column) if column else None,
+                }
+            result.append(bucket)
+        return step, result
+
+    def clear(self):
+        self._series.clear()
@@ -0,0 +1,177 @@
+import time
+import secrets
+import hashlib
+import logging
+from collections import OrderedDict
+
+from myrenault.pool import credentials_key
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+
+def _token_id(token):
+    # Only a hash of each token is kept, so the store cannot leak them
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class ApiSession:
+    def __init__(self, email, password, expires_at):
+        self.email = email
+        self.password = password
+        self.account_key = credentials_key(email, password)
+        self.expires_at = expires_at  # epoch seconds
+        self.checked_at = time.monotonic()  # last revocation check
+
+    @property
+    def credentials(self):
+        return self.email, self.password
+
+
+class TokenStore:
+    """
+    Opaque bearer tokens issued by POST /api/v1/session.
+
+    A token stands for a set of Renault credentials that were verified
+    when it was issued, so that later requests can use the pooled client
+    of that account without sending the password again. Tokens expire
+    `ttl` seconds after being issued and can be revoked earlier. Lookups
+    are a single dictionary access; expired tokens are dropped as they are
+    met and, since every token lives for the same `ttl`, from the oldest
+    end of the store.
+
+    With a shared `state` backend, tokens issued by one worker are valid
+    on every other (see save() and load()). Revocations are shared as
+    well; a worker notices them within `recheck` seconds. The password
+    is stored encrypted by `box` (a SecretBox), which is then required:
+    the other workers need it to log in again once the login of the
+    account expires.
+    """
+
+    def __init__(self, ttl=3600, max_tokens=100000, state=None, recheck=30,
+                 box=None):
+        if state is not None and box is None:
+            raise ValueError(
+                "Sharing session tokens needs a SecretBox to encrypt "
+                "passwords (set RENAULT_SECRET_KEY)")
+        self.ttl = ttl
+        self.max_tokens = max_tokens
+        self.state = state
+        self.recheck = recheck
+        self.box = box
+        self._sessions = OrderedDict()  # token hash -> ApiSession
+        self.stats = {
+            "issued": 0,
+            "revoked": 0,
+            "expired": 0,
+            "rejected": 0
+        }
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get_stats(self):
+        return {"active": len(self._sessions), **self.stats}
+
+    def issue(self, email, password):
+        """Returns (token, ApiSession) for credentials already verified."""
+        self._purge()
+        while len(self._sessions) >= self.max_tokens:
+            self._sessions.popitem(last=False)
+            self.stats["expired"] += 1
+
+        token = secrets.token_urlsafe(32)
+        session = ApiSession(email, password, time.time() + self.ttl)
+        self._sessions[_token_id(token)] = session
+        self.stats["issued"] += 1
+        return token, session
+
+    def get(self, token):
+        """Returns the ApiSession of a valid token, otherwise None."""
+        token_id = _token_id(token)
+        session = self._sessions.get(token_id)
+        if session is not None and session.expires_at <= time.time():
+            del self._sessions[token_id]
+            self.stats["expired"] += 1
+            session = None
+        if session is None:
+            self.stats["rejected"] += 1
+        return session
+
+    def revoke(self, token):
+        if self._sessions.pop(_token_id(token), None) is None:
+            return False
+        self.stats["revoked"] += 1
+        return True
+
+    def clear(self):
+        self._sessions.clear()
+
+    async def save(self, token, session):
+        """Makes a token issued by this worker valid on the others."""
+        if self.state is None:
+            return
+        await self.state.set("tokens", _token_id(token), {
+            "email": session.email,
+            "secret": self.box.seal(session.password),
+            "expires_at": session.expires_at
+        }, ttl=max(1, session.expires_at - time.time()))
+
+    async def load(self, token):
+        """
+        Like get(), but also accepts tokens issued by other workers and
+        honours their revocations.
+        """
+        if self.state is None:
+            return self.get(token)
+
+        token_id = _token_id(token)
+        session = self._sessions.get(token_id)
+        if session is None:
+            record = await self.state.get("tokens", token_id)
+            if record is not None:
+                session = self._restore(record)
+            if session is not None:
+                self._sessions[token_id] = session
+        elif time.monotonic() - session.checked_at > self.recheck:
+            # Only an explicit revocation drops the session: an unavailable
+            # backend must not log every user out.
+            session.checked_at = time.monotonic()
+            if await self.state.get("revoked", token_id):
+                del self._sessions[token_id]
+                self.stats["revoked"] += 1
+        return self.get(token)
+
+    async def discard(self, token):
+        """Revokes a token on every worker. Returns whether it was valid."""
+        if self.state is None:
+            return self.revoke(token)
+
+        session = await self.load(token)
+        if session is None:
+            return False
+        self.revoke(token)
+        token_id = _token_id(token)
+        await self.state.delete("tokens", token_id)
+        await self.state.set("revoked", token_id, True,
+                             ttl=max(1, session.expires_at - time.time()))
+        return True
+
+    def _restore(self, record):
+        try:
+            password = self.box.open(record.get("secret"))
+        except ValueError:
+            # Sealed with another key, or written by an older version
+            logger.warning("Ignoring a shared session token that cannot "
+                           "be decrypted with the current secret key.")
+            return None
+        return ApiSession(record["email"], password, record["expires_at"])
+
+    def _purge(self):
+        now = time.time()
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.expires_at > now:
+                break
+            self._sessions.popitem(last=False)
+            self.stats["expired"] += 1
@@ -0,0 +1,96 @@
+import os
+import json
+import hashlib
+import logging
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+
+def owner_key(email):
+    """
+    Identifies the owner of index entries by a hash of the email, so that
+    neither emails nor password-derived keys end up on disk.
+    """
+    return hashlib.sha256(email.strip().lower().encode("utf-8")).hexdigest()
+
+
+class VinIndex:
+    """
+    Remembers which Kamereon account holds each VIN of a user, so that
+    resolving a vehicle does not require listing every account again.
+
+    The index is optionally persisted to a JSON file (`path`) so that it
+    survives restarts. It is small and rarely written: only when a sweep
+    discovers new vehicles or a VIN is forgotten.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._owners = {}  # owner key -> {VIN: account id}
+        self.stats = {
+            "hits": 0,
+            "misses": 0
+        }
+        if path:
+            self._load()
+
+    def __len__(self):
+        return sum(len(vins) for vins in self._owners.values())
+
+    def get_stats(self):
+        return {"size": len(self), **self.stats}
+
+    def get(self, email, vin):
+        account_id = self._owners.get(owner_key(email), {}).get(vin)
+        if account_id is None:
+            self.stats["misses"] += 1
+        else:
+            self.stats["hits"] += 1
+        return account_id
+
+    def vins(self, email):
+        return dict(self._owners.get(owner_key(email), {}))
+
+    def update(self, email, mapping):
+        """Records a {VIN: account id} mapping for the user."""
+        vins = self._owners.setdefault(owner_key(email), {})
+        changed = {
+            vin: account_id for vin, account_id in mapping.items()
+            if vins.get(vin) != account_id
+        }
+        if changed:
+            vins.update(changed)
+            self._save()
+
+    def discard(self, email, vin):
+        vins = self._owners.get(owner_key(email), {})
+        if vins.pop(vin, None) is not None:
+            logger.info("Forgot account mapping for VIN %s", vin)
+            self._save()
+
+    def clear(self):
+        self._owners.clear()
+        self._save()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._owners = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error("Failed to load VIN index from %s: %s", self.path, e)
+            self._owners = {}
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._owners, f)
+            # Atomic on POSIX: readers never see a half-written file
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error("Failed to save VIN index to %s: %s", self.path, e)
@@ -0,0 +1,151 @@
+import time
+import random
+import asyncio
+import logging
+from collections import OrderedDict
+
+from myrenault.pool import credentials_key
+
+# Configure logger for this module
+logger = logging.getLogger(__name__)
+
+
+class _Account:
+    def __init__(self, email, password, pinned, due):
+        self.email = email
+        self.password = password
+        self.pinned = pinned  # configured, kept warm even when unused
+        self.last_active = time.monotonic()
+        self.due = due  # monotonic time of the next warm-up
+        self.failures = 0
+
+
+class SessionWarmer:
+    """
+    Keeps the sessions of configured and recently active accounts warm, so
+    that user requests never pay for a login, a JWT refresh or a vehicle
+    lookup (see MyRenaultClient.warm_up).
+
+    Configured accounts (add()) are warmed at startup; accounts seen in a
+    successful request (touch()) are kept warm until they have been idle
+    for `active_ttl` seconds. Each account is warmed again every
+    `interval` seconds, or earlier so that its JWT is refreshed
+    `refresh_margin` seconds before it expires. Every due time is
+    jittered, so that accounts warmed together, e.g. at startup, drift
+    apart instead of all refreshing at once.
+    """
+
+    def __init__(self, client_factory, interval=30, refresh_margin=120,
+                 active_ttl=1800, concurrency=4, max_accounts=1000):
+        self.client_factory = client_factory
+        self.interval = interval
+        self.refresh_margin = refresh_margin
+        self.active_ttl = active_ttl
+        self.concurrency = concurrency
+        self.max_accounts = max_accounts
+        self._accounts = OrderedDict()  # account key -> _Account
+        self._task = None
+        self.stats = {
+            "warmups": 0,
+            "failures": 0
+        }
+
+    def __len__(self):
+        return len(self._accounts)
+
+    def get_stats(self):
+        return {"accounts": len(self._accounts), **self.stats}
+
+    def add(self, email, password):
+        """Keeps an account warm for as long as the process runs."""
+        key = credentials_key(email, password)
+        self._accounts[key] = _Account(
+            email, password, True,
+            time.monotonic() + random.uniform(0, self.interval))
+
+    def touch(self, email, password):
+        """Records that an account was just used successfully."""
+        key = credentials_key(email, password)
+        account = self._accounts.get(key)
+        if account is None:
+            # Just used, hence warm until the next round
+            account = self._accounts[key] = _Account(
+                email, password, False, self._next_due(time.monotonic()))
+            self._evict()
+        account.last_active = time.monotonic()
+        self._accounts.move_to_end(key)
+
+    def start(self):
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.ensure_future(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def clear(self):
+        self._accounts.clear()
+
+    async def run_due(self):
+        """Warms every account whose turn has come."""
+        now = time.monotonic()
+        for key in [k for k, a in self._accounts.items()
+                    if not a.pinned and now - a.last_active > self.active_ttl]:
+            del self._accounts[key]
+
+        due = [a for a in self._accounts.values() if a.due <= now]
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def warm(account):
+            async with semaphore:
+                await self._warm(account)
+
+        await asyncio.gather(*(warm(a) for a in due))
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Session warm-up round crashed")
+            now = time.monotonic()
+            next_due = min((a.due for a in self._accounts.values()),
+                           default=now + self.interval)
+            await asyncio.sleep(min(self.interval, max(1.0, next_due - now)))
+
+    async def _warm(self, account):
+        try:
+            client = await self.client_factory(account.email, account.password)
+            expiry = await client.warm_up(self.refresh_margin)
+        except Exception as e:
+            account.failures += 1
+            self.stats["failures"] += 1
+            # Back off on accounts that keep failing, e.g. a changed password
+            delay = self.interval * 2 ** min(account.failures, 6)
+            account.due = time.monotonic() + delay * random.uniform(0.8, 1.2)
+            logger.warning("Session warm-up failed: %s", e)
+            return
+        account.failures = 0
+        self.stats["warmups"] += 1
+        account.due = self._next_due(time.monotonic(), expiry)
+
+    def _next_due(self, now, expiry=None):
+        due = now + self.interval * random.uniform(0.8, 1.2)
+        if expiry is not None:
+            # Refresh within the last `refresh_margin` seconds of the JWT,
+            # at a random point of its first half
+            refresh_at = expiry - self.refresh_margin * random.uniform(
+                0.5, 1.0)
+            due = min(due, now + max(0.0, refresh_at - time.time()))
+        return due
+
+    def _evict(self):
+        for key in list(self._accounts):
+            if len(self._accounts) <= self.max_accounts:
+                return
+            if not self._accounts[key].pinned:
+                del self._accounts[key]
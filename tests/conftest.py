@@ -0,0 +1,40 @@
+import os
+import tempfile
+import pytest
+
+# Keep the history database out of the working tree
+os.environ.setdefault(
+    "RENAULT_HISTORY_PATH",
+    os.path.join(tempfile.mkdtemp(), "history.sqlite3"))
+
+import api  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def reset_shared_state():
+    # Process-wide state must not leak mocked clients between tests
+    api.session_pool.clear()
+    api.response_cache.clear()
+    api.fingerprints.clear()
+    api.vin_index.clear()
+    api.governor.clear()
+    api.breaker.clear()
+    api.tokens.clear()
+    api.warmer.clear()
+    api.samples.clear()
+    api.scheduler.clear()
+    api.geofences.clear()
+    api.analytics.clear()
+    yield
+    api.session_pool.clear()
+    api.response_cache.clear()
+    api.fingerprints.clear()
+    api.vin_index.clear()
+    api.governor.clear()
+    api.breaker.clear()
+    api.tokens.clear()
+    api.warmer.clear()
+    api.samples.clear()
+    api.scheduler.clear()
+    api.geofences.clear()
+    api.analytics.clear()
@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from myrenault.analytics import ChargingAnalytics, segment_sessions
+from myrenault.history import FIELDS
+
+T0 = 1714521600  # 2024-05-01 00:00 UTC
+MIN = 60
+
+
+class FakeSource:
+    """Readings by kind, with the start of each samples() call."""
+
+    def __init__(self):
+        self.rows = {"battery": [], "cockpit": []}
+        self.starts = []
+
+    def battery(self, ts, level, charging=False, power=None):
+        values = dict(batteryLevel=level, chargingStatus=1.0 if charging
+                      else 0.0, chargingInstantaneousPower=power)
+        self.rows["battery"].append(
+            (ts, tuple(values.get(f) for f in FIELDS["battery"])))
+
+    def cockpit(self, ts, mileage):
+        self.rows["cockpit"].append((ts, (mileage,)))
+
+    def samples(self, kind, vin, start=None, end=None):
+        self.starts.append((kind, start))
+        return [row for row in self.rows[kind]
+                if start is None or row[0] >= start]
+
+
+def test_segment_sessions():
+    ts = np.array([0, 600, 1200, 1800, 2400, 3000, 30000, 30600])
+    level = np.array([50, 52, 54, 56, 56, 55, 60, 61], dtype=float)
+    status = np.array([0, 1, 1, 1, 0, 0, 1, 1], dtype=float)
+    power = np.array([0, 6, 6, 6, 0, 0, 7, np.nan])
+
+    found = segment_sessions(ts, level, status, power)
+    assert found["first"].tolist() == [1, 6]
+    assert found["last"].tolist() == [3, 7]
+    # 6 kW for 20 minutes; the second session misses a power reading
+    assert found["energy"][0] == pytest.approx(2.0)
+    assert np.isnan(found["energy"][1])
+    assert found["max_power"].tolist() == [6.0, 7.0]
+
+
+def test_sessions_are_updated_incrementally():
+    source = FakeSource()
+    analytics = ChargingAnalytics(source)
+    source.battery(T0, 40)
+    source.battery(T0 + 10 * MIN, 42, charging=True, power=7.0)
+    source.battery(T0 + 40 * MIN, 46, charging=True, power=7.0)
+
+    (session,) = analytics.sessions("VF1", capacity=50)
+    assert session["ongoing"]
+    assert session["energy_kwh"] == pytest.approx(3.5)
+
+    source.battery(T0 + 70 * MIN, 50, charging=True, power=5.0)
+    source.battery(T0 + 80 * MIN, 51)
+    (session,) = analytics.sessions("VF1", capacity=50)
+    assert not session["ongoing"]
+    assert session["start"] == T0 + 10 * MIN
+    assert session["end"] == T0 + 70 * MIN
+    assert session["energy_kwh"] == pytest.approx(3.5 + 3.0)
+    assert session["average_power_kw"] == pytest.approx(6.5)
+    assert session["energy_source"] == "power"
+
+    # Each call only asked for the readings after the last one seen
+    battery_starts = [s for kind, s in source.starts if kind == "battery"]
+    assert battery_starts == [None, T0 + 40 * MIN + 1]
+    assert analytics.stats["readings"] == 5
+
+
+def test_energy_from_level_without_power():
+    source = FakeSource()
+    analytics = ChargingAnalytics(source)
+    source.battery(T0, 20, charging=True)
+    source.battery(T0 + 3600, 40, charging=True)
+    source.battery(T0 + 7200, 40)
+
+    (session,) = analytics.sessions("VF1", capacity=50)
+    assert session["energy_source"] == "level"
+    assert session["energy_kwh"] == 10.0
+
+
+def test_efficiency_per_day():
+    source = FakeSource()
+    analytics = ChargingAnalytics(source)
+    source.cockpit(T0, 10000)
+    source.battery(T0, 80)
+    source.battery(T0 + 3600, 70)  # drove 10% of 50 kWh
+    source.cockpit(T0 + 3600, 10030)
+    analytics.efficiency("VF1", 50, now=T0 + 7200)
+
+    # Next day: charged with the level, then drove again
+    source.battery(T0 + 86400, 70, charging=True)
+    source.battery(T0 + 86400 + 3600, 90, charging=True)
+    source.battery(T0 + 86400 + 7200, 90)
+    source.battery(T0 + 86400 + 9000, 86)
+    source.cockpit(T0 + 86400 + 9000, 10045)
+
+    result = analytics.efficiency("VF1", 50, days=7, now=T0 + 2 * 86400)
+    assert [d["date"] for d in result["daily"]] == [
+        "2024-05-01", "2024-05-02"]
+    assert result["distance_km"] == 45.0
+    assert result["energy_used_kwh"] == 7.0
+    assert result["energy_charged_kwh"] == 10.0
+    assert result["consumption_kwh_per_100km"] == pytest.approx(15.6)
+
+    assert analytics.efficiency(
+        "VF1", 50, days=1, now=T0 + 86400)["distance_km"] == 15.0
@@ -1,8 +1,16 @@
 
+import typing
+import asyncio
 import pytest
+import aiohttp
 from fastapi.testclient import TestClient
 from unittest.mock import MagicMock, AsyncMock, patch
+import api
 from api import app
+from myrenault.assets import StaticAssets
+from myrenault.compression import available_encodings
+from myrenault.telemetry import READINGS
+from myrenault.vin_index import VinIndex
 
 client = TestClient(app)
 
@@ -19,6 +27,7 @@ def mock_renault_client():
         account = AsyncMock()
         account.account_id = "account_123"
         instance.get_api_accounts = AsyncMock(return_value=[account])
+        instance.get_api_account = AsyncMock(return_value=account)
 
         # Mock vehicle list
         vehicle_link = MagicMock()
@@ -62,6 +71,36 @@ def test_battery_status_success(mock_renault_client):
     assert data["batteryLevel"] == 80
 
 
+def test_battery_body_matches_response_model(mock_renault_client):
+    headers = {
+        "x-renault-email": "test@example.com",
+        "x-renault-password": "password"
+    }
+    response = client.get(
+        "/api/v1/vehicle/VF1234567890/battery", headers=headers)
+    # Renault sent chargingStatus=0.0 and chargingInstantaneousPower=0: as
+    # with BatteryStatusResponse validating the body, int fields are ints
+    # and float fields floats
+    assert response.content == (
+        b'{"batteryLevel":80,"batteryAutonomy":200,"chargingStatus":0,'
+        b'"plugStatus":0,"batteryTemperature":25,'
+        b'"chargingInstantaneousPower":0.0,'
+        b'"timestamp":"2023-01-01T00:00:00Z"}')
+
+
+@pytest.mark.parametrize("kind, model", [
+    ("battery", api.BatteryStatusResponse),
+    ("cockpit", api.CockpitResponse),
+    ("location", api.LocationResponse),
+])
+def test_readings_have_the_response_model_types(kind, model):
+    reading = READINGS[kind]
+    assert reading.fields == tuple(model.model_fields)
+    assert reading.types == tuple(
+        typing.get_args(field.annotation)[0]
+        for field in model.model_fields.values())
+
+
 def test_auth_failure():
     with patch('myrenault.client.RenaultClient') as MockClient:
         instance = MockClient.return_value
@@ -82,9 +121,28 @@ def test_auth_failure():
         assert "Auth failed" in response.json()["detail"]
 
 
+def test_failed_logins_leave_no_pool_locks():
+    with patch('myrenault.client.RenaultClient') as MockClient:
+        instance = MockClient.return_value
+        instance.session = AsyncMock()
+        instance.session.login = AsyncMock(
+            side_effect=Exception("Auth failed"))
+
+        for attempt in range(5):
+            headers = {
+                "x-renault-email": "test@example.com",
+                "x-renault-password": f"wrong{attempt}"
+            }
+            response = client.get(
+                "/api/v1/vehicle/VF1234567890/battery", headers=headers)
+            assert response.status_code == 500
+    assert api.session_pool._locks == {}
+
+
 def test_missing_headers():
     response = client.get("/api/v1/vehicle/VF1234567890/battery")
-    assert response.status_code == 422  # FastAPI default validation error
+    assert response.status_code == 401
+    assert response.headers["www-authenticate"] == "Bearer"
 
 
 def test_get_vehicles_success(mock_renault_client):
@@ -104,3 +162,584 @@ def test_get_vehicles_success(mock_renault_client):
     assert data[0]["registrationNumber"] == "AB-123-CD"
     assert data[0]["energy"] == "ELEC"
     assert data[0]["picture"] == "http://example.com/pic.jpg"
+
+
+def test_session_reused_across_requests(mock_renault_client):
+    headers = {
+        "x-renault-email": "test@example.com",
+        "x-renault-password": "password"
+    }
+    for _ in range(3):
+        response = client.get(
+            "/api/v1/vehicle/VF1234567890/battery", headers=headers)
+        assert response.status_code == 200
+
+    assert mock_renault_client.session.login.await_count == 1
+    assert mock_renault_client.get_api_accounts.await_count == 1
+
+
+def test_session_not_shared_between_credentials(mock_renault_client):
+    for password in ("password", "other"):
+        response = client.get(
+            "/api/v1/vehicle/VF1234567890/battery",
+            headers={
+                "x-renault-email": "test@example.com",
+                "x-renault-password": password
+            })
+        assert response.status_code == 200
+
+    assert mock_renault_client.session.login.await_count == 2
+
+
+def test_battery_served_from_cache(mock_renault_client):
+    headers = {
+        "x-renault-email": "test@example.com",
+        "x-renault-password": "password"
+    }
+    first = client.get(
+        "/api/v1/vehicle/VF1234567890/battery", headers=headers)
+    second = client.get(
+        "/api/v1/vehicle/VF1234567890/battery", headers=headers)
+
+    assert first.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Cache"] == "HIT"
+    assert "Age" in second.headers
+    assert second.json() == first.json()
+
+    account = mock_renault_client.get_api_accounts.return_value[0]
+    vehicle = account.get_api_vehicle.return_value
+    assert vehicle.get_battery_status.await_count == 1
+
+
+def test_battery_freshness_controls(mock_renault_client):
+    headers = {
+        "x-renault-email": "test@example.com",
+        "x-renault-password": "password"
+    }
+    client.get("/api/v1/vehicle/VF1234567890/battery", headers=headers)
+    fresh = client.get(
+        "/api/v1/vehicle/VF1234567890/battery?max_age=0", headers=headers)
+    no_cache = client.get(
+        "/api/v1/vehicle/VF1234567890/battery",
+        headers={**headers, "cache-control": "no-cache"})
+
+    assert fresh.headers["X-Cache"] == "MISS"
+    assert no_cache.headers["X-Cache"] == "MISS"
+
+    account = mock_renault_client.get_api_accounts.return_value[0]
+    vehicle = account.get_api_vehicle.return_value
+    assert vehicle.get_battery_status.await_count == 3
+
+
+def test_battery_conditional_requests(mock_renault_client):
+    headers = {
+        "x-renault-email": "test@example.com",
+        "x-renault-password": "password"
+    }
+    computed = api.fingerprints.stats["computed"]
+    first = client.get(
+        "/api/v1/vehicle/VF1234567890/battery", headers=headers)
+    etag = first.headers["ETag"]
+    assert etag.startswith('"')
+    assert first.headers["Last-Modified"] == "Sun, 01 Jan 2023 00:00:00 GMT"
+
+    revalidated = client.get(
+        "/api/v1/vehicle/VF1234567890/battery",
+        headers={**headers, "if-none-match": f'"other", {etag}'})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+    assert revalidated.headers["ETag"] == etag
+    assert revalidated.headers["X-Cache"] == "HIT"
+
+    since = client.get(
+        "/api/v1/vehicle/VF1234567890/battery",
+        headers={**headers,
+                 "if-modified-since": "Mon, 02 Jan 2023 00:00:00 GMT"})
+    assert since.status_code == 304
+
+    changed = client.get(
+        "/api/v1/vehicle/VF1234567890/battery",
+        headers={**headers, "if-none-match": '"other"'})
+    assert changed.status_code == 200
+    assert changed.json() == first.json()
+
+    # A forced refresh still revalidates against the new reading
+    refreshed = client.get(
+        "/api/v1/vehicle/VF1234567890/battery?max_age=0",
+        headers={**headers, "if-none-match": etag})
+    assert refreshed.status_code == 304
+
+    account = mock_renault_client.get_api_accounts.return_value[0]
+    vehicle = account.get_api_vehicle.return_value
+    assert vehicle.get_battery_status.await_count == 2
+    # Once per reading, not per response
+    assert api.fingerprints.stats["computed"] - computed == 2
+
+
+def test_charge_start_invalidates_battery(mock_renault_client):
+    headers = {
+        "x-renault-email": "test@example.com",
+        "x-renault-password": "password"
+    }
+    account = mock_renault_client.get_api_accounts.return_value[0]
+    vehicle = account.get_api_vehicle.return_value
+    vehicle.set_charge_start = AsyncMock(return_value={"ok": True})
+
+    client.get("/api/v1/vehicle/VF1234567890/battery", headers=headers)
+    response = client.post(
+        "/api/v1/vehicle/VF1234567890/charge-start?wait=5", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["status"] == "succeeded"
+    after = client.get(
+        "/api/v1/vehicle/VF1234567890/battery", headers=headers)
+
+    assert after.headers["X-Cache"] == "MISS"
+    assert vehicle.get_battery_status.await_count == 2
+
+
+def test_snapshot_reports_failures_per_field(mock_renault_client):
+    headers = {
+        "x-renault-email": "test@example.com",
+        "x-renault-password": "password"
+    }
+    account = mock_renault_client.get_api_accounts.return_value[0]
+    vehicle = account.get_api_vehicle.return_value
+    vehicle.get_cockpit = AsyncMock(return_value=MagicMock(totalMileage=1234.5))
+    vehicle.get_location = AsyncMock(side_effect=Exception("No GPS fix"))
+
+    response = client.get(
+        "/api/v1/vehicle/VF1234567890/snapshot", headers=headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["battery"]["batteryLevel"] == 80
+    assert data["cockpit"]["totalMileage"] == 1234.5
+    assert data["location"] is None
+    assert data["errors"] == {"location": "No GPS fix"}
+    assert account.get_api_vehicle.await_count == 1
+
+
+def test_multi_vehicle_snapshot(mock_renault_client):
+    headers = {
+        "x-renault-email": "test@example.com",
+        "x-renault-password": "password"
+    }
+    account = mock_renault_client.get_api_accounts.return_value[0]
+    vehicle = account.get_api_vehicle.return_value
+    vehicle.get_cockpit = AsyncMock(return_value=MagicMock(totalMileage=10))
+    vehicle.get_location = AsyncMock(return_value=MagicMock(
+        gpsLatitude=48.8, gpsLongitude=2.3, lastUpdateTime=None))
+
+    response = client.post(
+        "/api/v1/vehicles/snapshot",
+        json={"vins": ["VF1234567890", "VF0000000000"]},
+        headers=headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert [s["vin"] for s in data] == ["VF1234567890", "VF0000000000"]
+    assert all(s["errors"] == {} for s in data)
+    assert mock_renault_client.session.login.await_count == 1
+
+
+def test_vin_index_skips_account_scan(mock_renault_client):
+    headers = {
+        "x-renault-email": "test@example.com",
+        "x-renault-password": "password"
+    }
+    first = mock_renault_client.get_api_accounts.return_value[0]
+    empty = MagicMock(vehicleLinks=[])
+    other = AsyncMock()
+    other.account_id = "account_456"
+    other.get_vehicles = AsyncMock(return_value=empty)
+    mock_renault_client.get_api_accounts.return_value = [other, first]
+
+    response = client.get(
+        "/api/v1/vehicle/VF1234567890/battery", headers=headers)
+    assert response.status_code == 200
+    assert other.get_vehicles.await_count == 1
+    assert first.get_vehicles.await_count == 1
+
+    # A new login (e.g. after a restart of the pool) resolves the vehicle
+    # from the index without listing accounts again.
+    api.session_pool.clear()
+    response = client.get(
+        "/api/v1/vehicle/VF1234567890/battery?max_age=0", headers=headers)
+    assert response.status_code == 200
+    assert mock_renault_client.get_api_accounts.await_count == 1
+    mock_renault_client.get_api_account.assert_awaited_once_with("account_123")
+
+
+def test_vin_index_persistence(tmp_path):
+    path = str(tmp_path / "vins.json")
+    index = VinIndex(path=path)
+    index.update("Test@Example.com", {"VF1": "account_123"})
+
+    reloaded = VinIndex(path=path)
+    assert reloaded.get("test@example.com", "VF1") == "account_123"
+    reloaded.discard("test@example.com", "VF1")
+    assert VinIndex(path=path).get("test@example.com", "VF1") is None
+
+
+def test_websocket_stream_sends_battery(mock_renault_client):
+    headers = {
+        "x-renault-email": "test@example.com",
+        "x-renault-password": "password"
+    }
+    with client.websocket_connect(
+            "/api/v1/vehicle/VF1234567890/ws?kinds=battery",
+            headers=headers) as ws:
+        event = ws.receive_json()
+
+    assert event["kind"] == "battery"
+    assert event["data"]["batteryLevel"] == 80
+
+
+def test_history_records_readings(mock_renault_client):
+    headers = {
+        "x-renault-email": "test@example.com",
+        "x-renault-password": "password"
+    }
+    client.get("/api/v1/vehicle/VF1234567890/battery", headers=headers)
+    api.history.flush()
+
+    response = client.get(
+        "/api/v1/vehicle/VF1234567890/history"
+        "?kind=battery&from=2023-01-01T00:00:00Z&to=2023-01-02T00:00:00Z",
+        headers=headers)
+    assert response.status_code == 200
+    buckets = response.json()["buckets"]
+    assert buckets[0]["batteryLevel"]["max"] == 80
+
+
+def test_history_without_database_serves_recent_samples(
+        mock_renault_client, monkeypatch):
+    monkeypatch.setattr(api, "history", None)
+    headers = {
+        "x-renault-email": "test@example.com",
+        "x-renault-password": "password"
+    }
+    client.get("/api/v1/vehicle/VF1234567890/battery", headers=headers)
+
+    response = client.get(
+        "/api/v1/vehicle/VF1234567890/history"
+        "?kind=battery&from=2023-01-01T00:00:00Z&to=2023-01-02T00:00:00Z",
+        headers=headers)
+    assert response.status_code == 200
+    buckets = response.json()["buckets"]
+    assert buckets[0]["count"] == 1
+    assert buckets[0]["batteryLevel"]["max"] == 80
+
+
+def test_history_times_without_offset_are_utc(mock_renault_client):
+    headers = {
+        "x-renault-email": "test@example.com",
+        "x-renault-password": "password"
+    }
+    response = client.get(
+        "/api/v1/vehicle/VF1234567890/history"
+        "?from=2023-01-01T00:00:00&to=2023-01-02T00:00:00", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["start"] == 1672531200
+    assert response.json()["end"] == 1672617600
+
+
+def test_history_requires_owned_vehicle(mock_renault_client):
+    headers = {
+        "x-renault-email": "test@example.com",
+        "x-renault-password": "password"
+    }
+    response = client.get(
+        "/api/v1/vehicle/VF0000000000/history", headers=headers)
+    assert response.status_code == 404
+
+
+def test_action_returns_job_immediately(mock_renault_client):
+    headers = {
+        "x-renault-email": "test@example.com",
+        "x-renault-password": "password"
+    }
+    account = mock_renault_client.get_api_accounts.return_value[0]
+    vehicle = account.get_api_vehicle.return_value
+    vehicle.start_horn = AsyncMock(return_value={"ok": True})
+
+    with TestClient(app) as session_client:
+        response = session_client.post(
+            "/api/v1/vehicle/VF1234567890/honk", headers=headers)
+        assert response.status_code == 202
+        job = response.json()
+        assert job["status"] == "queued"
+        assert response.headers["Location"] == f"/api/v1/jobs/{job['id']}"
+
+        response = session_client.get(
+            f"/api/v1/jobs/{job['id']}?wait=5", headers=headers)
+        assert response.status_code == 200
+        assert response.json()["status"] == "succeeded"
+        assert response.json()["result"] == {"ok": True}
+
+        other = session_client.get(
+            f"/api/v1/jobs/{job['id']}",
+            headers={**headers, "x-renault-password": "other"})
+        assert other.status_code == 404
+
+
+def test_vehicle_geofences_and_trips(mock_renault_client):
+    headers = {
+        "x-renault-email": "fence@example.com",
+        "x-renault-password": "password"
+    }
+    account = mock_renault_client.get_api_accounts.return_value[0]
+    vehicle = account.get_api_vehicle.return_value
+    vehicle.get_location = AsyncMock(return_value=MagicMock(
+        gpsLatitude=48.8656, gpsLongitude=2.3212,
+        lastUpdateTime="2024-05-01T08:00:00Z"))
+
+    response = client.post("/api/v1/geofences", headers=headers, json={
+        "name": "home",
+        "circle": {"latitude": 48.8656, "longitude": 2.3212, "radius": 200}})
+    assert response.status_code == 201
+    fence = response.json()
+    both = client.post("/api/v1/geofences", headers=headers, json={
+        "name": "bad", "circle": fence["circle"],
+        "polygon": [[0, 0], [0, 1], [1, 1]]})
+    assert both.status_code == 422
+
+    response = client.get(
+        "/api/v1/vehicle/VF1234567890/geofences", headers=headers)
+    assert response.status_code == 200
+    assert [f["name"] for f in response.json()["inside"]] == ["home"]
+    assert response.json()["events"][0]["type"] == "enter"
+
+    response = client.get(
+        "/api/v1/vehicle/VF1234567890/trips", headers=headers)
+    assert response.json() == {"vin": "VF1234567890", "trips": []}
+
+    assert client.get("/api/v1/geofences", headers=headers).json() == [fence]
+    response = client.delete(
+        f"/api/v1/geofences/{fence['id']}", headers=headers)
+    assert response.status_code == 204
+
+
+@pytest.mark.parametrize("polygon", [
+    [[0, 0], [0, 1]],  # fewer than 3 points
+    [[0, 0], [0, 1], [91, 1]],  # latitude out of range
+    [[0, 0], [0, 181], [1, 1]],  # longitude out of range
+])
+def test_invalid_geofence_polygons(mock_renault_client, polygon):
+    headers = {
+        "x-renault-email": "fence@example.com",
+        "x-renault-password": "password"
+    }
+    response = client.post("/api/v1/geofences", headers=headers, json={
+        "name": "bad", "polygon": polygon})
+    assert response.status_code == 422
+
+
+def test_static_assets_are_compressed_once():
+    response = client.get("/", headers={"Accept-Encoding": "br, gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] in ("br", "gzip")
+    assert response.headers["content-type"].startswith("text/html")
+    assert response.headers["cache-control"] == "no-cache"
+    assert "MyRenault" in response.text
+    etag = response.headers["etag"]
+
+    response = client.get("/", headers={
+        "Accept-Encoding": "br, gzip", "If-None-Match": etag})
+    assert response.status_code == 304
+    response = client.get("/", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] != etag
+
+    url = api.assets.url("index.html")
+    response = client.get(url)
+    assert response.headers["cache-control"] == (
+        "public, max-age=31536000, immutable")
+    assert client.get("/static/missing.js").status_code == 404
+
+
+def test_static_assets_compressed_on_first_request(tmp_path):
+    (tmp_path / "app.js").write_text("console.log('MyRenault');\n" * 50)
+    (tmp_path / "tiny.txt").write_text("x")
+    encodings = available_encodings("br,gzip")
+    assets = StaticAssets(str(tmp_path), encodings)
+    # Startup only reads and hashes the files
+    assert all(list(asset.bodies) == [None]
+               for asset in assets._assets.values())
+
+    async def run():
+        # Concurrent first requests share one compression
+        first, second = await asyncio.gather(
+            assets.response("app.js", "br, gzip"),
+            assets.response("app.js", "br, gzip"))
+        assert first.body == second.body
+        body = assets._assets["app.js"].bodies[encodings[0]]
+        await assets.response("app.js", "br, gzip")
+        assert assets._assets["app.js"].bodies[encodings[0]] is body
+        # Compressing does not pay off: sent as it is
+        tiny = await assets.response("tiny.txt", "br, gzip")
+        return first, tiny
+
+    response, tiny = asyncio.run(run())
+    # brotli is optional: gzip only without it
+    assert response.headers["content-encoding"] == encodings[0]
+    assert set(assets._assets["app.js"].bodies) == {None, encodings[0]}
+    assert assets._compressing == {}
+    assert "content-encoding" not in tiny.headers
+    assert tiny.body == b"x"
+
+
+def test_charging_analytics_endpoints(mock_renault_client):
+    headers = {
+        "x-renault-email": "test@example.com",
+        "x-renault-password": "password"
+    }
+    response = client.get(
+        "/api/v1/vehicle/VF1234567890/charging-sessions",
+        headers=headers)
+    assert response.status_code == 200
+    assert response.json()["sessions"] == []
+
+    response = client.get(
+        "/api/v1/vehicle/VF1234567890/efficiency?days=7&battery_capacity=40",
+        headers=headers)
+    assert response.status_code == 200
+    assert response.json()["days"] == 7
+    assert response.json()["consumption_kwh_per_100km"] is None
+
+    response = client.get(
+        "/api/v1/vehicle/VF1234567890/efficiency?days=0", headers=headers)
+    assert response.status_code == 422
+
+
+def test_charge_schedule_lifecycle(mock_renault_client):
+    headers = {
+        "x-renault-email": "schedule@example.com",
+        "x-renault-password": "password"
+    }
+    url = "/api/v1/vehicle/VF1234567890/charge-schedule"
+    body = {"target_soc": 90, "deadline": "2999-01-01T07:00:00",
+            "windows": ["22:30-06:30"], "timezone": "Europe/Paris"}
+
+    response = client.post(url, json=body, headers=headers)
+    assert response.status_code == 201
+    schedule = response.json()
+    # Not plugged in: waits whether or not the window is open
+    assert schedule["status"] == "waiting"
+    assert schedule["battery_level"] == 80
+    assert schedule["plan"][0]["end"] - schedule["plan"][0]["start"] > 0
+    assert "password" not in schedule
+
+    assert client.get(url, headers=headers).json()["id"] == schedule["id"]
+    bad = client.post(url, json={**body, "windows": ["25:00-06:00"]},
+                      headers=headers)
+    assert bad.status_code == 422
+
+    assert client.delete(url, headers=headers).status_code == 204
+    assert client.get(url, headers=headers).status_code == 404
+
+
+def test_metrics_exposes_routes_and_upstream(mock_renault_client):
+    headers = {
+        "x-renault-email": "metrics@example.com",
+        "x-renault-password": "password"
+    }
+    client.get("/api/v1/vehicle/VF1234567890/battery", headers=headers)
+    client.get("/api/v1/vehicle/VF1234567890/battery", headers=headers)
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert ('http_requests_total{method="GET",'
+            'route="/api/v1/vehicle/{vin}/battery",status="200"}') in body
+    assert ('renault_upstream_request_duration_seconds_count'
+            '{operation="get_battery_status"}') in body
+    assert 'renault_client_calls_total{method="read",outcome="success"}' in body
+    assert "renault_response_cache_hits_total" in body
+
+
+def test_session_token_replaces_credentials(mock_renault_client):
+    headers = {
+        "x-renault-email": "token@example.com",
+        "x-renault-password": "password"
+    }
+    response = client.post("/api/v1/session", headers=headers)
+    assert response.status_code == 201
+    body = response.json()
+    assert body["token_type"] == "bearer"
+    assert body["expires_in"] == api.tokens.ttl
+    auth = {"Authorization": f"Bearer {body['token']}"}
+
+    response = client.get(
+        "/api/v1/vehicle/VF1234567890/battery", headers=auth)
+    assert response.status_code == 200
+    assert response.json()["batteryLevel"] == 80
+    # The token reuses the client logged in by POST /session
+    assert mock_renault_client.session.login.await_count == 1
+
+    assert client.delete("/api/v1/session", headers=auth).status_code == 204
+    response = client.get(
+        "/api/v1/vehicle/VF1234567890/battery", headers=auth)
+    assert response.status_code == 401
+
+
+def test_expired_session_token_is_rejected(mock_renault_client):
+    token, session = api.tokens.issue("token@example.com", "password")
+    session.expires_at = 0
+    response = client.get(
+        "/api/v1/vehicles", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 401
+    assert len(api.tokens) == 0
+
+
+def test_stale_battery_served_while_circuit_is_open(
+        mock_renault_client, monkeypatch):
+    monkeypatch.setattr(api.breaker, "min_calls", 2)
+    headers = {
+        "x-renault-email": "stale@example.com",
+        "x-renault-password": "password"
+    }
+    url = "/api/v1/vehicle/VF1234567890/battery"
+    assert client.get(url, headers=headers).status_code == 200
+
+    vehicle = mock_renault_client.get_api_accounts.return_value[0] \
+        .get_api_vehicle.return_value
+    vehicle.get_battery_status.side_effect = aiohttp.ServerDisconnectedError()
+    # One failure out of two calls reaches the error rate
+    response = client.get(url + "?max_age=0", headers=headers)
+    assert response.status_code >= 500
+
+    calls = vehicle.get_battery_status.await_count
+    response = client.get(url + "?max_age=0", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["x-cache"] == "STALE"
+    assert response.json()["batteryLevel"] == 80
+    # The open circuit kept the request away from Renault
+    assert vehicle.get_battery_status.await_count == calls
+
+
+def test_fleet_status_streams_ndjson(mock_renault_client):
+    import json
+    headers = {
+        "x-renault-email": "fleet@example.com",
+        "x-renault-password": "password"
+    }
+    response = client.get(
+        "/api/v1/fleet/status?kinds=battery", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == 1
+    assert lines[0]["vin"] == "VF1234567890"
+    assert lines[0]["model"] == "Zoe"
+    assert lines[0]["battery"]["batteryLevel"] == 80
+
+    # Battery at 80% and unplugged: filtered out
+    for query in ("battery_below=50", "plugged=true"):
+        response = client.get(
+            f"/api/v1/fleet/status?kinds=battery&{query}", headers=headers)
+        assert response.status_code == 200
+        assert response.text == ""
+    response = client.get(
+        "/api/v1/fleet/status?kinds=battery&battery_below=90&plugged=false",
+        headers=headers)
+    assert len(response.text.splitlines()) == 1
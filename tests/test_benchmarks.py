@@ -0,0 +1,63 @@
+import asyncio
+import api
+from benchmarks.fake_renault import FakeRenault
+from benchmarks import coldstart, serialization
+from benchmarks.harness import run_benchmark, compare
+
+
+def run_against_fake(monkeypatch, scenario, **fake_options):
+    async def run():
+        fake = await FakeRenault(latency=0, seed=1, **fake_options).start()
+        for name, value in fake.locale_env().items():
+            monkeypatch.setenv(name, value)
+        try:
+            async with api.app.router.lifespan_context(api.app):
+                return await run_benchmark(
+                    api.app, fake, scenario, requests=40, concurrency=4,
+                    accounts=2)
+        finally:
+            await fake.close()
+    return asyncio.run(run())
+
+
+def test_battery_benchmark_against_fake_server(monkeypatch):
+    results = run_against_fake(monkeypatch, "battery")
+    assert results["status"] == {"200": 40}
+    # One login per account, then the pool and the cache serve the rest
+    assert results["upstream_by_endpoint"]["/accounts.login"] == 2
+    assert results["upstream_per_request"] < 1
+    assert results["latency_ms"]["p50"] <= results["latency_ms"]["p99"]
+
+
+def test_upstream_errors_surface_as_bad_gateway(monkeypatch):
+    results = run_against_fake(monkeypatch, "battery-fresh", error_rate=1.0)
+    assert results["status"] == {"502": 40}
+
+
+def test_compare_flags_regressions():
+    baseline = {"rps": 100.0, "latency_ms": {"p95": 10.0},
+                "upstream_per_request": 1.0}
+    rows, regressed = compare(
+        baseline, {**baseline, "rps": 95.0}, tolerance=10)
+    assert not regressed
+    assert ("rps", 100.0, 95.0, -5.0) in rows
+
+    _, regressed = compare(
+        baseline, {**baseline, "latency_ms": {"p95": 12.0}}, tolerance=10)
+    assert regressed
+
+
+def test_serialization_benchmark_matches_fastapi():
+    results = serialization.run(iterations=3, vehicles=3)
+    assert set(results["routes"]) == {
+        "battery", "vehicles", "snapshots", "history"}
+    for route in results["routes"].values():
+        assert route["fast_us"] > 0 and route["fastapi_us"] > 0
+
+
+def test_cold_start_benchmark_reaches_first_response():
+    results = asyncio.run(coldstart.run(runs=1, target="battery",
+                                        fast_start=True))
+    # Login and the deferred imports happen on this first request
+    assert results["runs"] == 1
+    assert results["first_200_ms"]["min"] > 0
@@ -0,0 +1,90 @@
+import asyncio
+import aiohttp
+import pytest
+from myrenault.breaker import CircuitBreaker, CircuitOpenError, CLOSED, OPEN
+
+
+async def ok():
+    return "ok"
+
+
+async def down():
+    raise aiohttp.ClientConnectionError("connection refused")
+
+
+async def not_found():
+    raise ValueError("unknown VIN")
+
+
+def test_circuit_opens_on_error_rate_and_fails_fast():
+    breaker = CircuitBreaker(min_calls=4, error_rate=0.5, open_seconds=60)
+
+    async def run():
+        for func in (ok, ok, down):
+            try:
+                await breaker.call("battery", func)
+            except aiohttp.ClientError:
+                pass
+        assert breaker.state("battery") == CLOSED
+        with pytest.raises(aiohttp.ClientError):
+            await breaker.call("battery", down)
+        assert breaker.state("battery") == OPEN
+
+        with pytest.raises(CircuitOpenError) as e:
+            await breaker.call("battery", ok)
+        assert e.value.retry_after > 0
+        # Other operations keep their own circuit
+        assert await breaker.call("location", ok) == "ok"
+
+    asyncio.run(run())
+    assert breaker.get_stats()["short_circuited"] == 1
+
+
+def test_client_errors_do_not_open_the_circuit():
+    breaker = CircuitBreaker(min_calls=2)
+
+    async def run():
+        for _ in range(5):
+            with pytest.raises(ValueError):
+                await breaker.call("battery", not_found)
+
+    asyncio.run(run())
+    assert breaker.state("battery") == CLOSED
+
+
+def test_half_open_probe_closes_or_reopens():
+    breaker = CircuitBreaker(min_calls=1, open_seconds=0)
+
+    async def run():
+        with pytest.raises(aiohttp.ClientError):
+            await breaker.call("battery", down)
+        assert breaker.state("battery") == OPEN
+        # open_seconds elapsed: the probe goes through and fails again
+        with pytest.raises(aiohttp.ClientError):
+            await breaker.call("battery", down)
+        assert breaker.state("battery") == OPEN
+        assert await breaker.call("battery", ok) == "ok"
+        assert breaker.state("battery") == CLOSED
+
+    asyncio.run(run())
+
+
+def test_timeout_adapts_to_observed_latency():
+    breaker = CircuitBreaker(min_timeout=0.05, max_timeout=30)
+    assert breaker.timeout("battery") == 30
+
+    async def fast():
+        await asyncio.sleep(0.001)
+
+    async def hang():
+        await asyncio.sleep(10)
+
+    async def run():
+        for _ in range(10):
+            await breaker.call("battery", fast)
+        assert breaker.timeout("battery") == 0.05
+        with pytest.raises(asyncio.TimeoutError):
+            await breaker.call("battery", hang)
+
+    asyncio.run(run())
+    assert breaker.get_stats()["timeouts"] == 1
@@ -0,0 +1,214 @@
+import os
+import stat
+import time
+import sqlite3
+import asyncio
+import datetime
+
+import pytest
+
+from myrenault.cache import CacheResult
+from myrenault.charging import (
+    ChargeScheduler, ScheduleStore, charge_duration, parse_window,
+    plan_charge, window_intervals)
+from myrenault.secretbox import SecretBox
+from myrenault.telemetry import BatteryReading
+
+# 2024-05-01 12:00 UTC
+NOON = datetime.datetime(2024, 5, 1, 12, tzinfo=datetime.timezone.utc)
+HOUR = 3600
+
+
+class FakeClient:
+    def __init__(self, level=40, charging=False, plugged=True, power=7.0):
+        self.battery = BatteryReading(
+            batteryLevel=level, chargingStatus=1.0 if charging else 0.0,
+            plugStatus=1 if plugged else 0,
+            chargingInstantaneousPower=power if charging else 0.0)
+        self.reads = 0
+
+    async def read(self, kind, vin, max_age=None):
+        self.reads += 1
+        return CacheResult(self.battery, False, 0.0)
+
+
+class FakeJob:
+    def __init__(self, action):
+        self.id = action
+
+
+class FakeJobs:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, email, password, vin, action, args=()):
+        self.submitted.append((vin, action))
+        return FakeJob(action)
+
+
+def make_scheduler(client, **kwargs):
+    async def factory(email, password):
+        return client
+    return ChargeScheduler(factory, FakeJobs(), **kwargs)
+
+
+def test_window_crossing_midnight():
+    windows = [parse_window("22:00-06:00")]
+    now = NOON.timestamp()
+    intervals = window_intervals(windows, "UTC", now, now + 24 * HOUR)
+    assert intervals == [(now + 10 * HOUR, now + 18 * HOUR)]
+
+    # Paris is UTC+2 in May
+    intervals = window_intervals(
+        windows, "Europe/Paris", now, now + 24 * HOUR)
+    assert intervals == [(now + 8 * HOUR, now + 16 * HOUR)]
+
+
+def test_window_bounds():
+    assert parse_window("00:00-24:00") == (0, 1440)
+    for window in ("22:00-24:30", "24:59-06:00", "22:60-06:00", "22:00",
+                   "10:00-10:00"):
+        with pytest.raises(ValueError):
+            parse_window(window)
+
+
+def test_plan_prefers_offpeak_windows():
+    now = NOON.timestamp()
+    windows = [parse_window("22:00-06:00")]
+    deadline = now + 20 * HOUR
+
+    plan = plan_charge(now, deadline, 3 * HOUR, windows, "UTC")
+    assert plan == [(now + 10 * HOUR, now + 13 * HOUR)]
+
+    # Too long for the window: the rest is charged right away
+    plan = plan_charge(now, deadline, 10 * HOUR, windows, "UTC")
+    assert plan == [(now, now + 2 * HOUR), (now + 10 * HOUR, now + 18 * HOUR)]
+
+    assert plan_charge(now, deadline, 0, windows, "UTC") == []
+    assert charge_duration(80, 80, 52, 7) == 0
+    assert charge_duration(40, 80, 50, 10) == 2 * HOUR * 1.15
+
+
+def test_schedule_starts_and_stops_with_the_plan():
+    client = FakeClient(level=40)
+    scheduler = make_scheduler(client)
+    now = time.time()
+
+    async def run():
+        # No window: charging starts right away
+        schedule = await scheduler.add(
+            "a@b.c", "pw", "vf1", 80, now + 12 * HOUR, [])
+        assert schedule.vin == "VF1"
+        assert schedule.status == "charging"
+        assert scheduler.jobs.submitted == [("VF1", "charge_start")]
+
+        # Charging faster than planned: the check moves forward
+        client.battery = BatteryReading(
+            batteryLevel=80, chargingStatus=1.0, plugStatus=1,
+            chargingInstantaneousPower=11.0)
+        await scheduler.run_due(schedule.next_check)
+        return schedule
+
+    schedule = asyncio.run(run())
+    assert schedule.status == "completed"
+    assert scheduler.jobs.submitted[-1] == ("VF1", "charge_stop")
+    assert scheduler.get_stats()["completed"] == 1
+    assert scheduler.get_stats()["timers"] == 0
+
+
+def test_charging_outside_the_plan_is_stopped():
+    # Plugged in at noon, starts charging on its own before the window
+    client = FakeClient(level=40, charging=True)
+    scheduler = make_scheduler(client)
+    deadline = time.time() + 30 * HOUR
+
+    schedule = asyncio.run(scheduler.add(
+        "a@b.c", "pw", "VF1", 45, deadline, [_window_later()]))
+    assert schedule.status == "waiting"
+    assert scheduler.jobs.submitted == [("VF1", "charge_stop")]
+    assert schedule.power == 7.0
+    assert schedule.next_check == schedule.plan[0][0]
+
+
+def _window_later():
+    # A one-hour window starting two hours from now
+    start = datetime.datetime.now(datetime.timezone.utc) + \
+        datetime.timedelta(hours=2)
+    end = start + datetime.timedelta(hours=1)
+    return f"{start:%H:%M}-{end:%H:%M}"
+
+
+def test_due_checks_run_in_batches():
+    client = FakeClient(level=50)
+    scheduler = make_scheduler(client, batch_size=2, batch_interval=0)
+    now = time.time()
+
+    async def run():
+        for i in range(5):
+            await scheduler.add("a@b.c", "pw", f"VF{i}", 80, now + HOUR, [])
+        client.reads = 0
+        await scheduler.run_due(now + 2 * HOUR)
+
+    asyncio.run(run())
+    # Each due check ran once, deadline passed below the target
+    assert client.reads == 5
+    assert scheduler.stats["batches"] == 3
+    assert scheduler.stats["missed"] == 5
+
+
+def test_schedules_survive_restarts(tmp_path):
+    pytest.importorskip("cryptography")
+    path = str(tmp_path / "schedules.sqlite3")
+    box = SecretBox("key")
+    client = FakeClient(level=40)
+    deadline = time.time() + 12 * HOUR
+
+    scheduler = make_scheduler(client, store=ScheduleStore(path, box))
+    asyncio.run(scheduler.add(
+        "a@b.c", "pw", "VF1", 80, deadline, ["22:00-06:00"], "Europe/Paris"))
+    asyncio.run(scheduler.close())
+
+    # Holds credentials: private to the server's user
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+    restarted = make_scheduler(client, store=ScheduleStore(path, box))
+    asyncio.run(restarted._load())
+    schedule = restarted.get("a@b.c", "pw", "VF1")
+    assert schedule.deadline == deadline
+    assert schedule.windows == ["22:00-06:00"]
+    assert schedule.timezone == "Europe/Paris"
+    assert restarted.get_stats()["timers"] == 1
+
+    asyncio.run(restarted.remove("a@b.c", "pw", "VF1"))
+    assert ScheduleStore(path, box).load() == []
+
+
+def test_schedule_store_needs_a_secret_box(tmp_path):
+    with pytest.raises(ValueError):
+        ScheduleStore(str(tmp_path / "schedules.sqlite3"), None)
+
+
+def test_plain_passwords_of_older_files_are_encrypted(tmp_path):
+    pytest.importorskip("cryptography")
+    path = str(tmp_path / "schedules.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE schedules ("
+        "id TEXT PRIMARY KEY, email TEXT, password TEXT, vin TEXT, "
+        "target REAL, deadline REAL, windows TEXT, timezone TEXT, "
+        "capacity REAL, power REAL, status TEXT, created_at REAL)")
+    conn.execute(
+        "INSERT INTO schedules VALUES ('s1', 'a@b.c', 'hunter2', 'VF1', 80, "
+        "1e10, '[]', 'UTC', 52, 7.4, 'waiting', 0)")
+    conn.commit()
+    conn.close()
+
+    store = ScheduleStore(path, SecretBox("key"))
+    [schedule] = store.load()
+    assert schedule._credentials == ("a@b.c", "hunter2")
+    store.save(schedule)
+    store.close()
+    with open(path, "rb") as f:
+        assert b"hunter2" not in f.read()
+    # Rows sealed with another key are skipped
+    assert ScheduleStore(path, SecretBox("other")).load() == []
@@ -0,0 +1,119 @@
+import pytest
+
+from myrenault.geofence import (
+    VECTOR_MIN, Circle, GeofenceEngine, GridIndex, Geofence, Polygon,
+    distance, distances)
+
+# Place de la Concorde, Paris
+LAT, LON = 48.8656, 2.3212
+
+
+def location(lat, lon, minute):
+    return {"latitude": lat, "longitude": lon,
+            "timestamp": f"2024-05-01T08:{minute:02d}:00Z"}
+
+
+def test_shapes():
+    assert distance(48.8566, 2.3522, 51.5074, -0.1278) == pytest.approx(
+        343500, rel=0.01)
+
+    circle = Circle(LAT, LON, 500)
+    assert circle.contains(LAT + 0.004, LON)  # about 445 m north
+    assert not circle.contains(LAT + 0.005, LON)
+
+    # Concave "L" shape
+    polygon = Polygon([(0, 0), (0, 2), (1, 2), (1, 1), (2, 1), (2, 0)])
+    assert polygon.contains(0.5, 1.5)
+    assert polygon.contains(1.5, 0.5)
+    assert not polygon.contains(1.5, 1.5)
+    with pytest.raises(ValueError):
+        Polygon([(0, 0), (1, 1)])
+
+
+def test_many_circles_are_checked_together():
+    points = [(LAT + i * 0.001, LON - i * 0.002) for i in range(10)]
+    assert distances(LAT, LON, *zip(*points)).tolist() == pytest.approx(
+        [distance(LAT, LON, lat, lon) for lat, lon in points])
+
+    engine = GeofenceEngine()
+    # Centers k * 73 m east, radii 30 m below or above that distance:
+    # every other circle contains the position
+    for i in range(VECTOR_MIN + 4):
+        k = i // 2 + 1
+        engine.add("a@b.c", f"c{i}", Circle(
+            LAT, LON + 0.001 * k, 73 * k + (30 if i % 2 else -30)))
+    engine.record("a@b.c", "VF1", location(LAT, LON, 0))
+    inside = {f["name"] for f in engine.status("a@b.c", "VF1")["inside"]}
+    assert inside == {f.name for f in engine.fences("a@b.c")
+                      if f.shape.contains(LAT, LON)}
+    assert len(inside) == (VECTOR_MIN + 4) // 2
+
+
+def test_grid_index_limits_candidates():
+    index = GridIndex(cell_size=0.01, max_cells=100)
+    small = [Geofence("owner", f"f{i}", Circle(LAT + i * 0.1, LON, 200))
+             for i in range(50)]
+    region = Geofence("owner", "region", Polygon(
+        [(40, -5), (40, 10), (52, 10), (52, -5)]))
+    for fence in small + [region]:
+        index.add(fence)
+
+    assert set(index.candidates(LAT, LON)) == {small[0].id, region.id}
+    assert set(index.candidates(LAT + 0.05, LON)) == {region.id}
+
+    index.remove(small[0])
+    assert set(index.candidates(LAT, LON)) == {region.id}
+
+
+def test_enter_and_exit_events():
+    engine = GeofenceEngine()
+    home = engine.add("a@b.c", "home", Circle(LAT, LON, 200))
+    engine.add("a@b.c", "depot", Circle(LAT, LON + 0.1, 200), vins=["VF2"])
+    engine.add("other@b.c", "theirs", Circle(LAT, LON, 200))
+
+    engine.record("a@b.c", "VF1", location(LAT, LON, 0))
+    engine.record("a@b.c", "VF1", location(LAT, LON, 0))  # same fix
+    engine.record("a@b.c", "VF1", location(LAT, LON + 0.1, 5))
+
+    status = engine.status("a@b.c", "VF1")
+    # The depot only applies to VF2, the other account's fence to no one
+    assert status["inside"] == []
+    assert [(e["type"], e["name"]) for e in status["events"]] == [
+        ("enter", "home"), ("exit", "home")]
+    assert engine.get_stats()["samples"] == 2
+
+    assert [f.name for f in engine.fences("A@b.c ")] == ["home", "depot"]
+    assert engine.remove("other@b.c", home.id) is None
+    assert engine.remove("a@b.c", home.id) is home
+
+
+def test_trips_are_split_on_stops():
+    engine = GeofenceEngine(move_threshold=100, stop_gap=600)
+    engine.record("a@b.c", "VF1", location(LAT, LON, 0))
+    engine.record("a@b.c", "VF1", location(LAT, LON + 0.0005, 2))  # noise
+    engine.record("a@b.c", "VF1", location(LAT + 0.01, LON, 5))
+    engine.record("a@b.c", "VF1", location(LAT + 0.02, LON, 10))
+    engine.record("a@b.c", "VF1", location(LAT + 0.02, LON, 25))  # parked
+    engine.record("a@b.c", "VF1", location(LAT + 0.03, LON, 40))
+
+    first, second = engine.trips("a@b.c", "VF1", now=1714550400 + 45 * 60)
+    assert first["start"] == 1714550400 + 2 * 60
+    assert first["end"] == 1714550400 + 10 * 60
+    assert first["distance"] == pytest.approx(2224, rel=0.01)
+    assert not first["ongoing"]
+    assert second["start"] == 1714550400 + 25 * 60
+    assert second["ongoing"]
+
+
+def test_geofences_persisted(tmp_path):
+    path = str(tmp_path / "geofences.json")
+    engine = GeofenceEngine(path=path)
+    engine.add("a@b.c", "home", Circle(LAT, LON, 200))
+    engine.add("a@b.c", "zone", Polygon([(0, 0), (0, 1), (1, 1)]), ["vf1"])
+    assert "a@b.c" not in open(path).read()
+
+    restored = GeofenceEngine(path=path)
+    assert [f.to_dict() for f in restored.fences("a@b.c")] == [
+        f.to_dict() for f in engine.fences("a@b.c")]
+    restored.record("a@b.c", "VF1", location(LAT, LON, 0))
+    assert restored.status("a@b.c", "VF1")["inside"][0]["name"] == "home"
@@ -0,0 +1,71 @@
+import asyncio
+import pytest
+from myrenault.governor import UpstreamGovernor, UpstreamBusyError
+
+
+def test_per_account_concurrency_is_bounded():
+    governor = UpstreamGovernor(per_account=2, rate=1000, burst=1000)
+    running = []
+    peak = []
+
+    async def call():
+        async with governor.slot("acc"):
+            running.append(1)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+
+    async def run():
+        await asyncio.gather(*(call() for _ in range(6)))
+
+    asyncio.run(run())
+    assert max(peak) == 2
+    assert governor.get_stats()["calls"] == 6
+
+
+def test_slots_are_shared_fairly_between_accounts():
+    governor = UpstreamGovernor(per_account=10, global_limit=1, rate=1000,
+                                burst=1000)
+    order = []
+
+    async def call(key):
+        async with governor.slot(key):
+            order.append(key)
+            await asyncio.sleep(0)
+
+    async def run():
+        await asyncio.gather(*(call("busy") for _ in range(5)),
+                             call("quiet"))
+
+    asyncio.run(run())
+    # The quiet account does not wait behind every call of the busy one
+    assert order.index("quiet") <= 2
+
+
+def test_calls_fail_fast_when_queue_wait_exceeds_limit():
+    governor = UpstreamGovernor(per_account=1, rate=1000, burst=1000,
+                                max_wait=0.02)
+
+    async def slow():
+        async with governor.slot("acc"):
+            await asyncio.sleep(0.1)
+
+    async def run():
+        return await asyncio.gather(slow(), slow(), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert isinstance(results[1], UpstreamBusyError)
+    assert governor.stats["rejected"] == 1
+
+
+def test_backoff_holds_back_the_account():
+    governor = UpstreamGovernor(max_wait=1)
+    governor.backoff("acc", 30)
+
+    async def run():
+        async with governor.slot("acc"):
+            pass
+
+    with pytest.raises(UpstreamBusyError) as exc:
+        asyncio.run(run())
+    assert exc.value.retry_after > 29
@@ -0,0 +1,41 @@
+from myrenault.history import HistoryStore, parse_timestamp
+
+
+def battery(level, timestamp):
+    return {"batteryLevel": level, "chargingStatus": 0.0,
+            "timestamp": timestamp}
+
+
+def test_samples_are_deduplicated_and_downsampled(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite3"))
+    store.record("battery", "VF1", battery(50, "2024-01-01T00:00:00Z"))
+    store.record("battery", "VF1", battery(50, "2024-01-01T00:00:00Z"))
+    store.record("battery", "VF1", battery(60, "2024-01-01T00:30:00Z"))
+    store.record("battery", "VF1", battery(70, "2024-01-01T01:10:00Z"))
+    store.record("battery", "VF2", battery(10, "2024-01-01T00:10:00Z"))
+    store.flush()
+
+    start = parse_timestamp("2024-01-01T00:00:00Z")
+    step, buckets = store.query("battery", "VF1", start, start + 7200, 3600)
+    store.close()
+
+    assert step == 3600
+    assert [b["count"] for b in buckets] == [2, 1]
+    assert buckets[0]["batteryLevel"] == {"min": 50, "max": 60, "avg": 55}
+    assert buckets[1]["time"] == start + 3600
+
+
+def test_step_is_widened_for_long_ranges(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite3"))
+    step, buckets = store.query("location", "VF1", 0, 86400 * 365, 60)
+    assert step * 2000 >= 86400 * 365
+    assert buckets == []
+
+
+def test_unchanged_mileage_is_not_stored(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite3"))
+    store.record("cockpit", "VF1", {"totalMileage": 100.0})
+    store.record("cockpit", "VF1", {"totalMileage": 100.0})
+    store.flush()
+    store.close()
+    assert store.stats["recorded"] == 1
@@ -0,0 +1,65 @@
+import asyncio
+from myrenault.jobs import JobQueue
+
+
+class FakeClient:
+    def __init__(self):
+        self.calls = []
+
+    async def charge_start(self, vin):
+        self.calls.append(("charge_start", vin))
+        await asyncio.sleep(0.01)
+        return {"action": "start"}
+
+    async def charge_stop(self, vin):
+        self.calls.append(("charge_stop", vin))
+        return {"action": "stop"}
+
+    async def hvac_start(self, vin, temp):
+        self.calls.append(("hvac_start", vin, temp))
+        return {"temp": temp}
+
+
+def make_queue(client, workers=2):
+    async def factory(email, password):
+        return client
+    return JobQueue(factory, workers=workers)
+
+
+def test_identical_actions_are_coalesced():
+    client = FakeClient()
+    jobs = make_queue(client)
+
+    async def run():
+        first = jobs.submit("a@b.c", "pw", "VF1", "charge_start")
+        second = jobs.submit("a@b.c", "pw", "vf1", "charge_start")
+        await first.wait_finished(1)
+        await jobs.close()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first is second
+    assert first.submissions == 2
+    assert first.status == "succeeded"
+    assert client.calls == [("charge_start", "VF1")]
+
+
+def test_conflicting_action_supersedes_queued_one():
+    client = FakeClient()
+    jobs = make_queue(client, workers=1)
+
+    async def run():
+        running = jobs.submit("a@b.c", "pw", "VF1", "hvac_start", (20,))
+        await asyncio.sleep(0)
+        queued = jobs.submit("a@b.c", "pw", "VF1", "charge_start")
+        latest = jobs.submit("a@b.c", "pw", "VF1", "charge_stop")
+        await latest.wait_finished(1)
+        await jobs.close()
+        return running, queued, latest
+
+    running, queued, latest = asyncio.run(run())
+    assert running.status == "succeeded"
+    assert queued.status == "superseded"
+    assert queued.superseded_by == latest.id
+    assert latest.status == "succeeded"
+    assert ("charge_start", "VF1") not in client.calls
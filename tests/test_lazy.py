@@ -0,0 +1,46 @@
+import os
+import sys
+import json
+import subprocess
+
+from myrenault.lazy import DEFERRED, lazy_import
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_lazy_module_runs_on_first_use(tmp_path, monkeypatch):
+    (tmp_path / "lazy_probe.py").write_text(
+        "import sys\nsys.lazy_probe_runs = getattr(sys, 'lazy_probe_runs', 0)"
+        " + 1\nVALUE = 42\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "lazy_probe", raising=False)
+    monkeypatch.setattr(sys, "lazy_probe_runs", 0, raising=False)
+
+    module = lazy_import("lazy_probe")
+    assert sys.lazy_probe_runs == 0
+    assert module.VALUE == 42
+    assert sys.lazy_probe_runs == 1
+    import lazy_probe
+    assert lazy_probe is module and lazy_import("lazy_probe") is module
+    assert sys.lazy_probe_runs == 1
+    sys.modules.pop("lazy_probe")
+
+
+def test_app_import_leaves_heavy_modules_for_later():
+    # A new interpreter, as when the container starts. Lazy modules are in
+    # sys.modules from the start, so check that they have not run yet:
+    # then their submodules are not imported either.
+    modules = sorted(set(DEFERRED) | {
+        "aiohttp.client", "renault_api.kamereon.models",
+        "renault_api.renault_client", "marshmallow"})
+    script = (
+        "import sys, json\n"
+        "import api\n"
+        "print(json.dumps({name: type(sys.modules[name]).__name__\n"
+        "                  for name in %r if name in sys.modules}))" % modules)
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=ROOT, capture_output=True,
+        text=True, check=True)
+    loaded = json.loads(result.stdout.splitlines()[-1])
+    assert {name: kind for name, kind in loaded.items()
+            if kind != "_LazyModule"} == {}
@@ -0,0 +1,95 @@
+import io
+import json
+import time
+import queue
+import logging
+import api
+from fastapi.testclient import TestClient
+from myrenault.logs import LogPipeline, REDACTED, _AsyncHandler, request_id
+
+logger = logging.getLogger("myrenault.tests")
+
+
+def run_pipeline(log, **options):
+    stream = io.StringIO()
+    pipeline = LogPipeline(level="DEBUG", stream=stream, **options)
+    pipeline.start()
+    try:
+        log()
+    finally:
+        pipeline.stop()
+    records = stream.getvalue().splitlines()
+    return pipeline, [json.loads(line) for line in records]
+
+
+def test_records_are_structured_and_redacted():
+    def log():
+        token = request_id.set("req-1")
+        try:
+            logger.debug("Location collected for %s", "VF1VIN", extra={
+                "reading": {"latitude": 48.85, "longitude": 2.35,
+                            "timestamp": "2024-01-01T00:00:00Z"}})
+            logger.info("Login of %s with %s", "user@example.com",
+                        {"password": "secret"})
+        finally:
+            request_id.reset(token)
+        logger.warning("Authorization: Bearer abc.def")
+
+    _, records = run_pipeline(log)
+    assert records[0]["message"] == "Location collected for VF1VIN"
+    assert records[0]["request_id"] == "req-1"
+    assert records[0]["reading"] == {
+        "latitude": REDACTED, "longitude": REDACTED,
+        "timestamp": "2024-01-01T00:00:00Z"}
+    assert "user@example.com" not in records[1]["message"]
+    assert "secret" not in records[1]["message"]
+    assert "abc.def" not in records[2]["message"]
+    assert "request_id" not in records[2]
+
+
+def test_frequent_messages_are_sampled():
+    def log():
+        for i in range(10):
+            logger.debug("Battery status collected for %s", i)
+        for i in range(3):
+            logger.warning("Upstream throttled %s", i)
+
+    pipeline, records = run_pipeline(log, sample_burst=2, sample_period=60)
+    messages = [r["message"] for r in records]
+    assert messages[:2] == ["Battery status collected for 0",
+                            "Battery status collected for 1"]
+    # Warnings are never sampled
+    assert len(messages) == 5
+    assert pipeline.get_stats()["sampled_out"] == 8
+    assert pipeline.get_stats()["queued"] == 5
+
+
+def test_sampled_out_count_is_reported_by_the_next_window():
+    def log():
+        for _ in range(5):
+            logger.debug("Polling")
+        time.sleep(0.06)
+        logger.debug("Polling")
+
+    _, records = run_pipeline(log, sample_burst=1, sample_period=0.05)
+    assert [r.get("sampled_out") for r in records] == [None, 4]
+
+
+def test_full_queue_drops_records():
+    stats = {"queued": 0, "dropped": 0}
+    handler = _AsyncHandler(queue.Queue(1), stats)
+    for i in range(3):
+        handler.handle(logger.makeRecord(
+            logger.name, logging.WARNING, __file__, 0, "Warning %s", (i,),
+            None))
+    assert stats == {"queued": 1, "dropped": 2}
+
+
+def test_request_id_is_returned():
+    client = TestClient(api.app)
+    response = client.get("/", headers={"X-Request-ID": "abc-123"})
+    assert response.headers["x-request-id"] == "abc-123"
+
+    generated = client.get("/").headers["x-request-id"]
+    assert len(generated) == 32
+    assert generated != client.get("/").headers["x-request-id"]
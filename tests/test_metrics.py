@@ -0,0 +1,37 @@
+from myrenault.metrics import Registry, stats_collector
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.histogram(
+        "latency_seconds", "Latency.", ("op",), buckets=(0.1, 1.0))
+    child = latency.labels("login")
+    child.observe(0.05)
+    child.observe(0.5)
+    child.observe(5)
+
+    body = registry.render()
+    assert 'latency_seconds_bucket{op="login",le="0.1"} 1' in body
+    assert 'latency_seconds_bucket{op="login",le="1"} 2' in body
+    assert 'latency_seconds_bucket{op="login",le="+Inf"} 3' in body
+    assert 'latency_seconds_count{op="login"} 3' in body
+    assert "# TYPE latency_seconds histogram" in body
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    errors = registry.counter("errors_total", "Errors.", ("message",))
+    errors.labels('say "hi"\n').inc()
+    assert 'errors_total{message="say \\"hi\\"\\n"} 1' in registry.render()
+
+
+def test_stats_collector_types_entries():
+    registry = Registry()
+    registry.add_collector(stats_collector(
+        "cache", lambda: {"size": 3, "hits": 7, "name": "x"}, ("size",)))
+    body = registry.render()
+    assert "# TYPE cache_size gauge" in body
+    assert "cache_size 3" in body
+    assert "# TYPE cache_hits_total counter" in body
+    assert "cache_hits_total 7" in body
+    assert "cache_name" not in body
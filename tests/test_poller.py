@@ -0,0 +1,64 @@
+import asyncio
+from myrenault.poller import TelemetryPoller
+
+
+class FakeClient:
+    def __init__(self, readings):
+        self.readings = readings
+        self.calls = 0
+
+    async def snapshot(self, vin, kinds, max_age=None):
+        self.calls += 1
+        battery = self.readings.pop(0) if self.readings else self.last
+        self.last = battery
+        return {"vin": vin, "battery": battery, "errors": {}}
+
+
+def make_poller(client, **kwargs):
+    async def factory(email, password):
+        return client
+    options = {"min_interval": 0.01, "fast_interval": 0.01,
+               "max_interval": 0.05}
+    options.update(kwargs)
+    return TelemetryPoller(factory, **options)
+
+
+def test_subscribers_share_one_poll_and_receive_deltas():
+    client = FakeClient([
+        {"batteryLevel": 50, "chargingStatus": 1.0},
+        {"batteryLevel": 51, "chargingStatus": 1.0},
+    ])
+    poller = make_poller(client)
+
+    async def run():
+        first = poller.subscribe("a@b.c", "pw", "vf1", ["battery"], 0.01)
+        second = poller.subscribe("a@b.c", "pw", "VF1", ["battery"], 0.01)
+        events = [await first.get(1), await first.get(1)]
+        other = [await second.get(1), await second.get(1)]
+        stats = poller.get_stats()
+        await poller.close()
+        return events, other, stats
+
+    events, other, stats = asyncio.run(run())
+    assert events[0]["data"] == {"batteryLevel": 50, "chargingStatus": 1.0}
+    assert events[1]["data"] == {"batteryLevel": 51}
+    assert other == events
+    assert stats["watches"] == 1
+    assert stats["subscribers"] == 2
+
+
+def test_interval_backs_off_while_parked():
+    client = FakeClient([{"batteryLevel": 80, "chargingStatus": 0.0}])
+    poller = make_poller(client, min_interval=0.01, max_interval=0.08)
+
+    async def run():
+        sub = poller.subscribe("a@b.c", "pw", "VF1", ["battery"], 0.01)
+        await sub.get(1)
+        await asyncio.sleep(0.2)
+        poller.unsubscribe(sub)
+        return poller.get_stats()
+
+    stats = asyncio.run(run())
+    # Without backoff, 0.2s at 0.01s intervals would take ~20 polls
+    assert stats["polls"] < 8
+    assert stats["watches"] == 0
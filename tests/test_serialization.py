@@ -0,0 +1,114 @@
+import json
+from typing import Optional
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import Response, StreamingResponse
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+from myrenault import compression, serialization
+from myrenault.compression import CompressionMiddleware, negotiate
+from myrenault.serialization import dumps, serializer
+from myrenault.telemetry import BatteryReading
+
+
+class Level(BaseModel):
+    level: Optional[int] = None
+
+
+class Body(BaseModel):
+    vin: str
+    battery: Optional[Level] = None
+    errors: dict[str, str] = {}
+    tags: list[str] = []
+
+
+def test_serializer_keeps_the_model_fields():
+    encode = serializer(list[Body])
+    body = [{"vin": "VF1", "battery": {"level": 80, "extra": 1},
+             "secret": "x"}, {"vin": "VF2", "battery": None}]
+    assert json.loads(encode(body)) == [
+        {"vin": "VF1", "battery": {"level": 80}, "errors": {}, "tags": []},
+        {"vin": "VF2", "battery": None, "errors": {}, "tags": []}]
+
+
+def test_serializer_converts_numbers_to_the_field_types():
+    class Power(BaseModel):
+        level: Optional[int] = None
+        power: float = 0
+
+    encode = serializer(Power)
+    assert encode({"level": 80.0, "power": 7}) == b'{"level":80,"power":7.0}'
+    assert encode({"level": None}) == b'{"level":null,"power":0.0}'
+
+
+def test_dumps_without_orjson(monkeypatch):
+    value = {"vin": "VF1", "battery": BatteryReading(batteryLevel=80),
+             "name": "Zoé"}
+    fast = dumps(value)
+    monkeypatch.setattr(serialization, "orjson", None)
+    assert dumps(value) == fast
+    assert json.loads(fast)["battery"]["batteryLevel"] == 80
+
+
+def create_app(**options):
+    app = FastAPI()
+    big = [{"vin": f"VF{i}", "model": "ZOE"} for i in range(200)]
+
+    @app.get("/big")
+    async def get_big():
+        return Response(dumps(big), media_type="application/json")
+
+    @app.get("/small")
+    async def get_small():
+        return {"vin": "VF1"}
+
+    @app.get("/stream")
+    async def get_stream():
+        async def lines():
+            for vehicle in big:
+                yield dumps(vehicle) + b"\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    @app.get("/other")
+    async def get_other():
+        return Response(dumps(big), media_type="application/json")
+
+    app.add_middleware(
+        CompressionMiddleware, paths=("/big", "/small", "/stream"),
+        **options)
+    return TestClient(app), big
+
+
+def test_large_bodies_are_gzipped():
+    client, big = create_app(encodings=("gzip",))
+    response = client.get("/big", headers={"accept-encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < len(dumps(big)) / 4
+    assert response.json() == big
+
+    streamed = client.get("/stream", headers={"accept-encoding": "gzip"})
+    assert streamed.headers["content-encoding"] == "gzip"
+    assert [json.loads(line) for line in streamed.text.splitlines()] == big
+
+    for path, headers in (("/small", {"accept-encoding": "gzip"}),
+                          ("/other", {"accept-encoding": "gzip"}),
+                          ("/big", {"accept-encoding": "identity"})):
+        response = client.get(path, headers=headers)
+        assert "content-encoding" not in response.headers
+
+
+@pytest.mark.skipif(compression.brotli is None,
+                    reason="brotli is not installed")
+def test_brotli_is_preferred():
+    client, big = create_app(encodings=("br", "gzip"))
+    response = client.get("/big", headers={"accept-encoding": "gzip, br"})
+    assert response.headers["content-encoding"] == "br"
+    assert response.json() == big
+
+
+def test_negotiation_honours_quality():
+    assert negotiate("gzip, br", ("br", "gzip")) == "br"
+    assert negotiate("gzip, br;q=0", ("br", "gzip")) == "gzip"
+    assert negotiate("*", ("gzip",)) == "gzip"
+    assert negotiate("identity", ("br", "gzip")) is None
@@ -0,0 +1,45 @@
+import asyncio
+from myrenault.singleflight import SingleFlight
+
+
+def test_concurrent_calls_are_coalesced():
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch(vin):
+        calls.append(vin)
+        await asyncio.sleep(0.01)
+        return {"vin": vin}
+
+    async def run():
+        return await asyncio.gather(
+            *(flight.do(("acc", "VF1", "battery"), fetch, "VF1")
+              for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert results == [{"vin": "VF1"}] * 5
+    assert calls == ["VF1"]
+    assert flight.stats["calls_coalesced"] == 4
+    assert len(flight) == 0
+
+
+def test_errors_are_shared_and_not_kept():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0)
+        raise RuntimeError("upstream down")
+
+    async def run():
+        return await asyncio.gather(
+            flight.do("key", fail), flight.do("key", fail),
+            return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert len(flight) == 0
+
+    async def ok():
+        return 1
+
+    assert asyncio.run(flight.do("key", ok)) == 1
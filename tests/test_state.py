@@ -0,0 +1,159 @@
+import asyncio
+import aiohttp
+import pytest
+from benchmarks.fake_renault import FakeRenault
+from myrenault.cache import ResponseCache
+from myrenault.client import MyRenaultClient
+from myrenault.pool import SessionPool
+from myrenault.secretbox import SecretBox
+from myrenault.singleflight import SingleFlight
+from myrenault.state import MemoryBackend, SQLiteBackend, open_state
+from myrenault.tokens import TokenStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend()
+    return SQLiteBackend(str(tmp_path / "state.db"))
+
+
+def test_values_expire(backend):
+    async def run():
+        await backend.set("readings", "a", {"batteryLevel": 80})
+        await backend.set("readings", "b", [1, 2], ttl=0.05)
+        assert await backend.get("readings", "a") == {"batteryLevel": 80}
+        assert await backend.get("readings", "b") == [1, 2]
+        assert await backend.get("vins", "a") is None
+        await asyncio.sleep(0.06)
+        assert await backend.get("readings", "b") is None
+        await backend.delete("readings", "a")
+        assert await backend.get("readings", "a") is None
+        await backend.close()
+
+    asyncio.run(run())
+
+
+def test_reserve_is_a_token_bucket(backend):
+    async def run():
+        waits = [await backend.reserve("acct", rate=10, burst=2)
+                 for _ in range(4)]
+        assert waits[:2] == [0.0, 0.0]
+        assert waits[2] == pytest.approx(0.1, abs=0.01)
+        assert waits[3] == pytest.approx(0.2, abs=0.01)
+        # Tokens given back make the next call wait less
+        await backend.reserve("acct", rate=10, burst=2, tokens=-2)
+        assert await backend.reserve("acct", rate=10, burst=2) == (
+            pytest.approx(0.1, abs=0.01))
+        await backend.close()
+
+    asyncio.run(run())
+
+
+def test_lock_is_exclusive_across_workers(tmp_path):
+    path = str(tmp_path / "state.db")
+    workers = [SQLiteBackend(path) for _ in range(3)]
+    holders = []
+
+    async def hold(backend):
+        async with backend.lock("login:acct") as acquired:
+            assert acquired
+            holders.append(backend)
+            assert len(holders) == 1
+            await asyncio.sleep(0.02)
+            holders.remove(backend)
+
+    async def run():
+        await asyncio.gather(*(hold(w) for w in workers))
+        # A lease that ran out is taken over
+        async with workers[0].lock("abandoned", lease=0.01):
+            await asyncio.sleep(0.02)
+            async with workers[1].lock("abandoned", timeout=1) as acquired:
+                assert acquired
+        async with workers[0].lock("held"):
+            async with workers[1].lock("held", timeout=0.05) as acquired:
+                assert not acquired
+
+    asyncio.run(run())
+    assert sum(w.stats["lock_waits"] for w in workers) >= 2
+    assert workers[1].stats["lock_timeouts"] == 1
+
+
+def test_open_state_urls(tmp_path):
+    assert isinstance(open_state("memory://"), MemoryBackend)
+    backend = open_state(f"sqlite:///{tmp_path}/state.db")
+    assert backend.path == f"{tmp_path}/state.db"
+    with pytest.raises(ValueError):
+        open_state("ftp://example.com")
+
+
+def test_workers_share_logins_and_readings(tmp_path, monkeypatch):
+    """Workers with their own pool and cache log in and read only once."""
+    path = str(tmp_path / "state.db")
+
+    async def run():
+        fake = await FakeRenault(latency=0.02, seed=1).start()
+        for name, value in fake.locale_env().items():
+            monkeypatch.setenv(name, value)
+        vin = fake.account_vins("shared@example.com", "password")[0]
+        workers = [
+            (SQLiteBackend(path), SessionPool(), ResponseCache(),
+             SingleFlight(), aiohttp.ClientSession())
+            for _ in range(3)
+        ]
+
+        async def read(worker):
+            state, pool, cache, inflight, websession = worker
+            client = MyRenaultClient(
+                "shared@example.com", "password", websession=websession,
+                pool=pool, cache=cache, inflight=inflight, state=state)
+            return await client.read("battery", vin)
+
+        try:
+            results = await asyncio.gather(
+                *(read(w) for w in workers for _ in range(4)))
+        finally:
+            await fake.close()
+            for state, *_, websession in workers:
+                await state.close()
+                await websession.close()
+        return fake, results
+
+    fake, results = asyncio.run(run())
+    assert fake.calls["/accounts.login"] == 1
+    assert sum(n for name, n in fake.calls.items()
+               if name.endswith("/battery-status")) == 1
+    assert len({r.value["batteryLevel"] for r in results}) == 1
+    # Readers of the other two workers got the reading through the state
+    assert sum(r.from_cache for r in results) == 8
+
+
+def test_shared_tokens_need_a_secret_key():
+    with pytest.raises(ValueError):
+        TokenStore(state=MemoryBackend())
+
+
+def test_tokens_are_valid_on_every_worker():
+    pytest.importorskip("cryptography")
+    state = MemoryBackend()
+    first = TokenStore(state=state, recheck=0, box=SecretBox("key"))
+    second = TokenStore(state=state, recheck=0, box=SecretBox("key"))
+
+    async def run():
+        token, session = first.issue("token@example.com", "password12")
+        await first.save(token, session)
+        # The shared record does not reveal the password
+        assert all("password12" not in value
+                   for value, _ in state._values.values())
+        assert (await second.load(token)).credentials == (
+            "token@example.com", "password12")
+
+        # Another key cannot read it
+        other = TokenStore(state=state, box=SecretBox("other key"))
+        assert await other.load(token) is None
+
+        assert await first.discard(token)
+        assert await second.load(token) is None
+        assert not await second.discard(token)
+
+    asyncio.run(run())
@@ -0,0 +1,99 @@
+import sys
+import json
+import random
+from myrenault.history import HistoryStore
+from myrenault.telemetry import (BatteryReading, LocationReading, SampleRing,
+                                 SampleStore, to_reading)
+
+
+def battery(level, timestamp, power=None):
+    return {"batteryLevel": level, "chargingStatus": 0.0,
+            "chargingInstantaneousPower": power, "timestamp": timestamp}
+
+
+def test_readings_are_compact_read_only_mappings():
+    data = {"batteryLevel": 80, "batteryAutonomy": 250, "chargingStatus": 0.0,
+            "plugStatus": 1, "batteryTemperature": 20,
+            "chargingInstantaneousPower": 0.0,
+            "timestamp": "2024-01-01T00:00:00Z"}
+    reading = to_reading("battery", data)
+    assert isinstance(reading, BatteryReading)
+    assert to_reading("battery", reading) is reading
+    assert reading == data and dict(reading) == data
+    assert reading.get("batteryLevel") == 80
+    assert reading.get("latitude") is None
+    assert not hasattr(reading, "__dict__")
+    assert sys.getsizeof(reading) < sys.getsizeof(data) / 2
+    assert json.loads(reading.body()) == data
+    assert reading.body() is reading.body()
+
+
+def test_ring_keeps_the_last_samples():
+    ring = SampleRing(("latitude", "longitude"), capacity=3)
+    points = [(1000 + i * 60, (48.8 + i / 1000, 2.3 - i / 1000))
+              for i in range(5)]
+    for ts, values in points:
+        ring.append(ts, values)
+    assert len(ring) == 3
+    assert [ts for ts, _ in ring] == [1120, 1180, 1240]
+    for (_, got), (_, expected) in zip(ring, points[2:]):
+        assert got == tuple(round(v, 6) for v in expected)
+
+
+def test_ring_handles_missing_values_and_large_jumps():
+    ring = SampleRing(("batteryLevel", "totalMileage"), capacity=4)
+    ring.append(10, (50, None))
+    ring.append(20, (None, 100.5))
+    ring.append(30, (52, 101.0))
+    assert list(ring) == [(10, (50.0, None)), (20, (None, 100.5)),
+                          (30, (52.0, 101.0))]
+
+    # Too large a delta for 32 bits: the ring restarts from the sample
+    ring.append(40, (53, 10.0**7))
+    assert list(ring) == [(40, (53.0, 10.0**7))]
+
+
+def test_store_matches_history_queries(tmp_path):
+    history = HistoryStore(str(tmp_path / "history.sqlite3"))
+    samples = SampleStore(capacity=1000)
+    rng = random.Random(1)
+    for i in range(300):
+        ts = f"2024-01-01T{i // 60:02d}:{i % 60:02d}:00Z"
+        data = battery(rng.randint(0, 100), ts,
+                       rng.choice([None, rng.random() * 11]))
+        for store in (history, samples):
+            store.record("battery", "VF1", data)
+            store.record("battery", "VF1", data)  # Deduplicated
+    history.flush()
+
+    start = 1704067200  # 2024-01-01T00:00:00Z
+    for step in (60, 900, 3600):
+        expected = history.query("battery", "VF1", start, start + 7200, step)
+        got = samples.query("battery", "VF1", start, start + 7200, step)
+        assert got[0] == expected[0]
+        assert [b["count"] for b in got[1]] == [
+            b["count"] for b in expected[1]]
+        for bucket, other in zip(got[1], expected[1]):
+            for field in ("batteryLevel", "chargingInstantaneousPower"):
+                for stat in ("min", "max", "avg"):
+                    if other[field][stat] is None:
+                        assert bucket[field][stat] is None
+                    else:
+                        assert abs(bucket[field][stat]
+                                   - other[field][stat]) < 1e-3
+    history.close()
+    assert samples.stats["recorded"] == 300
+
+
+def test_store_is_bounded():
+    samples = SampleStore(capacity=2, max_series=2)
+    for vin in ("VF1", "VF2", "VF3"):
+        for minute in range(3):
+            samples.record("location", vin, LocationReading(
+                latitude=48.0, longitude=2.0,
+                timestamp=f"2024-01-01T00:0{minute}:00Z"))
+    samples.record("cockpit", "VF3", {"totalMileage": 100.0})
+    samples.record("cockpit", "VF3", {"totalMileage": 100.0})
+    assert samples.get_stats()["series"] == 2
+    assert samples.get_stats()["samples"] == 3
+    assert samples.samples("location", "VF1") == []
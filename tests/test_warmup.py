@@ -0,0 +1,118 @@
+import time
+import asyncio
+import aiohttp
+from benchmarks.fake_renault import FakeRenault
+from myrenault.cache import ResponseCache
+from myrenault.client import MyRenaultClient
+from myrenault.pool import SessionPool, credentials_key
+from myrenault.vin_index import VinIndex
+from myrenault.warmup import SessionWarmer
+
+EMAIL = "warm@example.com"
+
+
+def run_with_fake(monkeypatch, scenario, **warmer_options):
+    """
+    Runs `scenario(fake, warmer, create_client)` against the fake server,
+    with a warmer sharing the pool, cache and VIN index of the clients.
+    """
+    async def run():
+        fake = await FakeRenault(latency=0, vehicles=2, seed=1).start()
+        for name, value in fake.locale_env().items():
+            monkeypatch.setenv(name, value)
+        websession = aiohttp.ClientSession()
+        pool, cache, vin_index = SessionPool(), ResponseCache(), VinIndex()
+
+        async def create_client(email, password):
+            return MyRenaultClient(
+                email, password, websession=websession, pool=pool,
+                cache=cache, vin_index=vin_index)
+
+        warmer = SessionWarmer(create_client, **warmer_options)
+        try:
+            return await scenario(fake, warmer, create_client)
+        finally:
+            await warmer.close()
+            await websession.close()
+            await fake.close()
+
+    return asyncio.run(run())
+
+
+def test_configured_account_is_warm_before_first_request(monkeypatch):
+    async def scenario(fake, warmer, create_client):
+        warmer.add(EMAIL, "password")
+        for account in warmer._accounts.values():
+            account.due = 0
+        await warmer.run_due()
+        assert warmer.stats["warmups"] == 1
+
+        fake.calls.clear()
+        vin = fake.account_vins(EMAIL, "password")[1]
+        client = await create_client(EMAIL, "password")
+        await client.read("battery", vin)
+        return fake.calls
+
+    calls = run_with_fake(monkeypatch, scenario)
+    # No login, token or vehicle lookup left for the user request
+    assert list(calls) == [
+        "/commerce/v1/accounts/{account_id}/kamereon/kca/car-adapter"
+        "/v{version}/cars/{vin}/battery-status"]
+
+
+def test_tokens_refreshed_before_expiry(monkeypatch):
+    async def scenario(fake, warmer, create_client):
+        warmer.add(EMAIL, "password")
+        for _ in range(2):
+            for account in warmer._accounts.values():
+                account.due = 0
+            await warmer.run_due()
+        return fake.calls
+
+    # The fake JWTs live 900 s: with a larger margin, every round refreshes
+    calls = run_with_fake(monkeypatch, scenario, refresh_margin=1000)
+    assert calls["/accounts.login"] == 1
+    assert calls["/accounts.getJWT"] == 2
+
+
+def test_idle_accounts_stop_being_warmed(monkeypatch):
+    async def scenario(fake, warmer, create_client):
+        warmer.add("pinned@example.com", "password")
+        warmer.touch(EMAIL, "password")
+        for account in warmer._accounts.values():
+            account.last_active -= 10
+        await warmer.run_due()
+        return warmer
+
+    warmer = run_with_fake(monkeypatch, scenario, active_ttl=5)
+    assert list(warmer._accounts) == [
+        credentials_key("pinned@example.com", "password")]
+
+
+def test_failing_account_backs_off(monkeypatch):
+    async def scenario(fake, warmer, create_client):
+        warmer.add(EMAIL, "wrong")
+        account = next(iter(warmer._accounts.values()))
+        account.due = 0
+        await warmer.run_due()
+        return account
+
+    account = run_with_fake(monkeypatch, scenario, interval=30)
+    assert account.failures == 1
+    assert account.due - time.monotonic() > 30
+
+
+def test_token_refresh_logs_in_again_without_session_internals(
+        monkeypatch):
+    # A renault-api version without the private JWT methods
+    monkeypatch.setattr(
+        "myrenault.client.supports_token_refresh", lambda client: False)
+
+    async def scenario(fake, warmer, create_client):
+        client = await create_client(EMAIL, "password")
+        await client.refresh_token()
+        return fake.calls
+
+    calls = run_with_fake(monkeypatch, scenario)
+    assert calls["/accounts.login"] == 2
+    assert "/accounts.getJWT" not in calls